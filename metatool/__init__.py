@@ -6,6 +6,20 @@ with the MetaDisk service through the "curl" terminal command, described
 at the http://node2.metadisk.org/ page, but have some future, like walking
 through several **Nodes** looking for a file, or generating GET HTTP request
 string to download file through browser for example.
+
+The ``core`` and ``cli`` submodules are imported on the first access to them
+(on Python 3.7+), so the package's import doesn't load the dependencies of
+the actions which aren't used.
 """
+import sys
+
+if sys.version_info[:2] >= (3, 7):
+    import importlib
 
-from . import core, cli
\ No newline at end of file
+    def __getattr__(name):
+        if name in ('core', 'cli'):
+            return importlib.import_module('.' + name, __name__)
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+else:
+    from . import core, cli
@@ -0,0 +1,619 @@
+"""
+This module is the ``asyncio`` counterpart of the MetaTool API, based on
+the aiohttp_ library (``pip install metatool[aio]``). It requires
+Python 3.6 or newer.
+
+``AsyncMetaToolClient`` provides the same operations as the
+``metatool.core`` - ``audit``, ``download``, ``upload``, ``files`` and
+``info`` - with the same arguments and the same types of returned values,
+but as coroutines. The requests are limited by the same timeouts and
+retried by the same ``metatool.retry.RetryPolicy``. Bodies of the uploaded
+and downloaded files are streamed by chunks, and the number of requests in
+flight is bounded by the ``max_concurrency`` argument, so one event loop
+can serve hundreds of transfers without a thread per transfer::
+
+    async def upload_all(paths, sender_key, btctx_api):
+        async with AsyncMetaToolClient(max_concurrency=100) as client:
+            return await asyncio.gather(*[
+                client.upload(url_base, sender_key, btctx_api,
+                              open(path, 'rb'), '001')
+                for path in paths
+            ])
+
+.. _aiohttp: https://pypi.python.org/pypi/aiohttp
+"""
+import asyncio
+import binascii
+import os
+import os.path
+from hashlib import sha256
+from urllib.parse import urljoin
+
+import aiohttp
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from metatool.core import (download_link, add_decryption_key, dedup_response,
+                           DownloadError, DEFAULT_POOL_MAXSIZE,
+                           DEFAULT_TIMEOUT, PART_SUFFIX, _is_sha256_hex,
+                           _limit_timeout)
+from metatool.hashing import sha256_file, HASH_BLOCK_SIZE
+from metatool.multipart import MultipartEncoder
+from metatool.encryption import (StreamCipher, EncryptingReader,
+                                 convergent_key)
+from metatool.upload_index import UploadIndex, file_identity, open_index
+from metatool.files_cache import FilesCache
+from metatool.signer import SignerRegistry, DEFAULT_CACHE_SIZE
+from metatool.retry import RetryPolicy
+from metatool.state import replace_file
+
+#: Default max number of the requests performed by the client at once.
+DEFAULT_MAX_CONCURRENCY = 64
+
+
+def _header_value(value):
+    """
+    Convert the header value to the string, since ``btctxstore`` may
+    return signatures as bytes.
+    """
+    if isinstance(value, bytes):
+        return value.decode('ascii')
+    return value
+
+
+def _is_retryable(policy, idempotent, response=None, error=None):
+    """
+    Check whether the request should be retried after the result, like the
+    ``metatool.retry.RetryPolicy.is_retryable()`` does, but with the
+    aiohttp responses and errors.
+
+    :param policy: the retry policy
+    :type policy: metatool.retry.RetryPolicy object
+
+    :param idempotent: whether the request can be repeated safely
+    :type idempotent: boolean
+
+    :param response: response to the request
+    :type response: aiohttp.ClientResponse object
+
+    :param error: exception raised by the request
+    :type error: Exception
+
+    :returns: ``True`` if the request should be retried
+    :rtype: boolean
+    """
+    if error is not None:
+        if idempotent:
+            exceptions = policy.exceptions or (
+                aiohttp.ClientConnectionError, asyncio.TimeoutError)
+        else:
+            exceptions = policy.safe_exceptions or (
+                aiohttp.ClientConnectorError,)
+        return isinstance(error, exceptions)
+    statuses = policy.statuses if idempotent else policy.safe_statuses
+    return response.status in statuses
+
+
+async def _stream_body(body):
+    """
+    Stream the ``metatool.multipart.MultipartEncoder`` body from the
+    beginning. The file's blocks are read (and encrypted) in the default
+    executor of the loop, so they don't block the other transfers.
+    """
+    loop = asyncio.get_event_loop()
+    chunks = iter(body)
+    while True:
+        chunk = await loop.run_in_executor(None, next, chunks, None)
+        if chunk is None:
+            break
+        yield chunk
+
+
+async def _to_response(client_response):
+    """
+    Read the body of the aiohttp response and wrap it into the
+    ``requests`` response object, like the ones returned by the
+    ``metatool.core`` functions.
+
+    :param client_response: not yet read aiohttp response
+    :type client_response: aiohttp.ClientResponse object
+
+    :returns: response with the read content
+    :rtype: requests.models.Response object
+    """
+    response = Response()
+    response.status_code = client_response.status
+    response.reason = client_response.reason
+    response.url = str(client_response.url)
+    response.headers = CaseInsensitiveDict(client_response.headers)
+    response.encoding = client_response.charset
+    response._content = await client_response.read()
+    return response
+
+
+class _PartWriter(object):
+    """
+    Writer of the downloaded body to the partial file next to the
+    ``file_name``. Its methods are called in the executor of the loop, so
+    the disk writes, the decryption and the hashing don't block the other
+    transfers. The complete file is checked like the
+    ``metatool.core.MetaToolClient.download()`` does, and only then renamed
+    into place, the partial file of the failed download is removed.
+    """
+
+    def __init__(self, file_name, file_hash, decryption_key=None):
+        self.file_name = file_name
+        self.part_name = file_name + PART_SUFFIX
+        self.file_hash = file_hash
+        self.data_hash = sha256() if _is_sha256_hex(file_hash) else None
+        self.cipher = StreamCipher(binascii.unhexlify(decryption_key)) \
+            if decryption_key else None
+        self.size = 0
+        self._fp = None
+
+    def open(self):
+        """
+        Create the partial file, and the directory of the file if needed.
+        """
+        download_dir = os.path.dirname(self.file_name)
+        if download_dir and not os.path.exists(download_dir):
+            os.makedirs(download_dir)
+        self._fp = open(self.part_name, 'wb')
+
+    def write(self, chunk):
+        """
+        Hash the received chunk and write it, decrypted when needed.
+        """
+        if self.data_hash:
+            self.data_hash.update(chunk)
+        self.size += len(chunk)
+        self._fp.write(self.cipher.transform(chunk) if self.cipher else chunk)
+
+    def finish(self, expected_size):
+        """
+        Check the complete file and rename it into place.
+
+        :raises DownloadError: if the file is incomplete or corrupted
+        """
+        self._fp.close()
+        if expected_size is not None and self.size != expected_size:
+            raise DownloadError(
+                'incomplete download of {}: {} of {} bytes received'.format(
+                    self.file_hash, self.size, expected_size))
+        if self.data_hash and \
+                self.data_hash.hexdigest() != self.file_hash.lower():
+            raise DownloadError(
+                'downloaded data of {} has the wrong SHA-256 hash {}'.format(
+                    self.file_hash, self.data_hash.hexdigest()))
+        replace_file(self.part_name, self.file_name)
+
+    def discard(self):
+        """
+        Remove the partial file of the failed download.
+        """
+        if self._fp is not None:
+            self._fp.close()
+            if os.path.exists(self.part_name):
+                os.remove(self.part_name)
+
+
+class AsyncMetaToolClient(object):
+    """
+    Asynchronous client of the MetaCore nodes. It owns the
+    ``aiohttp.ClientSession`` with a pool of kept-alive connections and
+    bounds the number of the concurrently performed operations.
+
+    The client must be created, used and closed within the same running
+    event loop, preferably as the asynchronous context manager.
+
+    :param max_concurrency: max number of the operations in flight, others
+        are waiting for their turn
+
+        (optional, default: ``DEFAULT_MAX_CONCURRENCY``)
+    :type max_concurrency: integer
+
+    :param limit_per_host: max number of the connections to a single node
+
+        (optional, default: ``metatool.core.DEFAULT_POOL_MAXSIZE``)
+    :type limit_per_host: integer
+
+    :param headers: headers added to every request made by the client
+
+        (optional, default: None)
+    :type headers: dictionary
+
+    :param chunk_size: size of the chunks (in bytes) of the streamed bodies
+
+        (optional, default: ``metatool.hashing.HASH_BLOCK_SIZE``)
+    :type chunk_size: integer
+
+    :param files_cache: cache of the nodes' lists of files, look at the
+        ``metatool.core.MetaToolClient``
+
+        (optional, default: True)
+    :type files_cache: metatool.files_cache.FilesCache object or boolean
+
+    :param signer_cache_size: max number of the addresses and signatures
+        cached per ``btctx_api`` instance, look at the
+        ``metatool.core.MetaToolClient``
+
+        (optional, default: ``metatool.signer.DEFAULT_CACHE_SIZE``)
+    :type signer_cache_size: integer
+
+    :param timeout: the ``(connect, read)`` timeouts of the requests in
+        seconds, the single timeout for both, or ``None`` to wait forever,
+        look at the ``metatool.core.MetaToolClient``
+
+        (optional, default: ``metatool.core.DEFAULT_TIMEOUT``)
+    :type timeout: tuple or number
+
+    :param retry: policy of retrying the failed requests, look at the
+        ``metatool.core.MetaToolClient``. Unless the policy sets its own
+        ``exceptions``, the aiohttp connection errors and the timeouts are
+        retried.
+
+        (optional, default: True)
+    :type retry: metatool.retry.RetryPolicy object or boolean
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 limit_per_host=DEFAULT_POOL_MAXSIZE, headers=None,
+                 chunk_size=HASH_BLOCK_SIZE, files_cache=True,
+                 signer_cache_size=DEFAULT_CACHE_SIZE,
+                 timeout=DEFAULT_TIMEOUT, retry=True):
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.headers = dict(headers or {})
+        self.chunk_size = chunk_size
+        if files_cache is True:
+            files_cache = FilesCache()
+        self.files_cache = files_cache or None
+        self.signers = SignerRegistry(signer_cache_size)
+        self.timeout = timeout
+        self.retry = RetryPolicy() if retry is True else retry or None
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._ensure_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def _ensure_session(self):
+        """
+        Create the session and the concurrency semaphore on the first use,
+        within the running event loop.
+        """
+        if self._session is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=0, limit_per_host=self.limit_per_host),
+                headers=self.headers,
+                timeout=self._client_timeout(None),
+            )
+        return self._session
+
+    def _client_timeout(self, budget):
+        """
+        Build the timeouts of the request from the client's ``timeout``,
+        limited by the time ``budget`` of the operation, like the
+        ``metatool.core.MetaToolClient`` does.
+
+        :param budget: seconds left of the operation's budget, or ``None``
+        :type budget: number
+
+        :returns: the timeouts of the request
+        :rtype: aiohttp.ClientTimeout object
+        :raises asyncio.TimeoutError: if the budget is already over
+        """
+        timeout = self.timeout
+        if budget is not None:
+            if budget <= 0:
+                raise asyncio.TimeoutError(
+                    'time budget of the operation is over')
+            timeout = _limit_timeout(timeout, budget)
+        connect_timeout, read_timeout = \
+            timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        return aiohttp.ClientTimeout(total=budget,
+                                     sock_connect=connect_timeout,
+                                     sock_read=read_timeout)
+
+    async def close(self):
+        """
+        Close all connections kept by the client's session.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _auth_headers(self, sender_key, btctx_api, data_hash):
+        """
+        Generate the credential headers for the request about the file.
+        The address and the signature are cached by the client's
+        ``signers``.
+
+        :returns: dictionary with the "sender-address" and "signature"
+        :rtype: dictionary
+        """
+        signer = self.signers.get(btctx_api)
+        return {
+            'sender-address': _header_value(
+                signer.get_address(sender_key)),
+            'signature': _header_value(
+                signer.sign_unicode(sender_key, data_hash)),
+        }
+
+    async def _send(self, method, url, timeout=None, idempotent=True,
+                    body=None, **kwargs):
+        """
+        Send the request with the session, retrying it by the client's
+        ``retry`` policy, and return the response with the not yet read
+        body. The caller must hold the slot of the client's semaphore.
+
+        :param method: HTTP method of the request, i.e. 'GET'
+        :type method: string
+
+        :param url: URL-string of the request
+        :type url: string
+
+        :param timeout: time budget of the request with the retries
+
+        :param idempotent: whether the request can be repeated safely
+
+        :param body: body of the request, which is streamed from the
+            beginning for every attempt
+        :type body: metatool.multipart.MultipartEncoder object
+
+        :param kwargs: other arguments of the session's request
+
+        :returns: response of the last attempt
+        :rtype: aiohttp.ClientResponse object
+        :raises: the error of the last attempt
+        """
+        loop = asyncio.get_event_loop()
+        session = self._ensure_session()
+        expires_at = None if timeout is None else loop.time() + timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            response, error = None, None
+            budget = None if expires_at is None else expires_at - loop.time()
+            if body is not None:
+                kwargs['data'] = _stream_body(body)
+            try:
+                response = await session.request(
+                    method, url, timeout=self._client_timeout(budget),
+                    **kwargs)
+            except Exception as exc:
+                error = exc
+            if self.retry is None or attempt >= self.retry.max_attempts or \
+                    not _is_retryable(self.retry, idempotent, response,
+                                      error):
+                break
+            delay = self.retry.delay(attempt, response)
+            if expires_at is not None and \
+                    loop.time() + delay >= expires_at:
+                break
+            if response is not None:
+                # release the connection of the discarded response
+                response.release()
+            await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return response
+
+    async def _request(self, method, url, timeout=None, idempotent=True,
+                       **kwargs):
+        """
+        Perform the request, waiting for the free slot, and return the
+        read response. Look at the ``_send()`` for the arguments.
+
+        :returns: response with the read content
+        :rtype: requests.models.Response object
+        """
+        self._ensure_session()
+        async with self._semaphore:
+            response = await self._send(method, url, timeout, idempotent,
+                                        **kwargs)
+            async with response:
+                return await _to_response(response)
+
+    async def audit(self, url_base, sender_key, btctx_api, file_hash, seed,
+                    timeout=None):
+        """
+        Perform the ``audit`` request. Look at the ``metatool.core.audit()``
+        for the arguments specification.
+        """
+        # the audit doesn't change the node's state
+        return await self._request(
+            'POST',
+            urljoin(url_base, '/api/audit/'),
+            timeout,
+            data={
+                'data_hash': file_hash,
+                'challenge_seed': seed,
+            },
+            headers=self._auth_headers(sender_key, btctx_api, file_hash)
+        )
+
+    async def download(self, url_base, file_hash, sender_key=None,
+                       btctx_api=None, rename_file=None, decryption_key=None,
+                       link=False, timeout=None):
+        """
+        Perform the ``download`` operation, writing the file (decrypted,
+        when the ``decryption_key`` is given) by chunks as they arrive.
+        Look at the ``metatool.core.download()`` for the
+        arguments specification. The chunks are written in the default
+        executor of the loop to the partial file, which is checked against
+        the size and the SHA-256 ``file_hash`` and then renamed into place.
+        The broken download isn't resumed, it's partial file is removed.
+        The ``timeout`` limits the whole download, with the body.
+
+        :raises metatool.core.DownloadError: if the downloaded file is
+            incomplete or doesn't match the ``file_hash``
+        """
+        if link:
+            return download_link(url_base, file_hash, rename_file,
+                                 decryption_key)
+        params = {}
+        if rename_file:
+            params['file_alias'] = rename_file
+        headers = {}
+        if sender_key or btctx_api:
+            if not (sender_key and btctx_api):
+                raise TypeError("arguments 'sender_key' and 'btctx_api' "
+                                "should be provided together")
+            headers = self._auth_headers(sender_key, btctx_api, file_hash)
+
+        loop = asyncio.get_event_loop()
+        self._ensure_session()
+        async with self._semaphore:
+            response = await self._send(
+                'GET', urljoin(url_base, '/api/files/' + file_hash),
+                timeout, params=params, headers=headers)
+            async with response:
+                if response.status != 200:
+                    return await _to_response(response)
+                file_name = os.path.abspath(response.headers['X-Sendfile'])
+                writer = _PartWriter(file_name, file_hash, decryption_key)
+                try:
+                    await loop.run_in_executor(None, writer.open)
+                    async for chunk in response.content.iter_chunked(
+                            self.chunk_size):
+                        await loop.run_in_executor(None, writer.write, chunk)
+                    await loop.run_in_executor(None, writer.finish,
+                                               response.content_length)
+                except BaseException:
+                    writer.discard()
+                    raise
+        return file_name
+
+    async def upload(self, url_base, sender_key, btctx_api, file_, file_role,
+                     encrypt=False, block_size=HASH_BLOCK_SIZE,
+                     use_mmap=False, index=None, dedup=False, timeout=None):
+        """
+        Perform the ``upload`` operation, streaming the file to the server
+        by chunks. Look at the ``metatool.core.upload()`` for the arguments
+        specification. Hashing of the file, reading of the sent blocks and
+        the queries of the index and the files cache are performed in the
+        default executor of the loop, the data is encrypted on the fly.
+        """
+        loop = asyncio.get_event_loop()
+        own_index = bool(index) and not isinstance(index, UploadIndex)
+        index = await loop.run_in_executor(None, open_index, index)
+        try:
+            identity = file_identity(file_) if index else None
+            entry = await loop.run_in_executor(
+                None, index.lookup, identity, encrypt) if index else None
+            decryption_key = None
+            try:
+                if encrypt:
+                    source_file = open(file_.name, 'rb')
+                    file_.close()
+                    file_ = source_file
+                    if entry:
+                        decryption_key = binascii.unhexlify(
+                            entry['decryption_key'])
+                    else:
+                        decryption_key = await loop.run_in_executor(
+                            None, convergent_key, source_file, None,
+                            block_size, use_mmap)
+                    file_ = EncryptingReader(source_file, decryption_key)
+                    use_mmap = False
+                if entry:
+                    data_hash = entry['data_hash']
+                else:
+                    data_hash = await loop.run_in_executor(
+                        None, sha256_file, file_, block_size, use_mmap)
+                body = MultipartEncoder(
+                    [('data_hash', data_hash), ('file_role', file_role)],
+                    'file_data', file_, chunk_size=block_size
+                )
+                headers = self._auth_headers(sender_key, btctx_api,
+                                             data_hash)
+                headers['Content-Type'] = body.content_type
+                headers['Content-Length'] = str(len(body))
+
+                if dedup and await self.has(url_base, data_hash, timeout):
+                    response = dedup_response(url_base, data_hash,
+                                              file_role)
+                else:
+                    response = await self._request(
+                        'POST', urljoin(url_base, '/api/files/'),
+                        timeout, idempotent=False, body=body,
+                        headers=headers
+                    )
+            finally:
+                file_.close()
+            if response.status_code == 201:
+                if self.files_cache is not None:
+                    await loop.run_in_executor(
+                        None, self.files_cache.add, url_base, data_hash)
+                if index:
+                    await loop.run_in_executor(
+                        None, index.add, identity, encrypt, data_hash,
+                        file_role, url_base, decryption_key)
+                if decryption_key:
+                    add_decryption_key(response, decryption_key)
+        finally:
+            if own_index:
+                index.close()
+        return response
+
+    async def files(self, url_base, timeout=None):
+        """
+        Get the list of files from the node. Look at the
+        ``metatool.core.files()`` for the arguments specification.
+        """
+        return await self._request('GET', urljoin(url_base, '/api/files/'),
+                                   timeout)
+
+    async def file_hashes(self, url_base, timeout=None):
+        """
+        Get the set of hashes of the files stored on the node. Look at the
+        ``metatool.core.MetaToolClient.file_hashes()`` for the arguments
+        specification. The saved lists of the files cache are read and
+        written in the default executor of the loop.
+        """
+        url = urljoin(url_base, '/api/files/')
+        if self.files_cache is None:
+            response = await self._request('GET', url, timeout)
+            if response.status_code != 200:
+                return None
+            return frozenset(response.json())
+        loop = asyncio.get_event_loop()
+        hashes = await loop.run_in_executor(None, self.files_cache.fresh,
+                                            url_base)
+        if hashes is None:
+            headers = await loop.run_in_executor(
+                None, self.files_cache.request_headers, url_base)
+            response = await self._request('GET', url, timeout,
+                                           headers=headers)
+            hashes = await loop.run_in_executor(
+                None, self.files_cache.update, url_base, response)
+        return hashes
+
+    async def has(self, url_base, data_hash, timeout=None):
+        """
+        Check whether the node already stores the file. Look at the
+        ``metatool.core.MetaToolClient.has()`` for the arguments
+        specification.
+        """
+        try:
+            hashes = await self.file_hashes(url_base, timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError,
+                TypeError):
+            return False
+        return hashes is not None and data_hash in hashes
+
+    async def info(self, url_base, timeout=None):
+        """
+        Get the node state information. Look at the
+        ``metatool.core.info()`` for the arguments specification.
+        """
+        return await self._request('GET',
+                                   urljoin(url_base, '/api/nodes/me/'),
+                                   timeout)
@@ -0,0 +1,681 @@
+"""
+This module contains the batch operations of the MetaTool API - they
+process many files at once with a pool of worker threads, sharing one
+``metatool.core.MetaToolClient`` (and so its kept-alive connections).
+Each item of the batch is tried on the given nodes in turn, like the
+``metatool`` CLI does for a single operation.
+
+Results are written to the ``output`` file object as the newline-delimited
+JSON records (one record per item) as soon as the item is processed.
+"""
+import functools
+import json
+import multiprocessing
+import os
+import os.path
+import threading
+import time
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                FIRST_COMPLETED, wait)
+
+from metatool.core import MetaToolClient
+from metatool.encryption import check_hex_key
+from metatool.hash_pool import file_digest
+from metatool.nodes import call_with_failover
+from metatool.upload_index import UploadIndex, open_index
+from metatool.verifier import LocalCopies, check_response, open_copies
+from metatool.challenges import ChallengeBank, open_bank
+
+#: Default number of the worker threads of the batch operations.
+DEFAULT_WORKERS = 8
+
+
+def iter_directory_files(directory):
+    """
+    Walk through the directory tree and yield paths of all regular files
+    in the stable (sorted) order. Symbolic links to directories are not
+    followed.
+
+    :param directory: path to the directory
+    :type directory: string
+
+    :returns: generator of the file paths
+    :rtype: generator of strings
+    """
+    for dir_path, dir_names, file_names in os.walk(directory):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            path = os.path.join(dir_path, file_name)
+            if os.path.isfile(path):
+                yield path
+
+
+def iter_hash_list(lines):
+    """
+    Parse the list of downloaded files. Every line consists of the
+    whitespace-separated ``file_hash``, optional ``decryption_key`` and
+    optional ``rename_file`` (which takes the rest of the line, so it may
+    contain spaces). Empty lines and lines started with the ``#`` are
+    skipped. Use ``-`` in place of the ``decryption_key`` to set the
+    ``rename_file`` of the not encrypted file::
+
+        # file_hash  [decryption_key | -]  [rename_file]
+        76cc2d5c077f440c8a...
+        0c50ca846cba1140c1...  5bfc58952efa86a89a...  docs/readme.md
+        1d5ae562cc38e3adcf...  -  just_file.txt
+
+    Lines with the malformed ``decryption_key`` (look at the
+    ``metatool.encryption.check_hex_key()``) are yielded with the ``error``
+    item, for reporting them in the results.
+
+    :param lines: lines of the list, i.e. the opened text file
+    :type lines: iterable of strings
+
+    :returns: generator of dictionaries with the ``line`` number and the
+        ``file_hash``, ``decryption_key`` and ``rename_file`` items
+    :rtype: generator of dictionaries
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split(None, 2)
+        item = dict(line=line_number, file_hash=parts[0],
+                    decryption_key=None, rename_file=None)
+        if len(parts) > 1 and parts[1] != '-':
+            try:
+                check_hex_key(parts[1])
+            except ValueError:
+                item['error'] = 'malformed decryption key'
+            item['decryption_key'] = parts[1]
+        if len(parts) > 2:
+            item['rename_file'] = parts[2]
+        yield item
+
+
+def iter_audit_list(lines):
+    """
+    Parse the list of audited files. Every line consists of the
+    whitespace-separated ``file_hash`` and the ``seed`` of the challenge.
+    The ``seed`` may be omitted, when it's taken from the challenge bank.
+    Empty lines and lines started with the ``#`` are skipped::
+
+        # file_hash  seed
+        3a6eb0790f39ac87c9...  19b25856e1c150ca83...
+        76cc2d5c077f440c8a...
+
+    Lines of more items are yielded with the ``error`` item, for
+    reporting them in the results.
+
+    :param lines: lines of the list, i.e. the opened text file
+    :type lines: iterable of strings
+
+    :returns: generator of dictionaries with the ``line`` number and the
+        ``file_hash`` and ``seed`` items
+    :rtype: generator of dictionaries
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split()
+        item = dict(line=line_number, file_hash=parts[0],
+                    seed=parts[1] if len(parts) > 1 else None)
+        if len(parts) > 2:
+            item['error'] = 'expected the file hash and the seed'
+        yield item
+
+
+def run_concurrently(function, items, workers=DEFAULT_WORKERS,
+                     executor_class=ThreadPoolExecutor):
+    """
+    Call the ``function`` for every item with the pool of ``workers``
+    threads (or processes) and yield results in the order of completion.
+    Items are taken from the iterable lazily, so no more than
+    ``2 * workers`` of them are waiting in the pool at once.
+
+    :param function: callable, which takes an item
+    :type function: callable
+
+    :param items: items to process
+    :type items: iterable
+
+    :param workers: number of the workers
+    :type workers: integer
+
+    :param executor_class: class of the pool, the
+        ``concurrent.futures.ProcessPoolExecutor`` runs the picklable
+        ``function`` in the worker processes
+
+        (optional, default: ``concurrent.futures.ThreadPoolExecutor``)
+    :type executor_class: concurrent.futures.Executor subclass
+
+    :returns: generator of the function results
+    :rtype: generator
+    """
+    if workers < 1:
+        raise ValueError("'workers' must be a positive integer")
+    items = iter(items)
+    with executor_class(max_workers=workers) as executor:
+        pending = set()
+        while True:
+            for item in items:
+                pending.add(executor.submit(function, item))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def hash_files(paths, workers=None, encrypt=False, tree=False):
+    """
+    Calculate the ``data_hash`` of every file with the pool of ``workers``
+    processes, so the files are hashed on several cores at once. Look at
+    the ``metatool.hash_pool.file_digest()`` for the arguments and the
+    results.
+
+    :param paths: paths to the hashed files
+    :type paths: iterable of strings
+
+    :param workers: number of the worker processes
+
+        (optional, default: None - the number of the CPUs)
+    :type workers: integer
+
+    :returns: generator of the files' digests in the order of completion
+    :rtype: generator of dictionaries
+    """
+    return run_concurrently(
+        functools.partial(file_digest, encrypt=encrypt, tree=tree), paths,
+        workers or multiprocessing.cpu_count(), ProcessPoolExecutor)
+
+
+class RecordWriter(object):
+    """
+    Thread-safe writer of the newline-delimited JSON records, which counts
+    the succeeded and failed items.
+
+    :param output: text file object to write records to
+    :type output: file object
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.succeeded = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        """
+        Write the record. A record with the ``error`` item is counted as
+        the failed one.
+
+        :param record: JSON serializable dictionary
+        :type record: dictionary
+        """
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            if 'error' in record:
+                self.failed += 1
+            else:
+                self.succeeded += 1
+            if self.output is not None:
+                self.output.write(line + '\n')
+                self.output.flush()
+
+    def summary(self):
+        """
+        :returns: numbers of the succeeded and failed items
+        :rtype: dictionary
+        """
+        return dict(succeeded=self.succeeded, failed=self.failed)
+
+
+def response_record(record, url_base, result, success_status):
+    """
+    Fill the record with the result of an operation on the node.
+
+    :param record: initial record with the item's description
+    :type record: dictionary
+
+    :param url_base: URL-string of the node which gave the result
+    :type url_base: string
+
+    :param result: result of the ``metatool.core`` API function
+    :type result: requests.models.Response object
+    :type result: string
+
+    :param success_status: response statuses considered as the success
+    :type success_status: tuple of integers
+
+    :returns: the same record
+    :rtype: dictionary
+    """
+    if url_base is None:
+        record['error'] = result
+        return record
+    record['node'] = url_base
+    status_code = getattr(result, 'status_code', None)
+    if status_code is None:
+        record['result'] = result
+        return record
+    record['status'] = status_code
+    try:
+        content = result.json()
+    except ValueError:
+        content = result.text
+    if status_code in success_status:
+        if isinstance(content, dict):
+            record.update(content)
+        else:
+            record['result'] = content
+    else:
+        record['error'] = content
+    return record
+
+
+def upload_dir(nodes, sender_key, btctx_api, directory, file_role='001',
+               encrypt=False, workers=DEFAULT_WORKERS, output=None,
+               index=None, dedup=False, breaker=None, timeout=None,
+               challenges=0, bank=True, hash_workers=0):
+    """
+    Upload all files of the directory tree to the server, with the pool
+    of ``workers`` threads. Every file is tried on the ``nodes`` in turn,
+    until one of them accepts it.
+
+    For each file one JSON record is written to the ``output``, with the
+    ``path`` of the file and the ``node`` it was uploaded to, the response
+    ``status`` and the response data (``data_hash``, ``file_role`` and the
+    ``decryption_key`` when ``encrypt=True``), or with the ``error``
+    description when the uploading failed.
+
+    :param nodes: URL-strings of nodes in the desired order
+    :type nodes: sequence of strings
+
+    :param sender_key: unique secret key which will be used for the
+        generating credentials required by the access to the server
+    :type sender_key: string
+
+    :param btctx_api: instance of the ``BtcTxStore`` class which will be used
+        to generate credentials for the server access
+    :type btctx_api: btctxstore.BtcTxStore object
+
+    :param directory: path to the uploaded directory
+    :type directory: string
+
+    :param file_role: role of all uploaded files
+
+        (optional, default: '001')
+    :type file_role: string
+
+    :param encrypt: if ``True``, files will be encrypted before the uploading
+
+        (optional, default: False)
+    :type encrypt: boolean
+
+    :param workers: number of the files uploaded at once
+
+        (optional, default: ``DEFAULT_WORKERS``)
+    :type workers: integer
+
+    :param output: text file object for the result records
+
+        (optional, default: None - records are not written)
+    :type output: file object
+
+    :param index: local index of the uploaded files, look at the
+        ``metatool.core.upload()``
+
+        (optional, default: None - the index isn't used)
+    :type index: metatool.upload_index.UploadIndex object or string
+        or boolean
+
+    :param dedup: skip sending of the files, which are already stored on
+        the node, look at the ``metatool.core.upload()``
+
+        (optional, default: False)
+    :type dedup: boolean
+
+    :param breaker: circuit breaker, which skips the failing nodes, look
+        at the ``metatool.nodes.call_with_failover()``
+
+        (optional, default: None - all nodes are tried for every file)
+    :type breaker: metatool.breaker.CircuitBreaker object
+
+    :param timeout: seconds for every file, shared by the tried nodes,
+        look at the ``metatool.nodes.call_with_failover()``
+
+        (optional, default: None - no deadline)
+    :type timeout: number
+
+    :param challenges: number of the audit challenges of every uploaded
+        file, saved to the ``bank``, look at the ``metatool.core.upload()``
+
+        (optional, default: 0 - no challenges)
+    :type challenges: integer
+
+    :param bank: the challenge bank, the path to it's database file, or
+        ``True`` for the default one
+
+        (optional, default: True)
+    :type bank: metatool.challenges.ChallengeBank object or string
+        or boolean
+
+    :param hash_workers: number of the processes, which calculate the
+        ``data_hash`` of the files (look at the ``hash_files()``) ahead of
+        the uploading threads, so the files are hashed on several cores.
+        The ``index`` doesn't spare the hashing then, and the files with
+        the ``challenges`` are hashed by the uploading threads.
+
+        (optional, default: 0 - the files are hashed by the uploading
+        threads)
+    :type hash_workers: integer
+
+    :returns: numbers of the succeeded and failed uploads, and the
+        ``signer`` statistics of the signatures cache (look at the
+        ``metatool.signer.CachingSigner.stats()``)
+    :rtype: dictionary
+    """
+    writer = RecordWriter(output)
+    own_index = bool(index) and not isinstance(index, UploadIndex)
+    index = open_index(index)
+    if not challenges:
+        bank = None
+    own_bank = bool(bank) and not isinstance(bank, ChallengeBank)
+    bank = open_bank(bank)
+
+    with MetaToolClient(pool_maxsize=workers) as client:
+
+        def upload_file(path, url_base, digest=None, timeout=None):
+            with open(path, 'rb') as file_:
+                return client.upload(url_base, sender_key, btctx_api, file_,
+                                     file_role, encrypt=encrypt, index=index,
+                                     dedup=dedup, timeout=timeout,
+                                     challenges=challenges, bank=bank,
+                                     digest=digest)
+
+        def process(item):
+            path, digest = item
+            record = dict(path=path)
+            if digest and 'error' in digest:
+                record['error'] = digest['error']
+                writer.write(record)
+                return
+            try:
+                url_base, result = call_with_failover(
+                    upload_file, nodes, breaker=breaker, deadline=timeout,
+                    path=path, digest=digest)
+            except EnvironmentError as exc:
+                record['error'] = str(exc)
+            else:
+                response_record(record, url_base, result, (200, 201))
+            writer.write(record)
+
+        paths = iter_directory_files(directory)
+        if hash_workers:
+            items = ((digest['path'], digest) for digest in
+                     hash_files(paths, hash_workers, encrypt=encrypt))
+        else:
+            items = ((path, None) for path in paths)
+        try:
+            for _ in run_concurrently(process, items, workers):
+                pass
+        finally:
+            if own_index:
+                index.close()
+            if own_bank:
+                bank.close()
+
+        return dict(writer.summary(),
+                    signer=client.signers.get(btctx_api).stats())
+
+
+def download_batch(nodes, sender_key, btctx_api, hash_list,
+                   workers=DEFAULT_WORKERS, output=None, breaker=None,
+                   timeout=None):
+    """
+    Download all files of the list from the server, with the pool of
+    ``workers`` threads. Every file is tried on the ``nodes`` in turn,
+    until one of them serves it. Look at the ``iter_hash_list()`` for the
+    format of the list.
+
+    For each file one JSON record is written to the ``output``, with the
+    ``file_hash`` and the ``line`` number of the item, the ``node`` it was
+    downloaded from and the ``path`` of the saved file, or with the
+    ``error`` description (and the response ``status``) when the
+    downloading failed.
+
+    :param nodes: URL-strings of nodes in the desired order
+    :type nodes: sequence of strings
+
+    :param sender_key: unique secret key which will be used for the
+        generating credentials required by the access to the server
+    :type sender_key: string
+
+    :param btctx_api: instance of the ``BtcTxStore`` class which will be used
+        to generate credentials for the server access
+    :type btctx_api: btctxstore.BtcTxStore object
+
+    :param hash_list: lines of the list of files, i.e. the opened text file
+    :type hash_list: iterable of strings
+
+    :param workers: number of the files downloaded at once
+
+        (optional, default: ``DEFAULT_WORKERS``)
+    :type workers: integer
+
+    :param output: text file object for the result records
+
+        (optional, default: None - records are not written)
+    :type output: file object
+
+    :param breaker: circuit breaker, which skips the failing nodes, look
+        at the ``metatool.nodes.call_with_failover()``
+
+        (optional, default: None - all nodes are tried for every file)
+    :type breaker: metatool.breaker.CircuitBreaker object
+
+    :param timeout: seconds for every file, shared by the tried nodes,
+        look at the ``metatool.nodes.call_with_failover()``
+
+        (optional, default: None - no deadline)
+    :type timeout: number
+
+    :returns: numbers of the succeeded and failed downloads, and the
+        ``signer`` statistics of the signatures cache (look at the
+        ``metatool.signer.CachingSigner.stats()``)
+    :rtype: dictionary
+    """
+    writer = RecordWriter(output)
+
+    with MetaToolClient(pool_maxsize=workers) as client:
+
+        def process(item):
+            record = dict(line=item['line'], file_hash=item['file_hash'])
+            if 'error' in item:
+                record['error'] = item['error']
+                writer.write(record)
+                return
+            try:
+                url_base, result = call_with_failover(
+                    client.download, nodes, breaker=breaker,
+                    deadline=timeout,
+                    file_hash=item['file_hash'],
+                    sender_key=sender_key,
+                    btctx_api=btctx_api,
+                    rename_file=item['rename_file'],
+                    decryption_key=item['decryption_key']
+                )
+            except EnvironmentError as exc:
+                record['error'] = str(exc)
+            else:
+                if url_base is not None and not hasattr(result,
+                                                        'status_code'):
+                    record.update(node=url_base, path=result)
+                else:
+                    response_record(record, url_base, result, ())
+            writer.write(record)
+
+        for _ in run_concurrently(process, iter_hash_list(hash_list),
+                                  workers):
+            pass
+
+        return dict(writer.summary(),
+                    signer=client.signers.get(btctx_api).stats())
+
+
+def audit_batch(nodes, sender_key, btctx_api, audit_list,
+                workers=DEFAULT_WORKERS, output=None, breaker=None,
+                timeout=None, verify=None, bank=None):
+    """
+    Audit all files of the list on the server, with the pool of
+    ``workers`` threads. Every audit is tried on the ``nodes`` in turn,
+    until one of them answers. Look at the ``iter_audit_list()`` for the
+    format of the list.
+
+    For each audit one JSON record is written to the ``output``, with the
+    ``file_hash``, the ``seed`` and the ``line`` number of the item, the
+    ``node`` and the response ``status`` and data (the
+    ``challenge_response``), or with the ``error`` description when the
+    audit failed. With the ``verify`` argument the received responses are
+    checked against the local copies of the files, the records get the
+    ``verified`` item and the mismatched responses are reported with the
+    ``error`` (look at the ``metatool.verifier.LocalCopies.verify()``).
+
+    With the ``bank`` the audits of the list lines without the ``seed``
+    take the unused challenges from the challenge bank, and the responses
+    to the banked challenges are verified against the banked ones, without
+    reading the local copies (look at the ``metatool.challenges`` module).
+    The challenge is used up only when a node has answered it, the ones not
+    sent to any node are returned to the bank.
+
+    :param nodes: URL-strings of nodes in the desired order
+    :type nodes: sequence of strings
+
+    :param sender_key: unique secret key which will be used for the
+        generating credentials required by the access to the server
+    :type sender_key: string
+
+    :param btctx_api: instance of the ``BtcTxStore`` class which will be used
+        to generate credentials for the server access
+    :type btctx_api: btctxstore.BtcTxStore object
+
+    :param audit_list: lines of the list of audits, i.e. the opened text
+        file
+    :type audit_list: iterable of strings
+
+    :param workers: number of the audits performed at once
+
+        (optional, default: ``DEFAULT_WORKERS``)
+    :type workers: integer
+
+    :param output: text file object for the result records
+
+        (optional, default: None - records are not written)
+    :type output: file object
+
+    :param breaker: circuit breaker, which skips the failing nodes, look
+        at the ``metatool.nodes.call_with_failover()``
+
+        (optional, default: None - all nodes are tried for every audit)
+    :type breaker: metatool.breaker.CircuitBreaker object
+
+    :param timeout: seconds for every audit, shared by the tried nodes,
+        look at the ``metatool.nodes.call_with_failover()``
+
+        (optional, default: None - no deadline)
+    :type timeout: number
+
+    :param verify: local copies of the audited files, the path to the
+        directory with the copies named after their hashes, or ``True`` for
+        the original files from the default index of the uploaded files
+        (look at the ``metatool.verifier`` module)
+
+        (optional, default: None - the responses aren't verified)
+    :type verify: metatool.verifier.LocalCopies object or string or boolean
+
+    :param bank: the challenge bank, the path to it's database file, or
+        ``True`` for the default one
+
+        (optional, default: None - the bank isn't used)
+    :type bank: metatool.challenges.ChallengeBank object or string
+        or boolean
+
+    :returns: numbers of the succeeded and failed audits, the number of
+        audits ``per_second``, and the ``signer`` statistics of the
+        signatures cache (look at the
+        ``metatool.signer.CachingSigner.stats()``)
+    :rtype: dictionary
+    """
+    writer = RecordWriter(output)
+    own_copies = bool(verify) and not isinstance(verify, LocalCopies)
+    copies = open_copies(verify)
+    own_bank = bool(bank) and not isinstance(bank, ChallengeBank)
+    bank = open_bank(bank)
+    start = time.time()
+
+    with MetaToolClient(pool_maxsize=workers) as client:
+
+        def process(item):
+            seed, expected, reserved = item['seed'], None, False
+            if bank and 'error' not in item:
+                if seed is None:
+                    challenge = bank.take(item['file_hash']) or {}
+                    seed = challenge.get('seed')
+                    expected = challenge.get('response')
+                    reserved = seed is not None
+                else:
+                    expected = bank.find(item['file_hash'], seed)
+            record = dict(line=item['line'], file_hash=item['file_hash'],
+                          seed=seed)
+            if 'error' in item or seed is None:
+                record['error'] = item.get('error') or (
+                    'no challenges left in the bank' if bank else
+                    'expected the file hash and the seed')
+                writer.write(record)
+                return
+            try:
+                url_base, result = call_with_failover(
+                    client.audit, nodes, breaker=breaker, deadline=timeout,
+                    sender_key=sender_key,
+                    btctx_api=btctx_api,
+                    file_hash=item['file_hash'],
+                    seed=seed
+                )
+            except EnvironmentError as exc:
+                record['error'] = str(exc)
+            else:
+                if reserved and url_base is not None:
+                    # the node has got the seed, so it's burned
+                    bank.use(item['file_hash'], seed)
+                    reserved = False
+                response_record(record, url_base, result, (200, 201))
+                if 'error' not in record and expected is not None:
+                    check_response(record, expected)
+                elif 'error' not in record and copies:
+                    copies.verify(record)
+            finally:
+                if reserved:
+                    # no node was reached, so the challenge is kept
+                    bank.release(item['file_hash'], seed)
+            writer.write(record)
+
+        try:
+            for _ in run_concurrently(process, iter_audit_list(audit_list),
+                                      workers):
+                pass
+        finally:
+            if own_copies:
+                copies.close()
+            if own_bank:
+                bank.close()
+
+        summary = writer.summary()
+        elapsed = time.time() - start
+        audits = summary['succeeded'] + summary['failed']
+        return dict(summary,
+                    per_second=round(audits / elapsed, 1) if elapsed else 0.0,
+                    signer=client.signers.get(btctx_api).stats())
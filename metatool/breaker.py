@@ -0,0 +1,160 @@
+"""
+This module contains the circuit breaker of the MetaCore nodes. After the
+``failure_threshold`` consecutive failed calls the node's circuit is
+"open" and the node is skipped by the ``metatool.nodes`` failover or by
+the ``metatool.core.MetaToolClient`` with the breaker, so the calls don't
+wait on the dead node. When the ``cooldown`` has passed, the
+circuit is "half-open": one trial call is let through, and it closes the
+circuit on success or opens it again on failure.
+
+The circuits are saved to the ``breaker.json`` file in the state directory
+(look at the ``metatool.state`` module), so the next runs of the CLI skip
+the dead nodes too.
+"""
+import json
+import os.path
+import threading
+import time
+
+from metatool.state import state_path, write_file
+
+#: Name of the default circuits file in the state directory.
+DEFAULT_BREAKER_NAME = 'breaker.json'
+
+#: Number of the consecutive failures, which opens the circuit.
+DEFAULT_FAILURE_THRESHOLD = 3
+
+#: Seconds the node is skipped for, before the trial call.
+DEFAULT_COOLDOWN = 60
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(EnvironmentError):
+    """
+    Raised when the nodes weren't called, because all their circuits are
+    open.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Thread-safe set of the nodes' circuits.
+
+    :param failure_threshold: number of the consecutive failed calls,
+        which opens the circuit
+
+        (optional, default: ``DEFAULT_FAILURE_THRESHOLD``)
+    :type failure_threshold: integer
+
+    :param cooldown: seconds the node is skipped for, before the trial call
+
+        (optional, default: ``DEFAULT_COOLDOWN``)
+    :type cooldown: number
+
+    :param path: path to the circuits file, or ``False`` to keep them in
+        the memory only
+
+        (optional, default: the ``DEFAULT_BREAKER_NAME`` file in the
+        state directory)
+    :type path: string or boolean
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN, path=None):
+        if failure_threshold < 1:
+            raise ValueError("'failure_threshold' must be positive")
+        if path is None:
+            path = state_path(DEFAULT_BREAKER_NAME)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.path = path
+        self._lock = threading.Lock()
+        self._circuits = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path) as fp:
+                    circuits = json.load(fp)
+                if isinstance(circuits, dict):
+                    self._circuits = circuits
+            except (EnvironmentError, ValueError):
+                # broken file is started from scratch
+                pass
+
+    def _state(self, circuit, now):
+        if circuit['failures'] < self.failure_threshold:
+            return CLOSED
+        if now - circuit['opened_at'] < self.cooldown:
+            return OPEN
+        return HALF_OPEN
+
+    def state(self, url_base):
+        """
+        :param url_base: URL-string of the node
+        :type url_base: string
+
+        :returns: state of the node's circuit: ``CLOSED``, ``OPEN`` or
+            ``HALF_OPEN``
+        :rtype: string
+        """
+        with self._lock:
+            circuit = self._circuits.get(url_base)
+            if circuit is None:
+                return CLOSED
+            return self._state(circuit, time.time())
+
+    def allow(self, url_base):
+        """
+        Check whether the node can be called now. The half-open circuit
+        lets through one trial call per ``cooldown``.
+
+        :param url_base: URL-string of the node
+        :type url_base: string
+
+        :returns: ``True`` if the node should be called
+        :rtype: boolean
+        """
+        with self._lock:
+            circuit = self._circuits.get(url_base)
+            if circuit is None:
+                return True
+            now = time.time()
+            state = self._state(circuit, now)
+            if state == HALF_OPEN:
+                # the next trial is let through, when the current one has
+                # got no result during the cooldown
+                circuit['opened_at'] = now
+                return True
+            return state == CLOSED
+
+    def record(self, url_base, success):
+        """
+        Add the result of the call to the node.
+
+        :param url_base: URL-string of the node
+        :type url_base: string
+
+        :param success: ``False`` if the node has failed the call
+        :type success: boolean
+        """
+        with self._lock:
+            if success:
+                self._circuits.pop(url_base, None)
+                return
+            circuit = self._circuits.setdefault(
+                url_base, dict(failures=0, opened_at=0))
+            circuit['failures'] += 1
+            if circuit['failures'] >= self.failure_threshold:
+                circuit['opened_at'] = time.time()
+
+    def save(self):
+        """
+        Save the circuits to their file.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            content = json.dumps(self._circuits, indent=2, sort_keys=True)
+        write_file(self.path, content)
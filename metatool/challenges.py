@@ -0,0 +1,307 @@
+"""
+This module contains the local bank of the audit challenges. The pairs of
+the random ``seed`` and the expected ``response`` (look at the
+``metatool.hashing.challenge_response()``) are calculated in advance, while
+the file is hashed for the uploading anyway, and kept in the bank. The
+later audits take the unused challenges from the bank and check the node's
+responses against the banked ones, without touching the original files.
+
+The bank is a SQLite database, by default the ``challenges.sqlite`` file in
+the state directory (look at the ``metatool.state`` module).
+"""
+import binascii
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metatool.encryption import EncryptingReader, convergent_key
+from metatool.hashing import sha256_with_challenges, HASH_BLOCK_SIZE
+from metatool.state import state_path
+
+#: Name of the default bank file in the state directory.
+DEFAULT_BANK_NAME = 'challenges.sqlite'
+
+#: Default number of the challenges banked by the ``bank_file()``.
+DEFAULT_CHALLENGES = 10
+
+#: Number of the random bytes of the generated seeds.
+SEED_SIZE = 32
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS challenges (
+    data_hash TEXT NOT NULL,
+    seed TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL,
+    PRIMARY KEY (data_hash, seed)
+)
+'''
+
+
+def generate_seeds(count):
+    """
+    Generate the random seeds of the challenges.
+
+    :param count: number of the seeds
+    :type count: integer
+
+    :returns: hexadecimal seeds of the ``SEED_SIZE`` random bytes
+    :rtype: list of strings
+    """
+    return [binascii.hexlify(os.urandom(SEED_SIZE)).decode()
+            for _ in range(count)]
+
+
+class ChallengeBank(object):
+    """
+    Thread-safe bank of the audit challenges.
+
+    :param path: path to the bank database file
+
+        (optional, default: the ``DEFAULT_BANK_NAME`` file in the state
+        directory)
+    :type path: string
+    """
+
+    def __init__(self, path=None):
+        self.path = path or state_path(DEFAULT_BANK_NAME)
+        self._lock = threading.Lock()
+        self._reserved = set()
+        self._connection = sqlite3.connect(self.path,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the bank database.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def add(self, data_hash, challenges):
+        """
+        Save the challenges of the file.
+
+        :param data_hash: hash of the stored data
+        :type data_hash: string
+
+        :param challenges: pairs of the ``seed`` and the expected
+            ``response``
+        :type challenges: iterable of tuples
+        """
+        created_at = time.time()
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO challenges VALUES '
+                    '(?, ?, ?, ?, NULL)',
+                    [(data_hash, seed, response, created_at)
+                     for seed, response in challenges]
+                )
+
+    def take(self, data_hash):
+        """
+        Reserve the oldest unused challenge of the file, so the concurrent
+        audits don't take it again. The challenge is marked as used by the
+        ``use()``, when it's sent to the node, so every challenge is answered
+        by the node once, or it's returned to the bank by the ``release()``,
+        i.e. when no node was reached. The reservations are kept by this
+        instance only, so the challenges reserved by the crashed process
+        aren't lost.
+
+        :param data_hash: hash of the stored data
+        :type data_hash: string
+
+        :returns: dictionary with the ``seed`` and the expected
+            ``response``, or ``None`` when no unused challenges are left
+        :rtype: dictionary
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT seed, response FROM challenges '
+                'WHERE data_hash = ? AND used_at IS NULL '
+                'ORDER BY created_at, seed',
+                (data_hash,)
+            )
+            for seed, response in rows:
+                if (data_hash, seed) not in self._reserved:
+                    self._reserved.add((data_hash, seed))
+                    return dict(seed=seed, response=response)
+        return None
+
+    def use(self, data_hash, seed):
+        """
+        Mark the challenge, which is sent to the node, as used.
+
+        :param data_hash: hash of the stored data
+        :type data_hash: string
+
+        :param seed: seed of the challenge
+        :type seed: string
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    'UPDATE challenges SET used_at = ? '
+                    'WHERE data_hash = ? AND seed = ?',
+                    (time.time(), data_hash, seed)
+                )
+            self._reserved.discard((data_hash, seed))
+
+    def release(self, data_hash, seed):
+        """
+        Return the reserved challenge, which wasn't sent to the node, to
+        the bank.
+
+        :param data_hash: hash of the stored data
+        :type data_hash: string
+
+        :param seed: seed of the challenge
+        :type seed: string
+        """
+        with self._lock:
+            self._reserved.discard((data_hash, seed))
+
+    def find(self, data_hash, seed):
+        """
+        Find the expected response to the banked challenge.
+
+        :param data_hash: hash of the stored data
+        :type data_hash: string
+
+        :param seed: seed of the challenge
+        :type seed: string
+
+        :returns: expected response or ``None`` for the unknown challenge
+        :rtype: string
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT response FROM challenges '
+                'WHERE data_hash = ? AND seed = ?',
+                (data_hash, seed)
+            ).fetchone()
+        return row and row[0]
+
+    def count(self, data_hash):
+        """
+        :returns: number of the unused and not reserved challenges of the
+            file
+        :rtype: integer
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT seed FROM challenges '
+                'WHERE data_hash = ? AND used_at IS NULL',
+                (data_hash,)
+            )
+            return sum(1 for seed, in rows
+                       if (data_hash, seed) not in self._reserved)
+
+
+def open_bank(bank):
+    """
+    Get the ``ChallengeBank`` instance for the ``bank`` argument of the API
+    functions.
+
+    :param bank: the bank itself, the path to the bank file, or ``True``
+        for the default bank file
+    :type bank: ChallengeBank object or string or boolean or None
+
+    :returns: the bank or ``None``
+    :rtype: ChallengeBank object
+    """
+    if not bank or isinstance(bank, ChallengeBank):
+        return bank or None
+    return ChallengeBank(None if bank is True else bank)
+
+
+def hash_with_challenges(file_, challenges, block_size=HASH_BLOCK_SIZE,
+                         use_mmap=False):
+    """
+    Calculate the SHA-256 hex-digest of the file and the given number of
+    the new challenges with the single pass over the file. Look at the
+    ``metatool.hashing.sha256_with_challenges()`` for the arguments.
+
+    :param challenges: number of the generated challenges
+    :type challenges: integer
+
+    :returns: SHA-256 hex-digest of the file's content and the list of
+        pairs of the ``seed`` and the expected ``response``
+    :rtype: tuple
+    """
+    seeds = generate_seeds(challenges)
+    data_hash, responses = sha256_with_challenges(file_, seeds, block_size,
+                                                  use_mmap)
+    return data_hash, list(zip(seeds, responses))
+
+
+def bank_file(file_, challenges=DEFAULT_CHALLENGES, encrypt=False,
+              bank=True, block_size=HASH_BLOCK_SIZE, use_mmap=False):
+    """
+    Add the new challenges of the local file to the bank, without the
+    uploading. It's used by the ``metatool challenges`` action for the
+    files, which are already stored on the node.
+
+    :param ``file_``: file object opened in the 'rb' mode
+    :type ``file_``: file object
+
+    :param challenges: number of the generated challenges
+
+        (optional, default: ``DEFAULT_CHALLENGES``)
+    :type challenges: integer
+
+    :param encrypt: if ``True``, the challenges are made for the encrypted
+        data of the file, like the ``metatool.core.upload()`` with the
+        ``encrypt=True`` stores it
+
+        (optional, default: False)
+    :type encrypt: boolean
+
+    :param bank: the challenge bank, the path to it's file or ``True`` for
+        the default bank
+
+        (optional, default: True)
+    :type bank: ChallengeBank object or string or boolean
+
+    :param block_size: size of the blocks read from the file in bytes
+
+        (optional, default: ``metatool.hashing.HASH_BLOCK_SIZE``)
+    :type block_size: integer
+
+    :param use_mmap: if ``True``, the file will be memory-mapped while
+        hashing it
+
+        (optional, default: False)
+    :type use_mmap: boolean
+
+    :returns: JSON with the ``data_hash`` of the file and the number of
+        the unused banked ``challenges`` of it
+    :rtype: string
+    """
+    own_bank = bool(bank) and not isinstance(bank, ChallengeBank)
+    bank = open_bank(bank)
+    try:
+        if encrypt:
+            key = convergent_key(file_, None, block_size, use_mmap)
+            file_ = EncryptingReader(file_, key)
+            use_mmap = False
+        data_hash, pairs = hash_with_challenges(file_, challenges,
+                                                block_size, use_mmap)
+        bank.add(data_hash, pairs)
+        return json.dumps(dict(data_hash=data_hash,
+                               challenges=bank.count(data_hash)),
+                          indent=2, sort_keys=True)
+    finally:
+        if own_bank:
+            bank.close()
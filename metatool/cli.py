@@ -19,7 +19,8 @@ Common syntax for all actions::
 "metatool" expect the main lead positional argument ``action`` which define
 the action of the program. Must be one of::
 
-    files | info | upload | download | audit
+    files | info | upload | download | audit | upload-dir | download-batch |
+    audit-batch | challenges | nodes
 
 Each of actions expect an appropriate set of arguments after it. They are
 separately described below.
@@ -36,6 +37,43 @@ But by default the server is http://node2.metadisk.org .
 You can either set an system environment variable ``MEATADISKSERVER`` to
 provide target server instead of using the "--url" opt. argument.
 
+Without the ``--url`` the nodes are tried one after another, until one of
+them answers. The ``files``, ``info``, ``audit`` and ``download`` actions
+accept the ``--hedge DELAY`` argument to not wait for a slow node: when
+the node hasn't answered in ``DELAY`` seconds, the request is sent to the
+next node too, and the first good answer is taken::
+
+    $ metatool info --hedge 0.5
+
+Every request waits for the node no longer than 10 seconds for the
+connection and 60 seconds for the answer. The request failed with the
+transient error (i.e. the connection error or the 503 status) is sent to
+the same node up to 3 times, with the growing random pauses, before the
+next node is tried. The actions, which send requests
+to the nodes, accept the ``--timeout SECONDS`` argument - the deadline of
+the whole action. Each tried node gets only what is left of it, and the
+next nodes aren't tried, when it's over. The ``upload-dir`` and
+``download-batch`` actions apply it to every file::
+
+    $ metatool download FILE_HASH --timeout 30
+
+The latency and the error rate of every called node are kept in the
+``nodes.json`` file in the ``~/.metatool`` directory (or in the
+``METATOOL_HOME`` directory), and the default nodes are tried from the
+fastest healthy one. Nodes which failed most of the recent calls are
+tried last.
+
+The node, which has failed 3 calls in a row (a connection error or a
+server error status), is skipped by all actions for a minute, and then
+it's tried again by one call. These circuits are kept in the
+``breaker.json`` file in the same directory.
+
+Requests to the server are signed with the sender's private key. It's
+generated on the first run and saved to the ``sender.key`` file in the
+``~/.metatool`` directory (or in the ``METATOOL_HOME`` directory), so all
+runs have the same sender address. Set the ``METATOOL_SENDER_KEY``
+environment variable to use your own key instead.
+
 -------------------
 
 Brief guide for actions
@@ -57,7 +95,8 @@ response it will be shown instead of the success result.
 
 -------------------
 
-**metatool upload <path_to_file> [-r | --file_role FILE_ROLE] [--encrypt]**
+**metatool upload <path_to_file> [-r | --file_role FILE_ROLE] [--encrypt]
+[--index [PATH]] [--dedup] [--challenges K]**
     Upload file to the server.
     The **encrypted file** is preferred, but not forced, way to serve files
     on the MetaCore server, so uploading supports the **encryption**.
@@ -86,6 +125,23 @@ response it will be shown instead of the success result.
     Without the ``--ecrypt`` returns a json file with **data_hash**
     and **file_role**.
 
+        ``--index [PATH]`` - Key to use the local index of uploaded files
+        (``uploads.sqlite`` in the ``~/.metatool`` directory, or in the
+        ``METATOOL_HOME`` directory, when the ``PATH`` isn't given). The
+        ``data_hash`` and ``decryption_key`` of the file, which wasn't
+        changed since it's last upload, are taken from the index, so the
+        file isn't hashed again.
+
+        ``--dedup`` - Key to check the node's list of files first and skip
+        sending the file, when the node already stores it. The result
+        looks the same as the result of the usual uploading.
+
+        ``--challenges K`` - Key to calculate ``K`` audit challenges of the
+        uploaded data (the random ``seed`` and the expected response) by
+        the same pass over the file, which calculates the ``data_hash``,
+        and save them to the challenge bank (``challenges.sqlite`` in the
+        state directory) for the later ``audit-batch --bank``.
+
 -------------------
 
 **metatool audit <data_hash> <challenge_seed>**
@@ -102,7 +158,7 @@ response it will be shown instead of the success result.
 -------------------
 
 **metatool download <file_hash> [--decryption_key "KEY"]
-[--rename_file NEW_NAME] [--link]**
+[--rename_file NEW_NAME] [--link] [--chunk_size BYTES]**
 
     This action fetch desired file from the server by the **hash_name**.
     Returns full path to the file if downloaded successful.
@@ -125,6 +181,136 @@ response it will be shown instead of the success result.
 
         :note: will rewrite existed file on you disk with the same name!
 
+        ``--chunk_size BYTES`` - Optional argument, which defines the size
+        of the chunks written to the file as they arrive (64 KiB by default).
+
+-------------------
+
+**metatool upload-dir <path_to_dir> [-r | --file_role FILE_ROLE] [--encrypt]
+[-w | --workers N] [-o | --output FILE] [--index [PATH]] [--dedup]
+[--challenges K] [--hash-workers N]**
+
+    Upload all files of the directory tree with the pool of ``N`` workers,
+    sharing kept-alive connections. Each file is tried on the nodes in turn.
+    One JSON record per file is written to the ``--output`` file (stdout by
+    default) as soon as the file is processed::
+
+        {"data_hash": "...", "file_role": "001", "node": "...",
+         "path": "dir/file.txt", "status": 201}
+
+    Files which failed on all nodes get the ``error`` item instead of the
+    response data. The numbers of succeeded and failed files, and the hit
+    rate of the signatures cache are printed to stderr at the end. With
+    the ``--index`` key unchanged files aren't hashed again, and with the
+    ``--dedup`` key files already stored on the node aren't sent, and with
+    the ``--challenges`` key audit challenges of every file are banked,
+    like with the ``upload`` action. With the ``--hash-workers`` key the
+    files are hashed ahead of the uploading by the pool of ``N`` processes,
+    to use several cores for the large files.
+
+-------------------
+
+**metatool download-batch [HASH_LIST] [-w | --workers N] [-o | --output FILE]**
+
+    Download all files listed in the ``HASH_LIST`` file (stdin by default)
+    with the pool of ``N`` workers, sharing kept-alive connections. Each file
+    is tried on the nodes in turn. Every line of the list is the
+    ``file_hash``, optionally followed by the ``decryption_key`` (or ``-``)
+    and the ``rename_file``::
+
+        $ cat hashes.txt
+        76cc2d5c077f440c8a422bec61070e3383807205845c8f6f22beeb28002ed695
+        0c50ca846cba1140c1d1be... 5bfc58952efa86a89ab8... docs/readme.md
+        $ metatool download-batch hashes.txt -w 32 > results.ndjson
+
+    One JSON record per file is written to the ``--output`` file (stdout by
+    default)::
+
+        {"file_hash": "...", "line": 1, "node": "...",
+         "path": "/home/user/76cc2d5c077f440c8a..."}
+
+    Files which failed on all nodes get the ``error`` item instead of the
+    ``path``. The numbers of succeeded and failed files, and the hit rate
+    of the signatures cache are printed to stderr at the end.
+
+-------------------
+
+**metatool audit-batch [AUDIT_LIST] [-w | --workers N] [-o | --output FILE]
+[--verify [DIRECTORY]] [--bank]**
+
+    Audit all files listed in the ``AUDIT_LIST`` file (stdin by default)
+    with the pool of ``N`` workers, sharing kept-alive connections and
+    cached signatures. Each audit is tried on the nodes in turn. Every line
+    of the list is the ``file_hash`` and the ``seed`` of the challenge::
+
+        $ cat audits.txt
+        3a6eb0790f39ac87c94f3856b2dd2c5d... 19b25856e1c150ca834cffc8b59b23ad...
+        $ metatool audit-batch audits.txt -w 32 > results.ndjson
+
+    One JSON record per audit is written to the ``--output`` file (stdout by
+    default) as soon as the node answers::
+
+        {"challenge_response": "...", "challenge_seed": "...",
+         "data_hash": "...", "file_hash": "...", "line": 1, "node": "...",
+         "seed": "...", "status": 201}
+
+    Audits which failed on all nodes get the ``error`` item instead of the
+    response data. The numbers of succeeded and failed audits, the audits
+    done ``per_second`` and the hit rate of the signatures cache are
+    printed to stderr at the end.
+
+    With the ``--verify`` key the ``challenge_response`` is checked against
+    the local copy of the file, which is read from the ``DIRECTORY`` by the
+    name of the ``file_hash`` (like the ``download-batch`` saves it), or,
+    when the ``DIRECTORY`` is omitted, the original file is found in the
+    index of the uploaded files (look at the ``upload-dir --index``) and
+    encrypted back, if it was uploaded encrypted. Records get the
+    ``verified`` item, and the mismatched responses are reported with the
+    ``error``.
+
+    With the ``--bank`` key the lines of the ``AUDIT_LIST`` may hold the
+    ``file_hash`` only - the unused challenge of the file is taken from the
+    challenge bank (look at the ``upload --challenges`` and the
+    ``challenges`` action), and the responses to the banked challenges are
+    verified against the banked ones, without reading any local files.
+
+-------------------
+
+**metatool challenges <path_to_file> [-k | --challenges K] [--encrypt]**
+
+    Bank ``K`` (10 by default) new audit challenges of the local file,
+    already uploaded without the ``--challenges`` key, with the single pass
+    over the file. With the ``--encrypt`` key the challenges are made for
+    the encrypted data, like the ``upload --encrypt`` sends it. Returns the
+    ``data_hash`` of the file and the number of it's unused challenges::
+
+        $ metatool challenges README.md -k 100
+        {
+          "challenges": 100,
+          "data_hash": "76cc2d5c077f440c8a422bec61070e3383807205845c8f6f..."
+        }
+
+-------------------
+
+**metatool nodes**
+
+    Returns the JSON list of the nodes in the order they are tried, with
+    the moving averages of their ``latency`` (in seconds) and
+    ``error_rate``, the numbers of ``calls`` and ``errors``, and whether
+    the node is ``healthy``::
+
+        [
+          {
+            "calls": 12,
+            "error_rate": 0.0,
+            "errors": 0,
+            "healthy": true,
+            "latency": 0.213,
+            "node": "http://node3.metadisk.org/"
+          },
+          ...
+        ]
+
 For more information about CLI look at the :ref:`metatool-CLI-reference`.
 
 -------------------
@@ -137,10 +323,7 @@ from __future__ import print_function
 import os.path
 import sys
 import argparse
-import string
-
-from btctxstore import BtcTxStore
-from requests.models import Response
+import json
 
 
 # makes available to import package from the source directory
@@ -152,6 +335,45 @@ import metatool.core
 CORE_NODES_URL = ('http://node2.metadisk.org/', 'http://node3.metadisk.org/')
 
 
+class LazyAttribute(object):
+    """
+    Placeholder of the module's attribute, used as the parser's default
+    value, so the module is imported only by the action which uses it.
+
+    :param module_name: full name of the module
+    :type module_name: string
+
+    :param name: name of the attribute
+    :type name: string
+    """
+
+    def __init__(self, module_name, name):
+        self.module_name = module_name
+        self.name = name
+
+    def resolve(self):
+        """
+        Import the module and get the attribute.
+        """
+        __import__(self.module_name)
+        return getattr(sys.modules[self.module_name], self.name)
+
+
+class LazyArgumentParser(argparse.ArgumentParser):
+    """
+    Argument parser, which resolves the ``LazyAttribute`` values of the
+    parsed arguments.
+    """
+
+    def parse_known_args(self, args=None, namespace=None):
+        namespace, extras = super(LazyArgumentParser, self).parse_known_args(
+            args, namespace)
+        for name, value in vars(namespace).items():
+            if isinstance(value, LazyAttribute):
+                setattr(namespace, name, value.resolve())
+        return namespace, extras
+
+
 def decryption_key_type(argument):
     """
     This is the special processor for the ``decryption_key`` argument's type
@@ -177,19 +399,81 @@ def decryption_key_type(argument):
     :rtype: string
 
     """
-    valid_key_lengths = (32, 48, 64)
     try:
-        if not all(chr_ in string.hexdigits for chr_ in argument):
-            raise TypeError('string has non-hexadecimal characters')
-        if not len(argument) in valid_key_lengths:
-            raise TypeError('key must be either %d, %d, or %d '
-                            'characters long, in the hexadecimal-'
-                            'string representation' % valid_key_lengths)
-    except TypeError as exc_:
+        from metatool.encryption import check_hex_key
+
+        check_hex_key(argument)
+    except ValueError as exc_:
         raise argparse.ArgumentTypeError(exc_)
     return argument
 
 
+def positive_int_type(argument):
+    """
+    This is the processor for the positive integer arguments' type of the
+    ``argparse.ArgumentParser.add_argument()`` method, i.e. the number
+    of workers.
+
+    :param argument: string representation of the integer
+    :type argument: string
+
+    :return: the integer value
+    :rtype: integer
+    """
+    try:
+        value = int(argument)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(
+            '{!r} is not a positive integer'.format(argument))
+    return value
+
+
+def non_negative_float_type(argument):
+    """
+    This is the processor for the non-negative float arguments' type of the
+    ``argparse.ArgumentParser.add_argument()`` method, i.e. the delay
+    in seconds.
+
+    :param argument: string representation of the number
+    :type argument: string
+
+    :return: the float value
+    :rtype: float
+    """
+    try:
+        value = float(argument)
+    except ValueError:
+        value = -1
+    if not value >= 0:
+        raise argparse.ArgumentTypeError(
+            '{!r} is not a non-negative number'.format(argument))
+    return value
+
+
+def positive_float_type(argument):
+    """
+    This is the processor for the positive float arguments' type of the
+    ``argparse.ArgumentParser.add_argument()`` method, i.e. the timeout
+    in seconds.
+
+    :param argument: string representation of the number
+    :type argument: string
+
+    :return: the float value
+    :rtype: float
+    """
+    try:
+        value = float(argument)
+    except ValueError:
+        value = 0
+    if not value > 0:
+        raise argparse.ArgumentTypeError(
+            '{!r} is not a positive number'.format(argument))
+    return value
+
+
 def parse():
     """
     Set of the parsing logic for the METATOOL.
@@ -198,8 +482,9 @@ def parse():
     :returns: fully configured ArgumentParser instance
     :rtype: argparse.ArgumentParser object
     """
-    # Create the top-level parser.
-    main_parser = argparse.ArgumentParser(
+    # Create the top-level parser. The batch and the challenges actions
+    # import their modules only when they are chosen.
+    main_parser = LazyArgumentParser(
         prog='METATOOL',
         description="This is the console app intended for interacting with "
                     "the MetaCore server.",
@@ -217,10 +502,30 @@ def parse():
                                    help='The URL-string which defines the '
                                         'server will be used.')
 
+    # The idempotent actions can be sent to several nodes at once.
+    parent_hedge_parser = argparse.ArgumentParser(
+        add_help=None
+    )
+    parent_hedge_parser.add_argument(
+        '--hedge', type=non_negative_float_type, metavar='DELAY',
+        help="Send the request to the next node too, when the previous one "
+             "hasn't answered in DELAY seconds (0 - to all nodes at once), "
+             "and take the first good answer.")
+
+    # Actions sending requests to the nodes can be limited in time.
+    parent_timeout_parser = argparse.ArgumentParser(
+        add_help=None
+    )
+    parent_timeout_parser.add_argument(
+        '--timeout', type=positive_float_type, metavar='SECONDS',
+        help="Give up, when the action hasn't got the answer from any node "
+             "in SECONDS.")
+
     # Create the parser for the "audit" command.
     parser_audit = subparsers.add_parser(
         'audit',
-        parents=[parent_url_parser],
+        parents=[parent_url_parser, parent_hedge_parser,
+                 parent_timeout_parser],
         help='It makes an request to the server with a view of calculating '
              'the SHA-256 hash of a file plus some seed.'
     )
@@ -234,7 +539,8 @@ def parse():
     # Create the parser for the "download" command.
     parser_download = subparsers.add_parser(
         'download',
-        parents=[parent_url_parser],
+        parents=[parent_url_parser, parent_hedge_parser,
+                 parent_timeout_parser],
         help='It performs the downloading of the file from the server'
              'by a given file_hash.'
     )
@@ -249,12 +555,16 @@ def parse():
     parser_download.add_argument('--link', action='store_true',
                                  help='If argument is present it will return '
                                       'an URL-string for manual downloading.')
+    parser_download.add_argument('--chunk_size', type=positive_int_type,
+                                 default=metatool.core.DOWNLOAD_CHUNK_SIZE,
+                                 help="Size of the chunks (in bytes) written "
+                                      "to the file while downloading.")
     parser_download.set_defaults(execute_case=metatool.core.download)
 
     # create the parser for the "upload" command.
     parser_upload = subparsers.add_parser(
         'upload',
-        parents=[parent_url_parser],
+        parents=[parent_url_parser, parent_timeout_parser],
         help='It uploads a local file to the server.'
     )
     parser_upload.add_argument('file_', type=argparse.FileType('rb'),
@@ -266,22 +576,167 @@ def parse():
     parser_upload.add_argument('-r', '--file_role', type=str, default='001',
                                help="It defines behaviour and access "
                                     "of the file.")
+    parser_upload.add_argument('--index', nargs='?', const=True,
+                               metavar='PATH',
+                               help="Use the local index of uploaded files "
+                                    "to skip hashing of unchanged files "
+                                    "(the default index in the state "
+                                    "directory, when PATH is omitted).")
+    parser_upload.add_argument('--dedup', action='store_true',
+                               help="Skip sending the file when the node "
+                                    "already stores it.")
+    parser_upload.add_argument('--challenges', type=positive_int_type,
+                               default=0, metavar='K',
+                               help="Bank K audit challenges of the "
+                                    "uploaded data for the later audits.")
     parser_upload.set_defaults(execute_case=metatool.core.upload)
 
     # create the parser for the "files" command.
     parser_files = subparsers.add_parser(
         'files',
-        parents=[parent_url_parser],
+        parents=[parent_url_parser, parent_hedge_parser,
+                 parent_timeout_parser],
         help="It gets the list with hashes of files on the server.")
     parser_files.set_defaults(execute_case=metatool.core.files)
 
     # create the parser for the "info" command.
     parser_info = subparsers.add_parser(
         'info',
-        parents=[parent_url_parser],
+        parents=[parent_url_parser, parent_hedge_parser,
+                 parent_timeout_parser],
         help="It gets the information about the server's application state.")
     parser_info.set_defaults(execute_case=metatool.core.info)
 
+    # create the parser for the "upload-dir" command.
+    parser_upload_dir = subparsers.add_parser(
+        'upload-dir',
+        parents=[parent_url_parser, parent_timeout_parser],
+        help='It uploads all files of the local directory tree to the server '
+             'with a pool of workers.'
+    )
+    parser_upload_dir.add_argument('directory', type=str,
+                                   help="A path to the directory.")
+    parser_upload_dir.add_argument('--encrypt', action='store_true',
+                                   help='If argument is present, files will '
+                                        'be encrypted and the '
+                                        '"decryption_key" values will be '
+                                        'added to the records')
+    parser_upload_dir.add_argument('-r', '--file_role', type=str,
+                                   default='001',
+                                   help="It defines behaviour and access "
+                                        "of the files.")
+    parser_upload_dir.add_argument('-w', '--workers', type=positive_int_type,
+                                   default=LazyAttribute('metatool.batch',
+                                                         'DEFAULT_WORKERS'),
+                                   help="Number of files uploaded at once.")
+    parser_upload_dir.add_argument('-o', '--output',
+                                   type=argparse.FileType('w'), default='-',
+                                   help="A file to write the JSON records "
+                                        "of results to (stdout by default).")
+    parser_upload_dir.add_argument('--index', nargs='?', const=True,
+                                   metavar='PATH',
+                                   help="Use the local index of uploaded "
+                                        "files to skip hashing of unchanged "
+                                        "files (the default index in the "
+                                        "state directory, when PATH is "
+                                        "omitted).")
+    parser_upload_dir.add_argument('--dedup', action='store_true',
+                                   help="Skip sending the files which the "
+                                        "node already stores.")
+    parser_upload_dir.add_argument('--challenges', type=positive_int_type,
+                                   default=0, metavar='K',
+                                   help="Bank K audit challenges of every "
+                                        "uploaded file for the later "
+                                        "audits.")
+    parser_upload_dir.add_argument('--hash-workers', type=positive_int_type,
+                                   default=0, metavar='N',
+                                   help="Number of processes hashing the "
+                                        "files ahead of the uploading.")
+    parser_upload_dir.set_defaults(
+        execute_case=LazyAttribute('metatool.batch', 'upload_dir'))
+
+    # create the parser for the "download-batch" command.
+    parser_download_batch = subparsers.add_parser(
+        'download-batch',
+        parents=[parent_url_parser, parent_timeout_parser],
+        help='It downloads all files of the list from the server '
+             'with a pool of workers.'
+    )
+    parser_download_batch.add_argument(
+        'hash_list', type=argparse.FileType('r'), nargs='?', default='-',
+        help="A file with lines of the file hash, optional decryption key "
+             "and optional new name of the file (stdin by default).")
+    parser_download_batch.add_argument(
+        '-w', '--workers', type=positive_int_type,
+        default=LazyAttribute('metatool.batch', 'DEFAULT_WORKERS'),
+        help="Number of files downloaded at once.")
+    parser_download_batch.add_argument(
+        '-o', '--output', type=argparse.FileType('w'), default='-',
+        help="A file to write the JSON records of results to "
+             "(stdout by default).")
+    parser_download_batch.set_defaults(
+        execute_case=LazyAttribute('metatool.batch', 'download_batch'))
+
+    # create the parser for the "audit-batch" command.
+    parser_audit_batch = subparsers.add_parser(
+        'audit-batch',
+        parents=[parent_url_parser, parent_timeout_parser],
+        help='It audits all files of the list on the server '
+             'with a pool of workers.'
+    )
+    parser_audit_batch.add_argument(
+        'audit_list', type=argparse.FileType('r'), nargs='?', default='-',
+        help="A file with lines of the file hash and the challenge seed "
+             "(stdin by default).")
+    parser_audit_batch.add_argument(
+        '-w', '--workers', type=positive_int_type,
+        default=LazyAttribute('metatool.batch', 'DEFAULT_WORKERS'),
+        help="Number of audits performed at once.")
+    parser_audit_batch.add_argument(
+        '-o', '--output', type=argparse.FileType('w'), default='-',
+        help="A file to write the JSON records of results to "
+             "(stdout by default).")
+    parser_audit_batch.add_argument(
+        '--verify', nargs='?', const=True, metavar='DIRECTORY',
+        help="Check the responses against the local copies of the files, "
+             "named after their hashes in the DIRECTORY, or the original "
+             "files from the index of the uploaded files, when the "
+             "DIRECTORY is omitted.")
+    parser_audit_batch.add_argument(
+        '--bank', action='store_true',
+        help="Take the challenges of the files listed without the seed "
+             "from the challenge bank, and verify the responses to the "
+             "banked challenges.")
+    parser_audit_batch.set_defaults(
+        execute_case=LazyAttribute('metatool.batch', 'audit_batch'))
+
+    # create the parser for the "challenges" command.
+    parser_challenges = subparsers.add_parser(
+        'challenges',
+        help="It banks the audit challenges of the local file.")
+    parser_challenges.add_argument('file_', type=argparse.FileType('rb'),
+                                   metavar='file',
+                                   help="A path to the file.")
+    parser_challenges.add_argument(
+        '-k', '--challenges', type=positive_int_type,
+        default=LazyAttribute('metatool.challenges', 'DEFAULT_CHALLENGES'),
+        metavar='K',
+        help="Number of the banked challenges.")
+    parser_challenges.add_argument(
+        '--encrypt', action='store_true',
+        help="Make the challenges for the encrypted data of the file, like "
+             "the encrypted upload sends it.")
+    parser_challenges.set_defaults(
+        execute_case=LazyAttribute('metatool.challenges', 'bank_file'))
+
+    # create the parser for the "nodes" command.
+    parser_nodes = subparsers.add_parser(
+        'nodes',
+        parents=[parent_url_parser],
+        help="It shows the nodes ranked by their latency and error rate.")
+    parser_nodes.set_defaults(
+        execute_case=LazyAttribute('metatool.scoreboard', 'report'))
+
     return main_parser
 
 
@@ -296,7 +751,9 @@ def show_data(source):
 
     :returns: None
     """
-    if isinstance(source, Response):
+    # the response exists only when the ``requests`` is already imported
+    models = sys.modules.get('requests.models')
+    if models is not None and isinstance(source, models.Response):
         print(source.status_code, source.text, sep='\n')
     else:
         print(source)
@@ -306,6 +763,10 @@ def args_prepare(required_args, parsed_args):
     """
     Filling all missed, but required by the core API function arguments.
     Return dictionary that will be passed to the API function.
+    The ``sender_key`` is the persistent one, look at the
+    ``metatool.identity.load_sender_key()``.
+    Optional arguments of the API function, which are absent in the
+    ``parsed_args``, are omitted to keep their default values.
 
     :param required_args: list of required argument's names for
         the API function
@@ -318,17 +779,24 @@ def args_prepare(required_args, parsed_args):
     :rtype: dictionary
     """
     prepared_args = {}
+    args_base = {}
     if 'sender_key' in required_args and 'btctx_api' in required_args:
+        from btctxstore import BtcTxStore
+        from metatool.identity import load_sender_key
+
         btctx_api = BtcTxStore(testnet=True, dryrun=True)
         args_base = dict(
-            sender_key=btctx_api.create_key(),
+            sender_key=load_sender_key(btctx_api),
             btctx_api=btctx_api,
         )
     for required_arg in required_args:
         try:
             prepared_args[required_arg] = getattr(parsed_args, required_arg)
         except AttributeError:
-            prepared_args[required_arg] = args_base[required_arg]
+            # Arguments which are neither parsed nor generated here are left
+            # to the default values of the API function.
+            if required_arg in args_base:
+                prepared_args[required_arg] = args_base[required_arg]
     return prepared_args
 
 
@@ -351,25 +819,46 @@ def get_all_func_args(function):
     return list(function.__code__.co_varnames[:function.__code__.co_argcount])
 
 
+def save_state(*states):
+    """
+    Save the nodes' statistics, like the ``metatool.scoreboard.Scoreboard``
+    and the ``metatool.breaker.CircuitBreaker``, to the state directory.
+    They are just the hints for the next runs, so the failed saving
+    doesn't break the action.
+
+    :param states: objects with the ``save()`` method
+    """
+    for state in states:
+        try:
+            state.save()
+        except EnvironmentError:
+            pass
+
+
 def main():
     """
     The main **MetaTool** CLI logic. It parses arguments, defines the type of
     action an appropriate API function, prepares parsed arguments and call
     the interact with appropriate Node MetaCore server.
     """
-    redirect_error_status = (400, 404, 500, 503)
+    parser = parse()
     if len(sys.argv) == 1:
-        parse().print_help()
+        parser.print_help()
         return
-    args = parse().parse_args()
+    args = parser.parse_args()
     required_args = get_all_func_args(args.execute_case)
 
-    if (args.execute_case == metatool.core.download
-            and args.link):
+    # The link is made without requests, so the nodes' statistics are
+    # neither loaded nor saved for it.
+    link_only = args.execute_case == metatool.core.download and args.link
+    if link_only:
         required_args.remove('btctx_api')
         required_args.remove('sender_key')
 
-    parsed_args = args_prepare(required_args, args)
+    # Actions without the "--url" don't send requests to the nodes.
+    if not hasattr(args, 'url_base'):
+        show_data(args.execute_case(**args_prepare(required_args, args)))
+        return
 
     # Get the url from the environment variable
     # or from the "--url" parsed argument
@@ -377,15 +866,55 @@ def main():
     used_nodes = (env_node,) if env_node else CORE_NODES_URL
     used_nodes = (args.url_base,) if args.url_base else used_nodes
 
-    result = "Sorry, no one server was visited. Check the provided `--url` " \
-             "argument or the `MEATADISKSERVER` environment variable"
-    for url_base in used_nodes:
-        parsed_args['url_base'] = url_base
-        result = args.execute_case(**parsed_args)
-        if isinstance(result, str):
-            break
-        elif isinstance(result, Response):
-            if result.status_code not in redirect_error_status:
-                break
-        continue
+    from metatool.nodes import call_hedged, call_with_failover
+    if link_only:
+        url_base, result = call_with_failover(
+            args.execute_case, used_nodes,
+            **args_prepare(required_args, args))
+        show_data(result)
+        return
+
+    from metatool.breaker import CircuitBreaker
+    from metatool.scoreboard import Scoreboard, report
+
+    # The fastest healthy node is tried first.
+    scoreboard = Scoreboard()
+    used_nodes = scoreboard.rank(used_nodes)
+
+    if args.execute_case == report:
+        show_data(report(scoreboard, used_nodes))
+        return
+
+    # The nodes failed several times in a row are skipped for a while.
+    breaker = CircuitBreaker()
+
+    # Batch actions walk through the nodes for each item by themselves.
+    if 'nodes' in required_args:
+        args.nodes = used_nodes
+        args.breaker = breaker
+        try:
+            summary = args.execute_case(**args_prepare(required_args, args))
+        finally:
+            save_state(breaker)
+        print(json.dumps(summary, sort_keys=True), file=sys.stderr)
+        return
+
+    parsed_args = args_prepare(required_args, args)
+    operation = scoreboard.timed(args.execute_case)
+    # The "--timeout" is the deadline shared by all tried nodes.
+    deadline = parsed_args.get('timeout')
+    try:
+        if getattr(args, 'hedge', None) is not None:
+            # the download from the slower nodes is cancelled by the first
+            # finished one
+            url_base, result = call_hedged(
+                operation, used_nodes, delay=args.hedge, breaker=breaker,
+                deadline=deadline, cancellable='cancel' in required_args,
+                **parsed_args)
+        else:
+            url_base, result = call_with_failover(
+                operation, used_nodes, breaker=breaker, deadline=deadline,
+                **parsed_args)
+    finally:
+        save_state(scoreboard, breaker)
     show_data(result)
@@ -3,27 +3,801 @@ This module represents MetaTool API - set of functions purposed for
 interaction with MetaCore cloud servers. Each function provides specific
 type of operation with the MetaCore server. Look through the functions for
 detailed specification.
+
+All functions are the shortcuts to the methods of the shared
+``MetaToolClient`` instance (see ``get_default_client()``), which keeps
+the HTTP connections to the nodes alive between the calls. Create your own
+``MetaToolClient`` to tune the connection pools or the default headers.
+
+The ``requests`` package is imported by the first created client and the
+encryption, upload index and challenges modules by the operations, which
+use them, so the module itself is cheap to import, i.e. for the CLI
+actions which don't send requests.
 """
 import sys
 import os
 import os.path
-import requests
-import tempfile
-import shutil
+import threading
+import time
 import json
 import binascii
+import string
 from hashlib import sha256
 
-import file_encryptor
+from metatool.hashing import sha256_file, iter_file_blocks, HASH_BLOCK_SIZE
+from metatool.multipart import MultipartEncoder
+from metatool.files_cache import FilesCache
+from metatool.signer import SignerRegistry, DEFAULT_CACHE_SIZE
+from metatool.retry import RetryPolicy
+from metatool.breaker import CircuitOpenError
+from metatool.nodes import is_node_error, is_node_failure
+from metatool.state import replace_file
 
 # 2.x/3.x compliance logic
 if sys.version_info.major == 3:
-    from urllib.parse import urljoin
+    from urllib.parse import urljoin, urlencode
 else:
     from urlparse import urljoin
+    from urllib import urlencode
+
+#: Default number of the per-node connection pools kept by the client.
+DEFAULT_POOL_CONNECTIONS = 10
+
+#: Default max number of the kept-alive connections to a single node.
+DEFAULT_POOL_MAXSIZE = 10
+
+#: Default seconds to wait for the connection to the node.
+DEFAULT_CONNECT_TIMEOUT = 10
+
+#: Default seconds to wait for the next bytes of the node's response.
+DEFAULT_READ_TIMEOUT = 60
+
+#: Default ``(connect, read)`` timeouts of the client's requests.
+DEFAULT_TIMEOUT = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+
+#: Default size of the chunks (in bytes) written to the downloaded file.
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+#: Suffix of the partial file, where the body is written while downloading.
+PART_SUFFIX = '.part'
+
+
+class DownloadError(IOError):
+    """
+    The downloaded file is incomplete or doesn't match it's ``file_hash``.
+    """
+
+
+class DownloadConflictError(DownloadError):
+    """
+    The same file is already being downloaded by this process, i.e. from
+    the other node by the hedged request. It isn't the node's failure.
+    """
+    node_failure = False
+
+
+class DownloadCancelledError(DownloadError):
+    """
+    The downloading is cancelled, i.e. because the file is already got from
+    the other node by the hedged request. It isn't the node's failure.
+    """
+    node_failure = False
+
+
+#: Partial files, which are being written by the downloads of this process.
+_active_parts = set()
+_active_parts_lock = threading.Lock()
+
+
+def _is_sha256_hex(value):
+    """
+    Check whether the string looks like the SHA-256 hex-digest.
+    """
+    return len(value) == 64 and all(chr_ in string.hexdigits
+                                    for chr_ in value)
+
+
+def _limit_timeout(timeout, budget):
+    """
+    Cut the ``(connect, read)`` timeouts of the request down to the time
+    budget left for it.
+    """
+    if not isinstance(timeout, tuple):
+        timeout = timeout, timeout
+    return tuple(budget if value is None else min(value, budget)
+                 for value in timeout)
+
+
+def _expected_size(response, offset):
+    """
+    Get the full size of the downloaded file from the "Content-Range" header
+    of the partial response or the "Content-Length" of the full one.
+
+    :returns: size of the file in bytes, or ``None`` when it's unknown
+    :rtype: integer
+    :raises DownloadError: if the range doesn't start at the ``offset``
+    """
+    content_range = response.headers.get('Content-Range')
+    if response.status_code == 206 and content_range:
+        range_, _, total = content_range.split(' ')[-1].partition('/')
+        if int(range_.split('-')[0]) != offset:
+            raise DownloadError('unexpected Content-Range: ' + content_range)
+        return None if total == '*' else int(total)
+    content_length = response.headers.get('Content-Length')
+    if content_length is None:
+        return None
+    return offset + int(content_length)
+
+
+class MetaToolClient(object):
+    """
+    Client of the MetaCore nodes, which owns the configured
+    ``requests.Session``. The session keeps a separate pool of kept-alive
+    connections for each node, so the sequential and concurrent calls of the
+    client's methods reuse already established connections instead of
+    opening a new one for every request. One instance can be shared by
+    several threads. The client also caches the nodes' lists of files,
+    used by the ``has()`` method.
+
+    Every request waits for the node no longer than the client's
+    ``timeout``. The operations also take the ``timeout`` argument - the
+    time budget of the whole operation, which cuts the timeouts of it's
+    requests down, and stops the downloading when it's over.
+
+    The requests failed with the transient errors are sent again by the
+    client's ``retry`` policy. The uploading changes the node's state, so
+    it's retried only when the node surely hasn't processed it.
+
+    :param pool_connections: number of the per-node connection pools
+        to keep
+
+        (optional, default: ``DEFAULT_POOL_CONNECTIONS``)
+    :type pool_connections: integer
+
+    :param pool_maxsize: max number of the kept-alive connections to
+        a single node
+
+        (optional, default: ``DEFAULT_POOL_MAXSIZE``)
+    :type pool_maxsize: integer
+
+    :param headers: headers added to every request made by the client
+
+        (optional, default: None)
+    :type headers: dictionary
+
+    :param session: already configured session to use instead of the new one
+
+        (optional, default: None)
+    :type session: requests.Session object
+
+    :param files_cache: cache of the nodes' lists of files, ``True`` for
+        the new cache saved in the state directory, or ``False`` to request
+        the list on every check. Look at the ``metatool.files_cache``
+        module.
+
+        (optional, default: True)
+    :type files_cache: metatool.files_cache.FilesCache object or boolean
+
+    :param signer_cache_size: max number of the addresses and signatures
+        cached per ``btctx_api`` instance. Look at the ``metatool.signer``
+        module.
+
+        (optional, default: ``metatool.signer.DEFAULT_CACHE_SIZE``)
+    :type signer_cache_size: integer
+
+    :param timeout: the ``(connect, read)`` timeouts of the requests in
+        seconds, the single timeout for both, or ``None`` to wait forever.
+        The given ``session`` sends the requests with it's own timeouts,
+        except the ones cut down by the operations' ``timeout``.
+
+        (optional, default: ``DEFAULT_TIMEOUT``)
+    :type timeout: tuple or number
+
+    :param retry: policy of retrying the failed requests, ``True`` for the
+        default ``metatool.retry.RetryPolicy()``, or ``False`` to not
+        retry. Look at the ``metatool.retry`` module.
+
+        (optional, default: True)
+    :type retry: metatool.retry.RetryPolicy object or boolean
+
+    :param breaker: circuit breaker of the nodes, which fails the requests
+        to the skipped nodes with the ``CircuitOpenError`` and counts the
+        connection errors and the server error responses of the others.
+        Don't pass the breaker, which is given to the
+        ``metatool.nodes`` failover of the client's operations too: it
+        checks and counts the same calls itself.
+
+        (optional, default: None - no breaker)
+    :type breaker: metatool.breaker.CircuitBreaker object
+    """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, headers=None,
+                 session=None, files_cache=True,
+                 signer_cache_size=DEFAULT_CACHE_SIZE,
+                 timeout=DEFAULT_TIMEOUT, retry=True, breaker=None):
+        import requests
+        from metatool.transport import TimeoutHTTPAdapter
+
+        if session is None:
+            session = requests.Session()
+            adapter = TimeoutHTTPAdapter(
+                timeout=timeout,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        if headers:
+            session.headers.update(headers)
+        self.session = session
+        self.timeout = timeout
+        self.retry = RetryPolicy() if retry is True else retry or None
+        self.breaker = breaker
+        if files_cache is True:
+            files_cache = FilesCache()
+        self.files_cache = files_cache or None
+        self.signers = SignerRegistry(signer_cache_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close all connections kept by the client's session.
+        """
+        self.session.close()
+
+    def _auth_headers(self, sender_key, btctx_api, data_hash):
+        """
+        Generate the credential headers for the request about the file.
+        The address and the signature are cached by the client's
+        ``signers``.
+
+        :returns: dictionary with the "sender-address" and "signature"
+        :rtype: dictionary
+        """
+        signer = self.signers.get(btctx_api)
+        return {
+            'sender-address': signer.get_address(sender_key),
+            'signature': signer.sign_unicode(sender_key, data_hash),
+        }
+
+    def _timeout_options(self, timeout):
+        """
+        Get the keyword arguments of the request, which limit it by the
+        ``timeout`` budget of the operation.
+
+        :returns: dictionary with the "timeout", or the empty one to use
+            the default timeouts
+        :rtype: dictionary
+        :raises requests.exceptions.Timeout: if the budget is already over
+        """
+        import requests
+
+        if timeout is None:
+            return {}
+        if timeout <= 0:
+            # the requests can't be sent with the non-positive timeouts
+            raise requests.exceptions.Timeout(
+                'time budget of the operation is over')
+        return dict(timeout=_limit_timeout(self.timeout, timeout))
+
+    def _send(self, method, url, timeout=None, idempotent=True,
+              url_base=None, **kwargs):
+        """
+        Send the request with the session, retrying it by the client's
+        ``retry`` policy. The file-like body is rewound for every attempt.
+        The request with the ``url_base`` is checked and counted by the
+        client's ``breaker``.
+
+        :param method: name of the session's method, i.e. 'get'
+        :type method: string
+
+        :param url: URL-string of the request
+        :type url: string
+
+        :param timeout: time budget of the request with the retries
+
+        :param idempotent: whether the request can be repeated safely
+
+        :param url_base: URL-string of the node
+
+        :param kwargs: other arguments of the session's method
+
+        :returns: the response of the last attempt
+        :rtype: requests.models.Response object
+        :raises metatool.breaker.CircuitOpenError: if the node's circuit
+            is open
+        """
+        body = kwargs.get('data')
+        breaker = self.breaker if url_base is not None else None
+
+        def send(budget):
+            if hasattr(body, 'seek'):
+                body.seek(0)
+            return getattr(self.session, method)(
+                url, **dict(kwargs, **self._timeout_options(budget)))
+
+        if breaker is not None and not breaker.allow(url_base):
+            raise CircuitOpenError(
+                'The node is skipped, because it has failed several times '
+                'in a row: {}'.format(url_base))
+        try:
+            if self.retry is None:
+                response = send(timeout)
+            else:
+                response = self.retry.call(send, idempotent, timeout)
+        except EnvironmentError as error:
+            if breaker is not None and is_node_error(error):
+                breaker.record(url_base, False)
+            raise
+        if breaker is not None:
+            breaker.record(url_base, not is_node_failure(response))
+        return response
+
+    def audit(self, url_base, sender_key, btctx_api, file_hash, seed,
+              timeout=None):
+        """
+        Perform the ``audit`` request. Look at the ``metatool.core.audit()``
+        for the arguments specification.
+        """
+        # the audit doesn't change the node's state
+        response = self._send(
+            'post',
+            urljoin(url_base, '/api/audit/'),
+            timeout,
+            url_base=url_base,
+            data={
+                'data_hash': file_hash,
+                'challenge_seed': seed,
+            },
+            headers=self._auth_headers(sender_key, btctx_api, file_hash)
+        )
+        return response
+
+    def download(self, url_base, file_hash, sender_key=None, btctx_api=None,
+                 rename_file=None, decryption_key=None, link=False,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE, timeout=None, cancel=None):
+        """
+        Perform the ``download`` operation. Look at the
+        ``metatool.core.download()`` for the arguments specification.
+        """
+        if link:
+            return download_link(url_base, file_hash, rename_file,
+                                 decryption_key)
+        expires_at = None if timeout is None else time.time() + timeout
+        url_for_requests = urljoin(url_base, '/api/files/' + file_hash)
+
+        # dict where to collect GET parameters
+        params = {}
+        if rename_file:
+            params['file_alias'] = rename_file
+
+        data_for_requests = dict(params=params, stream=True)
+
+        if sender_key or btctx_api:
+            if not (sender_key and btctx_api):
+                raise TypeError("arguments 'sender_key' and 'btctx_api' "
+                                "should be provided together")
+            else:
+                data_for_requests['headers'] = self._auth_headers(
+                    sender_key, btctx_api, file_hash)
+
+        part_name = os.path.abspath(rename_file or file_hash) + PART_SUFFIX
+        offset = os.path.getsize(part_name) \
+            if os.path.isfile(part_name) else 0
+        if offset:
+            data_for_requests['headers'] = dict(
+                data_for_requests.get('headers', {}),
+                Range='bytes={}-'.format(offset)
+            )
+
+        response = self._send(
+            'get',
+            url_for_requests,
+            timeout,
+            url_base=url_base,
+            **data_for_requests
+        )
+        if response.status_code == 416 and offset:
+            # The partial file is not a prefix of the stored one,
+            # so start from scratch.
+            response.close()
+            os.remove(part_name)
+            return self.download(
+                url_base, file_hash, sender_key, btctx_api, rename_file,
+                decryption_key, chunk_size=chunk_size,
+                timeout=None if expires_at is None else
+                max(expires_at - time.time(), 0), cancel=cancel)
+        if response.status_code in (200, 206):
+            if response.status_code == 200:
+                offset = 0
+            # The same file may be downloaded from several nodes at once,
+            # i.e. by the hedged requests, but only one of them writes it.
+            with _active_parts_lock:
+                if cancel is not None and cancel.is_set():
+                    response.close()
+                    raise DownloadCancelledError(
+                        'download of {} is cancelled'.format(file_hash))
+                if part_name in _active_parts:
+                    response.close()
+                    raise DownloadConflictError(
+                        '{} is already being downloaded'.format(file_hash))
+                _active_parts.add(part_name)
+            try:
+                file_name = os.path.abspath(response.headers['X-Sendfile'])
+                for download_dir in set([os.path.dirname(file_name),
+                                         os.path.dirname(part_name)]):
+                    if download_dir:
+                        if not os.path.exists(download_dir):
+                            os.makedirs(download_dir)
+                self._write_part(response, part_name, offset, file_hash,
+                                 chunk_size, decryption_key, expires_at,
+                                 cancel)
+                replace_file(part_name, file_name)
+            finally:
+                with _active_parts_lock:
+                    _active_parts.discard(part_name)
+            return file_name
+        else:
+            # read the error body to release the connection to the pool
+            response.content
+            return response
+
+    @staticmethod
+    def _write_part(response, part_name, offset, file_hash, chunk_size,
+                    decryption_key=None, expires_at=None, cancel=None):
+        """
+        Write the streamed body of the response to the partial file, after
+        the first ``offset`` bytes of it, and check the whole file's size
+        and, when the ``file_hash`` is a SHA-256 hex-digest, it's hash.
+
+        With the ``decryption_key`` chunks are decrypted before writing, so
+        the partial file holds the plain data only. The hash is checked
+        against the received (encrypted) data, so the already written part
+        is encrypted back while hashing it.
+
+        When the body is broken or the ``expires_at`` time has come, the
+        partial file is left in place for the resuming. When the written
+        data is wrong or the ``cancel`` event is set, the file is removed.
+
+        :raises DownloadError: if the file is incomplete or corrupted
+        :raises DownloadCancelledError: if the ``cancel`` event is set
+        """
+        from metatool.encryption import StreamCipher
+
+        expected_size = _expected_size(response, offset)
+        data_hash = sha256() if _is_sha256_hex(file_hash) else None
+        key = binascii.unhexlify(decryption_key) if decryption_key else None
+        if offset and data_hash:
+            cipher = StreamCipher(key) if key else None
+            with open(part_name, 'rb') as fp:
+                for block in iter_file_blocks(fp):
+                    data_hash.update(cipher.transform(block)
+                                     if cipher else block)
+        cipher = StreamCipher(key, offset) if key else None
+        with open(part_name, 'ab' if offset else 'wb') as fp:
+            for chunk in response.iter_content(chunk_size):
+                if cancel is not None and cancel.is_set():
+                    break
+                if data_hash:
+                    data_hash.update(chunk)
+                offset += len(chunk)
+                fp.write(cipher.transform(chunk) if cipher else chunk)
+                if expires_at is not None and time.time() > expires_at:
+                    response.close()
+                    raise DownloadError(
+                        'download of {} has timed out: {} bytes received, '
+                        'call the download again to resume it'.format(
+                            file_hash, offset))
+        if cancel is not None and cancel.is_set():
+            # the file is already got from the other node
+            response.close()
+            os.remove(part_name)
+            raise DownloadCancelledError(
+                'download of {} is cancelled'.format(file_hash))
+        if expected_size is not None and offset != expected_size:
+            raise DownloadError(
+                'incomplete download of {}: {} of {} bytes received, call '
+                'the download again to resume it'.format(
+                    file_hash, offset, expected_size))
+        if data_hash and data_hash.hexdigest() != file_hash.lower():
+            os.remove(part_name)
+            raise DownloadError(
+                'downloaded data of {} has the wrong SHA-256 hash {}'.format(
+                    file_hash, data_hash.hexdigest()))
+
+    def upload(self, url_base, sender_key, btctx_api, file_, file_role,
+               encrypt=False, block_size=HASH_BLOCK_SIZE, use_mmap=False,
+               index=None, dedup=False, timeout=None, challenges=0,
+               bank=True, digest=None):
+        """
+        Perform the ``upload`` operation. Look at the
+        ``metatool.core.upload()`` for the arguments specification.
+        """
+        # the encryption, the index and the bank pull the Crypto and the
+        # sqlite3, which the other operations don't need
+        from metatool.encryption import EncryptingReader, convergent_key
+        from metatool.upload_index import (UploadIndex, file_identity,
+                                           open_index)
+        from metatool.challenges import (ChallengeBank, hash_with_challenges,
+                                         open_bank)
+
+        own_index = bool(index) and not isinstance(index, UploadIndex)
+        index = open_index(index)
+        if not challenges:
+            bank = None
+        own_bank = bool(bank) and not isinstance(bank, ChallengeBank)
+        bank = open_bank(bank)
+        try:
+            identity = file_identity(file_) if index else None
+            entry = digest or (index.lookup(identity, encrypt)
+                               if index else None)
+            decryption_key = None
+            try:
+                if encrypt:
+                    # The plain file is read three times - for the key, for
+                    # the hash of the encrypted data and while sending - but
+                    # it's encrypted on the fly and never copied.
+                    source_file = open(file_.name, 'rb')
+                    file_.close()
+                    file_ = source_file
+                    if entry:
+                        decryption_key = binascii.unhexlify(
+                            entry['decryption_key'])
+                    else:
+                        decryption_key = convergent_key(source_file, None,
+                                                        block_size, use_mmap)
+                    file_ = EncryptingReader(source_file, decryption_key)
+                    use_mmap = False
+                if bank:
+                    # the challenges are calculated by the same pass over
+                    # the data, so the index doesn't spare it
+                    data_hash, banked = hash_with_challenges(
+                        file_, challenges, block_size, use_mmap)
+                elif entry:
+                    data_hash = entry['data_hash']
+                else:
+                    data_hash = sha256_file(file_, block_size, use_mmap)
+                body = MultipartEncoder(
+                    [('data_hash', data_hash), ('file_role', file_role)],
+                    'file_data', file_, chunk_size=block_size
+                )
+                headers = self._auth_headers(sender_key, btctx_api,
+                                             data_hash)
+                headers['Content-Type'] = body.content_type
+
+                if dedup and self.has(url_base, data_hash, timeout):
+                    response = dedup_response(url_base, data_hash,
+                                              file_role)
+                else:
+                    response = self._send(
+                            'post',
+                            urljoin(url_base, '/api/files/'),
+                            timeout,
+                            idempotent=False,
+                            url_base=url_base,
+                            data=body,
+                            headers=headers
+                    )
+            finally:
+                file_.close()
+            if response.status_code == 201:
+                if self.files_cache is not None:
+                    self.files_cache.add(url_base, data_hash)
+                if index:
+                    index.add(identity, encrypt, data_hash, file_role,
+                              url_base, decryption_key)
+                if bank:
+                    bank.add(data_hash, banked)
+                if decryption_key:
+                    add_decryption_key(response, decryption_key)
+        finally:
+            if own_index:
+                index.close()
+            if own_bank:
+                bank.close()
 
+        return response
+
+    def files(self, url_base, timeout=None):
+        """
+        Get the list of files from the node. Look at the
+        ``metatool.core.files()`` for the arguments specification.
+        """
+        response = self._send('get', urljoin(url_base, '/api/files/'),
+                              timeout, url_base=url_base)
+        return response
+
+    def file_hashes(self, url_base, timeout=None):
+        """
+        Get the set of hashes of the files stored on the node. The list of
+        files is taken from the client's ``files_cache`` while it's fresh,
+        and is revalidated with the conditional request after that.
+
+        :param url_base: URL-string which defines the server will be used
+        :type url_base: string
+
+        :param timeout: time budget of the request in seconds
+
+            (optional, default: None - the client's ``timeout``)
+        :type timeout: number
+
+        :returns: set of the files' hashes, or ``None`` when the node
+            doesn't return the list
+        :rtype: frozenset
+        :raises ValueError: if the list isn't valid JSON
+        """
+        url = urljoin(url_base, '/api/files/')
+        if self.files_cache is None:
+            response = self._send('get', url, timeout, url_base=url_base)
+            if response.status_code != 200:
+                return None
+            return frozenset(response.json())
+        hashes = self.files_cache.fresh(url_base)
+        if hashes is None:
+            response = self._send(
+                'get', url, timeout, url_base=url_base,
+                headers=self.files_cache.request_headers(url_base))
+            hashes = self.files_cache.update(url_base, response)
+        return hashes
+
+    def has(self, url_base, data_hash, timeout=None):
+        """
+        Check whether the node already stores the file with the
+        ``data_hash``, looking through the node's list of files. Look at
+        the ``file_hashes()``.
+
+        :param url_base: URL-string which defines the server will be used
+        :type url_base: string
+
+        :param data_hash: hash of the file's data
+        :type data_hash: string
+
+        :param timeout: time budget of the request in seconds
+
+            (optional, default: None - the client's ``timeout``)
+        :type timeout: number
+
+        :returns: ``True`` if the file is on the node, ``False`` if it
+            isn't or the list of files isn't available
+        :rtype: boolean
+        """
+        import requests
+
+        try:
+            hashes = self.file_hashes(url_base, timeout)
+        except (requests.exceptions.RequestException, ValueError,
+                TypeError):
+            return False
+        return hashes is not None and data_hash in hashes
+
+    def info(self, url_base, timeout=None):
+        """
+        Get the node state information. Look at the
+        ``metatool.core.info()`` for the arguments specification.
+        """
+        response = self._send('get', urljoin(url_base, '/api/nodes/me/'),
+                              timeout, url_base=url_base)
+        return response
+
+
+def download_link(url_base, file_hash, rename_file=None, decryption_key=None):
+    """
+    Generate the GET-request URL-string to download the file manually.
+    Look at the ``link=True`` case of the ``metatool.core.download()``.
+
+    :returns: URL-string of the file on the server
+    :rtype: string
+    """
+    params = []
+    if rename_file:
+        params.append(('file_alias', rename_file))
+    if decryption_key:
+        params.append(('decryption_key', decryption_key))
+    url = urljoin(url_base, '/api/files/' + file_hash)
+    if params:
+        url += '?' + urlencode(params)
+    return url
+
+
+def add_decryption_key(response, decryption_key):
+    """
+    Add the ``decryption_key`` item to the JSON content of the successful
+    upload response.
+
+    :param response: response of the upload request with the 201 status
+    :type response: requests.models.Response object
+
+    :param decryption_key: bytes decryption key of the uploaded file
+    :type decryption_key: bytes
+
+    :returns: the same response object with the modified content
+    :rtype: requests.models.Response object
+    """
+    decryption_key = binascii.hexlify(decryption_key)
+    if sys.version_info.major == 3:
+        decryption_key = decryption_key.decode()
+    success_content_dict = response.json()
+    success_content_dict['decryption_key'] = decryption_key
+    new_content = json.dumps(success_content_dict, indent=2,
+                             sort_keys=True)
+    response._content = new_content.encode('ascii')
+    return response
+
+
+def dedup_response(url_base, data_hash, file_role):
+    """
+    Make the response of the upload request for the file, which is already
+    stored on the node, so the uploading of it's data was skipped. It looks
+    the same as the response of the successful uploading.
+
+    :param url_base: URL-string of the node
+    :type url_base: string
+
+    :param data_hash: hash of the file's data
+    :type data_hash: string
+
+    :param file_role: role of the file
+    :type file_role: string
+
+    :returns: response with the 201 status and the JSON content with the
+        ``data_hash`` and the ``file_role``
+    :rtype: requests.models.Response object
+    """
+    from requests.models import Response
+
+    response = Response()
+    response.status_code = 201
+    response.reason = 'CREATED'
+    response.url = urljoin(url_base, '/api/files/')
+    response.encoding = 'utf-8'
+    response.headers['Content-Type'] = 'application/json'
+    response._content = json.dumps(
+        dict(data_hash=data_hash, file_role=file_role),
+        indent=2, sort_keys=True
+    ).encode('ascii')
+    return response
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """
+    Get the ``MetaToolClient`` instance shared by the API functions of this
+    module. It is created on the first call.
+
+    :returns: the shared client instance
+    :rtype: metatool.core.MetaToolClient object
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = MetaToolClient()
+        return _default_client
 
-def audit(url_base, sender_key, btctx_api, file_hash, seed):
+
+def set_default_client(client):
+    """
+    Replace the ``MetaToolClient`` instance shared by the API functions of
+    this module, i.e. to use a differently configured client.
+
+    :param client: new shared client, or ``None`` to create the default one
+        on the next call of an API function
+    :type client: metatool.core.MetaToolClient object
+    """
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
+
+
+def audit(url_base, sender_key, btctx_api, file_hash, seed, timeout=None):
     """It make an request to the server with a view of calculating
     the SHA-256 hash of a file plus some seed.
     Return the response object with information about the server-error
@@ -47,28 +821,23 @@ def audit(url_base, sender_key, btctx_api, file_hash, seed):
         to the file data to generate a challenge response
     :type seed: string
 
+    :param timeout: time budget of the operation in seconds, which cuts
+        the timeouts of it's requests down (look at the ``MetaToolClient``)
+
+        (optional, default: None - the client's timeouts only)
+    :type timeout: number
+
     :returns: response instance with the results of challenge or with
         information about the server issue
     :rtype: requests.models.Response object
     """
-    signature = btctx_api.sign_unicode(sender_key, file_hash)
-    sender_address = btctx_api.get_address(sender_key)
-    response = requests.post(
-        urljoin(url_base, '/api/audit/'),
-        data={
-            'data_hash': file_hash,
-            'challenge_seed': seed,
-        },
-        headers={
-            'sender-address': sender_address,
-            'signature': signature,
-        }
-    )
-    return response
+    return get_default_client().audit(url_base, sender_key, btctx_api,
+                                      file_hash, seed, timeout)
 
 
 def download(url_base, file_hash, sender_key=None, btctx_api=None,
-             rename_file=None, decryption_key=None, link=False):
+             rename_file=None, decryption_key=None, link=False,
+             chunk_size=DOWNLOAD_CHUNK_SIZE, timeout=None, cancel=None):
     """
     It performs the downloading of the file from the server
     by the given ``file_hash``.
@@ -79,6 +848,18 @@ def download(url_base, file_hash, sender_key=None, btctx_api=None,
     :note: The "link=True" case implies non-authenticated access to the
         file, available only for files with such values of ``roles``: 101, 001
 
+    The response body is streamed to the file by chunks of the
+    ``chunk_size`` bytes as they arrive, so the memory used by the
+    downloading doesn't depend on the size of the file.
+
+    The body is written to the partial file named after the ``rename_file``
+    (or the ``file_hash``) with the ``PART_SUFFIX``. When the downloading
+    is broken, the partial file remains and the next call for the same file
+    requests only the missing bytes with the "Range" header. The complete
+    file is checked against the size declared by the server and, when the
+    ``file_hash`` is a SHA-256 hex-digest, against the hash, and only then
+    atomically renamed into place.
+
     Will return the response object with information about the server-error,
     when such has occurred.
 
@@ -110,7 +891,9 @@ def download(url_base, file_hash, sender_key=None, btctx_api=None,
     :type rename_file: string
 
     :param decryption_key: key value, hexlify from bytes, which will be used to
-        decrypt file locally, or used as a GET-parameter, when ``link==True``
+        decrypt file locally, or used as a GET-parameter, when ``link==True``.
+        The data is decrypted chunk by chunk while downloading, so the
+        encrypted data is never written to the disk.
 
         (optional, default: None)
     :type decryption_key: string
@@ -121,6 +904,28 @@ def download(url_base, file_hash, sender_key=None, btctx_api=None,
         (optional, default: False)
     :type link: boolean
 
+    :param chunk_size: size of the chunks (in bytes) read from the response
+        and written to the file
+
+        (optional, default: ``DOWNLOAD_CHUNK_SIZE``)
+    :type chunk_size: integer
+
+    :param timeout: time budget of the downloading in seconds, which cuts
+        the timeouts of it's request down (look at the ``MetaToolClient``).
+        When it's over, the downloading is stopped and the partial file is
+        kept for resuming.
+
+        (optional, default: None - the client's timeouts only)
+    :type timeout: number
+
+    :param cancel: event, which stops the downloading, when it's set, i.e.
+        by the ``metatool.nodes.call_hedged()``, when the file is got from
+        the other node. The late response isn't written, and the partial
+        file written by the cancelled downloading is removed.
+
+        (optional, default: None - the downloading isn't cancelled)
+    :type cancel: threading.Event object
+
     :returns: full path to the file, if download done successfully
 
         :rtype: string
@@ -132,57 +937,28 @@ def download(url_base, file_hash, sender_key=None, btctx_api=None,
         while the downloading
 
         :rtype: requests.models.Response object
-    """
-    url_for_requests = urljoin(url_base, '/api/files/' + file_hash)
 
-    # dict where to collect GET parameters
-    params = {}
-    if rename_file:
-        params['file_alias'] = rename_file
-
-    data_for_requests = dict(params=params)
+    :raises DownloadError: if the downloaded file is incomplete or timed
+        out (the partial file is kept for resuming) or doesn't match the
+        ``file_hash``
+    :raises DownloadConflictError: if the same file is already being
+        downloaded by this process
+    :raises DownloadCancelledError: if the ``cancel`` event is set
+    """
     if link:
-        if decryption_key:
-            params['decryption_key'] = decryption_key
-        request = requests.Request('GET', url_for_requests,
-                                   **dict(params=params))
-        request_string = request.prepare()
-        return request_string.url
-
-    if sender_key or btctx_api:
-        if not (sender_key and btctx_api):
-            raise TypeError("arguments 'sender_key' and 'btctx_api' "
-                            "should be provided together")
-        else:
-            signature = btctx_api.sign_unicode(sender_key, file_hash)
-            sender_address = btctx_api.get_address(sender_key)
-            data_for_requests['headers'] = {
-                'sender-address': sender_address,
-                'signature': signature,
-            }
-
-    response = requests.get(
-        url_for_requests,
-        **data_for_requests
-    )
-    if response.status_code == 200:
-        file_name = os.path.abspath(response.headers['X-Sendfile'])
-        download_dir = os.path.dirname(file_name)
-        if download_dir:
-            if not os.path.exists(download_dir):
-                os.makedirs(download_dir)
-        with open(file_name, 'wb') as fp:
-            fp.write(response.content)
-        if decryption_key:
-            bytes_decryption_key = binascii.unhexlify(decryption_key)
-            file_encryptor.convergence.decrypt_file_inline(
-                        file_name, bytes_decryption_key)
-        return file_name
-    else:
-        return response
+        # the link is made without the client and it's connections
+        return download_link(url_base, file_hash, rename_file,
+                             decryption_key)
+    return get_default_client().download(url_base, file_hash, sender_key,
+                                         btctx_api, rename_file,
+                                         decryption_key, link, chunk_size,
+                                         timeout, cancel)
 
 
-def upload(url_base, sender_key, btctx_api, file_, file_role, encrypt=False):
+def upload(url_base, sender_key, btctx_api, file_, file_role, encrypt=False,
+           block_size=HASH_BLOCK_SIZE, use_mmap=False, index=None,
+           dedup=False, timeout=None, challenges=0, bank=True,
+           digest=None):
     """
     Upload local file to the server. Max size of file is determined by the
     server. In the most of cases it is restricted by the 128 MB.
@@ -193,7 +969,14 @@ def upload(url_base, sender_key, btctx_api, file_, file_role, encrypt=False):
     on the MetaCore server, so uploading supports the **encryption**.
     When ``encrypt=True``, to the returned JSON will be added the
     ``decryption_key``. It is an "hexadecimalised" value of the bytes
-    ``decryption_key`` value.
+    ``decryption_key`` value. The file is encrypted on the fly, while it's
+    hashed and sent, so neither the original file is changed, nor its
+    encrypted copy is stored on the disk.
+
+    The ``data_hash`` is calculated incrementally, by the blocks of
+    ``block_size`` bytes, and the request body is streamed to the server
+    by the chunks of the same size, so the memory used by the uploading
+    stays the same for the files of any size.
 
     :param url_base: URL-string which defines the server will be used
     :type url_base: string
@@ -219,61 +1002,79 @@ def upload(url_base, sender_key, btctx_api, file_, file_role, encrypt=False):
         behavior of the file on the server (look more it in the documentation)
     :type file_role: string
 
+    :param block_size: size of the blocks (in bytes) read from the file
+        while calculating the ``data_hash`` and sending the file
+
+        (optional, default: ``metatool.hashing.HASH_BLOCK_SIZE``)
+    :type block_size: integer
+
+    :param use_mmap: if ``True``, the file will be memory-mapped while
+        calculating the ``data_hash``, instead of being read by blocks
+
+        (optional, default: False)
+    :type use_mmap: boolean
+
+    :param index: local index of the uploaded files, the path to it's
+        database file, or ``True`` for the default one. The ``data_hash``
+        and the ``decryption_key`` of the file, which wasn't changed since
+        the previous successful upload, are taken from the index instead of
+        hashing the file again. Look at the ``metatool.upload_index``
+        module.
+
+        (optional, default: None - the index isn't used)
+    :type index: metatool.upload_index.UploadIndex object or string
+        or boolean
+
+    :param dedup: if ``True``, the node's list of files is checked before
+        sending the file, and when the node already stores the file with the
+        same ``data_hash`` (which is common with the convergent encryption),
+        the data isn't sent. The returned response looks the same as the
+        response of the successful uploading. The role of the stored file
+        isn't changed.
+
+        (optional, default: False)
+    :type dedup: boolean
+
+    :param timeout: time budget of the operation in seconds, which cuts
+        the timeouts of it's requests down (look at the ``MetaToolClient``)
+
+        (optional, default: None - the client's timeouts only)
+    :type timeout: number
+
+    :param challenges: number of the audit challenges of the uploaded
+        data, which are calculated by the same pass over the file as the
+        ``data_hash`` and saved to the ``bank`` for the later audits. Look
+        at the ``metatool.challenges`` module.
+
+        (optional, default: 0 - no challenges)
+    :type challenges: integer
+
+    :param bank: the challenge bank, the path to it's database file, or
+        ``True`` for the default one
+
+        (optional, default: True)
+    :type bank: metatool.challenges.ChallengeBank object or string
+        or boolean
+
+    :param digest: the ``data_hash`` and the hexadecimal
+        ``decryption_key`` of the file, calculated in advance, like the
+        ``metatool.hash_pool.file_digest()`` does, so the file isn't hashed
+        again
+
+        (optional, default: None - the file is hashed)
+    :type digest: dictionary
+
     :returns: response instance with the results of uploading or with
         information about the server issue
     :rtype: requests.models.Response object
     """
-    decryption_key = None
-    temp_dir_name = ''
-    try:
-        if encrypt:
-            source_file_name = file_.name
-            temp_dir_name = tempfile.mkdtemp(prefix='metatool.')
-            shutil.copy2(source_file_name, temp_dir_name)
-            temp_file_name = os.path.join(
-                temp_dir_name,
-                os.path.split(source_file_name)[-1])
-            decryption_key = file_encryptor.convergence.encrypt_file_inline(
-                        temp_file_name, None)
-            file_.close()
-            file_ = open(temp_file_name, 'rb')
-
-        file_.seek(0)
-        files_header = {'file_data': file_}
-        data_hash = sha256(file_.read()).hexdigest()
-        file_.seek(0)
-        sender_address = btctx_api.get_address(sender_key)
-        signature = btctx_api.sign_unicode(sender_key, data_hash)
-
-        response = requests.post(
-                urljoin(url_base, '/api/files/'),
-                data={
-                    'data_hash': data_hash,
-                    'file_role': file_role,
-                },
-                files=files_header,
-                headers={
-                    'sender-address': sender_address,
-                    'signature': signature,
-                }
-        )
-        file_.close()
-        if decryption_key and response.status_code == 201:
-            decryption_key = binascii.hexlify(decryption_key)
-            if sys.version_info.major == 3:
-                decryption_key = decryption_key.decode()
-            success_content_dict = response.json()
-            success_content_dict['decryption_key'] = decryption_key
-            new_content = json.dumps(success_content_dict, indent=2,
-                                     sort_keys=True)
-            response._content = new_content.encode('ascii')
-    finally:
-        shutil.rmtree(temp_dir_name, ignore_errors=True)
-
-    return response
+    return get_default_client().upload(url_base, sender_key, btctx_api, file_,
+                                       file_role, encrypt, block_size,
+                                       use_mmap, index, dedup, timeout,
+                                       challenges, bank, digest)
 
 
-def files(url_base):
+def files(url_base, timeout=None):
     """
     It executes a request to the "Node" server and returns response object
     with json-string - the list of hashes of downloaded files.
@@ -281,15 +1082,20 @@ def files(url_base):
     :param url_base: URL-string which defines the server will be used
     :type url_base: string
 
+    :param timeout: time budget of the operation in seconds, which cuts
+        the timeouts of it's requests down (look at the ``MetaToolClient``)
+
+        (optional, default: None - the client's timeouts only)
+    :type timeout: number
+
     :returns: response instance with a list of string - hashes of files
         available on the server or with information about the server issue
     :rtype: requests.models.Response object
     """
-    response = requests.get(urljoin(url_base, '/api/files/'))
-    return response
+    return get_default_client().files(url_base, timeout)
 
 
-def info(url_base):
+def info(url_base, timeout=None):
     """
     It executes a request to the "Node" server and returns response object
     with json-string - the information about server application state.
@@ -297,9 +1103,14 @@ def info(url_base):
     :param url_base: URL-string which defines the server will be used
     :type url_base: string
 
+    :param timeout: time budget of the operation in seconds, which cuts
+        the timeouts of it's requests down (look at the ``MetaToolClient``)
+
+        (optional, default: None - the client's timeouts only)
+    :type timeout: number
+
     :returns: response instance with node state information or with
         information about the server issue
     :rtype: requests.models.Response object
     """
-    response = requests.get(urljoin(url_base, '/api/nodes/me/'))
-    return response
+    return get_default_client().info(url_base, timeout)
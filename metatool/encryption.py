@@ -0,0 +1,166 @@
+"""
+This module contains helpers purposed for the streaming encryption and
+decryption of files, compatible with the file_encryptor_ library used by
+the MetaCore. The file_encryptor transforms a file inline with AES in the
+CTR mode (the counter starts at 1, no IV), so any part of the file can be
+transformed separately, knowing only it's offset. The helpers here work on
+the chunks of data as they are read or received, without the temporary
+copies of the file.
+
+.. _file_encryptor: https://pypi.python.org/pypi/file_encryptor/0.2.9
+"""
+import os
+import string
+
+from Crypto.Cipher import AES
+from Crypto.Util import Counter
+from file_encryptor import key_generators
+from file_encryptor.settings import DEFAULT_HMAC_PASSPHRASE
+
+from metatool.hashing import sha256_file, HASH_BLOCK_SIZE
+
+#: Size of the AES block in bytes.
+AES_BLOCK_SIZE = 16
+
+#: Lengths of the valid 16, 24 and 32 bytes keys in the hexadecimal string
+#: representation.
+HEX_KEY_LENGTHS = (32, 48, 64)
+
+
+def check_hex_key(hex_key):
+    """
+    Check that the hexadecimal string is the valid AES key, i.e. the
+    ``decryption_key`` returned by the ``metatool.core.upload()``.
+
+    :param hex_key: hexadecimal representation of the key
+    :type hex_key: string
+
+    :raises ValueError: if the string has non-hexadecimal characters or
+        the wrong length
+    """
+    if not all(chr_ in string.hexdigits for chr_ in hex_key):
+        raise ValueError('string has non-hexadecimal characters')
+    if not len(hex_key) in HEX_KEY_LENGTHS:
+        raise ValueError('key must be either %d, %d, or %d '
+                         'characters long, in the hexadecimal-'
+                         'string representation' % HEX_KEY_LENGTHS)
+
+
+class StreamCipher(object):
+    """
+    AES-CTR transformer of the file's data, which gives the same output as
+    the ``file_encryptor.convergence`` functions. In the CTR mode the
+    encryption and the decryption are the same operation.
+
+    :param key: bytes key, returned by the
+        ``file_encryptor.convergence.encrypt_file_inline()``
+    :type key: bytes
+
+    :param offset: position in the file of the first transformed byte
+
+        (optional, default: 0)
+    :type offset: integer
+    """
+
+    def __init__(self, key, offset=0):
+        if offset < 0:
+            raise ValueError("'offset' must not be negative")
+        self._aes = AES.new(
+            key, AES.MODE_CTR,
+            counter=Counter.new(128,
+                                initial_value=1 + offset // AES_BLOCK_SIZE)
+        )
+        self.offset = offset
+        skip = offset % AES_BLOCK_SIZE
+        if skip:
+            # drop the key stream bytes of the beginning of the block
+            self._aes.encrypt(b'\0' * skip)
+
+    def transform(self, data):
+        """
+        Encrypt or decrypt the next chunk of the file's data.
+
+        :param data: chunk, which follows the previously transformed one
+        :type data: bytes
+
+        :returns: transformed chunk of the same length
+        :rtype: bytes
+        """
+        self.offset += len(data)
+        return self._aes.encrypt(data)
+
+
+def convergent_key(file_, passphrase=None, block_size=HASH_BLOCK_SIZE,
+                   use_mmap=False):
+    """
+    Calculate the convergent encryption key of the file, the same as the
+    ``file_encryptor.convergence.encrypt_file_inline()`` does, but with one
+    incremental pass over the file object. Look at the
+    ``metatool.hashing.sha256_file()`` for the ``block_size`` and
+    ``use_mmap`` arguments.
+
+    :param ``file_``: file object opened in the 'rb' mode
+    :type ``file_``: file object
+
+    :param passphrase: passphrase of the keyed hash
+
+        (optional, default: None - the file_encryptor's default passphrase)
+    :type passphrase: string
+
+    :returns: bytes key
+    :rtype: bytes
+    """
+    if passphrase is None:
+        passphrase = DEFAULT_HMAC_PASSPHRASE
+    return key_generators.keyed_hash(
+        sha256_file(file_, block_size, use_mmap), passphrase)
+
+
+class EncryptingReader(object):
+    """
+    Read-only file-like wrapper, which encrypts the data of the wrapped file
+    as it's read. The encrypted file is never stored, so it can be hashed
+    and uploaded without the temporary copy of the file.
+
+    The reader supports ``read()``, ``seek()``, ``tell()``, ``len()`` and
+    ``close()``, so it can be passed as the file to the
+    ``metatool.hashing.sha256_file()`` and the
+    ``metatool.multipart.MultipartEncoder``. It has no ``fileno()``,
+    to prevent the memory-mapping of the plain data.
+
+    :param ``file_``: file object opened in the 'rb' mode
+    :type ``file_``: file object
+
+    :param key: bytes encryption key
+    :type key: bytes
+    """
+
+    def __init__(self, file_, key):
+        self.file_ = file_
+        self.key = key
+        self.name = getattr(file_, 'name', None)
+        self._cipher = StreamCipher(key, file_.tell())
+
+    def __len__(self):
+        return os.fstat(self.file_.fileno()).st_size
+
+    def read(self, size=-1):
+        """
+        Read and encrypt the next ``size`` bytes of the file, or the rest
+        of the file when ``size`` is negative.
+        """
+        return self._cipher.transform(self.file_.read(size))
+
+    def tell(self):
+        return self.file_.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.file_.seek(offset, whence)
+        self._cipher = StreamCipher(self.key, self.file_.tell())
+
+    def close(self):
+        self.file_.close()
+
+    @property
+    def closed(self):
+        return self.file_.closed
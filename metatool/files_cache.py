@@ -0,0 +1,222 @@
+"""
+This module contains the cache of the nodes' lists of files. The list
+returned by the ``/api/files/`` of the node may be large, while the most of
+the operations only need to know whether the node stores some file. The
+cache keeps the list of every node as a set of hashes, so the membership is
+checked in constant time, and saves it on the disk between the runs.
+
+The cached list is used without requests during the ``ttl`` seconds after
+it was got. Then it's revalidated with the conditional request, using the
+"ETag" and "Last-Modified" headers of the node's response, so the unchanged
+list isn't downloaded and parsed again.
+
+The lists are saved to the ``files-cache`` directory in the state directory
+(look at the ``metatool.state`` module), one JSON file per node.
+"""
+import hashlib
+import json
+import os
+import os.path
+import threading
+import time
+
+from metatool.state import state_path, write_file
+
+#: Name of the default cache directory in the state directory.
+DEFAULT_CACHE_DIR_NAME = 'files-cache'
+
+#: Default number of seconds the cached list is used without revalidation.
+DEFAULT_TTL = 60
+
+
+class FilesCache(object):
+    """
+    Thread-safe cache of the nodes' lists of files.
+
+    :param directory: path to the directory where the lists are saved, or
+        ``False`` to keep them in the memory only
+
+        (optional, default: the ``DEFAULT_CACHE_DIR_NAME`` directory in the
+        state directory)
+    :type directory: string or boolean
+
+    :param ttl: number of seconds the cached list is used without
+        revalidation on the node
+
+        (optional, default: ``DEFAULT_TTL``)
+    :type ttl: number
+    """
+
+    def __init__(self, directory=None, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _entry_path(self, url_base):
+        """
+        Get the path to the file of the node's list, or ``None`` when the
+        lists aren't saved.
+        """
+        if self.directory is False:
+            return None
+        directory = self.directory or state_path(DEFAULT_CACHE_DIR_NAME)
+        name = hashlib.sha1(url_base.encode('utf-8')).hexdigest()
+        return os.path.join(directory, name + '.json')
+
+    def _load(self, url_base):
+        """
+        Get the cached entry of the node, reading the saved one on the
+        first use.
+        """
+        entry = self._entries.get(url_base)
+        if entry is not None:
+            return entry
+        path = self._entry_path(url_base)
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as fp:
+                saved = json.load(fp)
+            entry = dict(saved, hashes=frozenset(saved['hashes']))
+        except (EnvironmentError, ValueError, KeyError, TypeError):
+            # broken entry is treated as missing
+            return None
+        if entry.get('url_base') != url_base:
+            return None
+        self._entries[url_base] = entry
+        return entry
+
+    def _save(self, url_base, entry):
+        """
+        Save the entry of the node to the memory and to the disk.
+        """
+        self._entries[url_base] = entry
+        path = self._entry_path(url_base)
+        if path is None:
+            return
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # it may be created by the concurrent process
+                if not os.path.isdir(directory):
+                    raise
+        write_file(path, json.dumps(
+            dict(entry, hashes=sorted(entry['hashes']))))
+
+    def fresh(self, url_base):
+        """
+        Get the cached list of the node, when it's younger than ``ttl``.
+
+        :param url_base: URL-string of the node
+        :type url_base: string
+
+        :returns: set of the files' hashes or ``None``, when the list must
+            be requested from the node
+        :rtype: frozenset
+        """
+        with self._lock:
+            entry = self._load(url_base)
+        if entry is None or time.time() - entry['fetched_at'] >= self.ttl:
+            return None
+        return entry['hashes']
+
+    def request_headers(self, url_base):
+        """
+        Get the headers of the conditional request of the node's list.
+
+        :param url_base: URL-string of the node
+        :type url_base: string
+
+        :returns: dictionary with the "If-None-Match" and the
+            "If-Modified-Since" headers, when they are known
+        :rtype: dictionary
+        """
+        with self._lock:
+            entry = self._load(url_base)
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def update(self, url_base, response):
+        """
+        Update the cached list of the node with the response of the
+        ``/api/files/`` request.
+
+        :param url_base: URL-string of the node
+        :type url_base: string
+
+        :param response: response of the (conditional) request of the list
+        :type response: requests.models.Response object
+
+        :returns: set of the files' hashes, or ``None`` when the response
+            has no list
+        :rtype: frozenset
+        :raises ValueError: if the body of the response isn't JSON
+        """
+        with self._lock:
+            entry = self._load(url_base)
+            if response.status_code == 304 and entry is not None:
+                entry = dict(entry, fetched_at=time.time())
+            elif response.status_code == 200:
+                entry = dict(
+                    url_base=url_base,
+                    hashes=frozenset(response.json()),
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    fetched_at=time.time(),
+                )
+            else:
+                return None
+            self._save(url_base, entry)
+            return entry['hashes']
+
+    def add(self, url_base, data_hash):
+        """
+        Add the just uploaded file to the cached list of the node, if there
+        is the one.
+
+        :param url_base: URL-string of the node
+        :type url_base: string
+
+        :param data_hash: hash of the uploaded file
+        :type data_hash: string
+        """
+        with self._lock:
+            entry = self._load(url_base)
+            if entry is None or data_hash in entry['hashes']:
+                return
+            self._save(url_base, dict(entry,
+                                      hashes=entry['hashes'] | {data_hash}))
+
+    def clear(self, url_base=None):
+        """
+        Remove the cached list of the node, or the lists of all nodes.
+
+        :param url_base: URL-string of the node
+
+            (optional, default: None - all lists are removed)
+        :type url_base: string
+        """
+        with self._lock:
+            if url_base is None:
+                self._entries.clear()
+                directory = os.path.dirname(self._entry_path('') or '')
+                if directory and os.path.isdir(directory):
+                    paths = [os.path.join(directory, name)
+                             for name in os.listdir(directory)
+                             if name.endswith('.json')]
+                else:
+                    paths = []
+            else:
+                self._entries.pop(url_base, None)
+                paths = [self._entry_path(url_base)]
+            for path in paths:
+                if path is not None and os.path.isfile(path):
+                    os.remove(path)
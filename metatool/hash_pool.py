@@ -0,0 +1,187 @@
+"""
+This module contains the hashing of local files on several cores. One
+SHA-256 stream can't be split, so the ``data_hash`` of the file is always
+calculated by one process, but the batches of files are hashed by the pool
+of processes - one file per process (look at the
+``metatool.batch.hash_files()``). The chunk-tree digest (look at the
+``metatool.hashing.ChunkTreeHash``) of the large file can be calculated by
+the pool of processes too, one chunk per process.
+
+The functions here are called in the worker processes, so they take the
+paths of the files instead of the file objects.
+"""
+import binascii
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+
+from metatool.encryption import EncryptingReader, convergent_key
+from metatool.hashing import (ChunkTreeHash, HASH_BLOCK_SIZE,
+                              TREE_CHUNK_SIZE, chunk_digest,
+                              iter_file_blocks, tree_root)
+
+#: Numbers of the worker processes compared by the ``benchmark()``.
+BENCHMARK_WORKERS = (1, 4, 16)
+
+
+def file_digest(path, encrypt=False, tree=False, block_size=HASH_BLOCK_SIZE,
+                use_mmap=True):
+    """
+    Calculate the ``data_hash`` of the file, the same as the
+    ``metatool.core.upload()`` does, with one pass over the data.
+
+    :param path: path to the file
+    :type path: string
+
+    :param encrypt: if ``True``, the hash of the encrypted data is
+        calculated, together with the ``decryption_key``
+
+        (optional, default: False)
+    :type encrypt: boolean
+
+    :param tree: if ``True``, the chunk-tree digest of the data is
+        calculated by the same pass
+
+        (optional, default: False)
+    :type tree: boolean
+
+    :param block_size: size of the blocks read from the file in bytes
+
+        (optional, default: ``metatool.hashing.HASH_BLOCK_SIZE``)
+    :type block_size: integer
+
+    :param use_mmap: if ``True``, the plain file is memory-mapped
+
+        (optional, default: True)
+    :type use_mmap: boolean
+
+    :returns: dictionary with the ``path``, the ``data_hash``, the
+        hexadecimal ``decryption_key`` (``None`` for the plain file) and the
+        ``tree_digest`` (when ``tree=True``), or with the ``error``
+        description, when the file can't be read
+    :rtype: dictionary
+    """
+    result = dict(path=path)
+    try:
+        with open(path, 'rb') as file_:
+            key = None
+            if encrypt:
+                key = convergent_key(file_, None, block_size, use_mmap)
+                file_ = EncryptingReader(file_, key)
+                use_mmap = False
+            data_hash = sha256()
+            tree_hash = ChunkTreeHash() if tree else None
+            for block in iter_file_blocks(file_, block_size, use_mmap):
+                data_hash.update(block)
+                if tree_hash:
+                    tree_hash.update(block)
+    except EnvironmentError as exc:
+        result['error'] = str(exc)
+        return result
+    result.update(
+        data_hash=data_hash.hexdigest(),
+        decryption_key=binascii.hexlify(key).decode() if key else None
+    )
+    if tree_hash:
+        result['tree_digest'] = tree_hash.hexdigest()
+    return result
+
+
+def read_chunk_digest(path, offset, size):
+    """
+    Get the leaf digest of the chunk of the file, look at the
+    ``metatool.hashing.chunk_digest()``.
+
+    :param path: path to the file
+    :type path: string
+
+    :param offset: position of the chunk in the file
+    :type offset: integer
+
+    :param size: size of the chunk in bytes
+    :type size: integer
+
+    :returns: digest of the chunk
+    :rtype: bytes
+    """
+    with open(path, 'rb') as file_:
+        file_.seek(offset)
+        return chunk_digest(file_.read(size))
+
+
+def tree_digest(path, chunk_size=None, workers=None):
+    """
+    Calculate the chunk-tree digest of the file (look at the
+    ``metatool.hashing.ChunkTreeHash``) with the pool of processes, which
+    hash the chunks of the file at once.
+
+    :param path: path to the file
+    :type path: string
+
+    :param chunk_size: size of the chunks in bytes
+
+        (optional, default: ``metatool.hashing.TREE_CHUNK_SIZE``)
+    :type chunk_size: integer
+
+    :param workers: number of the worker processes
+
+        (optional, default: None - the number of the CPUs)
+    :type workers: integer
+
+    :returns: hexadecimal chunk-tree digest of the file's content
+    :rtype: string
+    """
+    chunk_size = chunk_size or TREE_CHUNK_SIZE
+    offsets = range(0, os.path.getsize(path), chunk_size)
+    if len(offsets) <= 1 or workers == 1:
+        leaves = [read_chunk_digest(path, offset, chunk_size)
+                  for offset in offsets]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            leaves = list(executor.map(read_chunk_digest,
+                                       [path] * len(offsets), offsets,
+                                       [chunk_size] * len(offsets)))
+    return binascii.hexlify(tree_root(leaves)).decode()
+
+
+def benchmark(paths, workers=BENCHMARK_WORKERS, encrypt=False):
+    """
+    Measure the throughput of the ``metatool.batch.hash_files()`` on the
+    given files with the different numbers of the worker processes.
+
+    :param paths: paths to the hashed files
+    :type paths: sequence of strings
+
+    :param workers: numbers of the worker processes to compare
+
+        (optional, default: ``BENCHMARK_WORKERS``)
+    :type workers: sequence of integers
+
+    :param encrypt: if ``True``, the files are hashed encrypted
+
+        (optional, default: False)
+    :type encrypt: boolean
+
+    :returns: dictionaries with the number of ``workers``, the elapsed
+        ``seconds``, the throughput in ``mb_per_second`` and
+        ``files_per_second``, and the ``data_hashes`` of the files
+    :rtype: list of dictionaries
+    """
+    from metatool.batch import hash_files
+
+    total_size = sum(os.path.getsize(path) for path in paths)
+    results = []
+    for worker_count in workers:
+        start = time.time()
+        digests = list(hash_files(paths, worker_count, encrypt=encrypt))
+        elapsed = max(time.time() - start, 1e-9)
+        results.append(dict(
+            workers=worker_count,
+            seconds=round(elapsed, 3),
+            mb_per_second=round(total_size / elapsed / 2 ** 20, 1),
+            files_per_second=round(len(paths) / elapsed, 1),
+            data_hashes=dict((digest['path'], digest.get('data_hash'))
+                             for digest in digests),
+        ))
+    return results
@@ -0,0 +1,270 @@
+"""
+This module contains helpers purposed for the hashing of local files.
+All of them process a file with the blocks of bounded size, so the memory
+used while hashing doesn't depend on the size of the file.
+"""
+import binascii
+import mmap
+from hashlib import sha256
+
+#: Default size (in bytes) of the blocks read from a file while hashing it.
+HASH_BLOCK_SIZE = 64 * 1024
+
+#: Default size (in bytes) of the chunks of the chunk-tree digest.
+TREE_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def iter_file_blocks(file_, block_size=HASH_BLOCK_SIZE, use_mmap=False):
+    """
+    It walks through the whole content of the file object, from the very
+    beginning, and yields it by the blocks of ``block_size`` bytes at most.
+
+    When ``use_mmap=True`` the file is memory-mapped and blocks are sliced
+    from the map instead of being read with ``file_.read()``. Empty files,
+    and files which can't be mapped, are silently read in the usual way.
+
+    :param ``file_``: file object opened in the 'rb' mode
+    :type ``file_``: file object
+
+    :param block_size: max size of the yielded blocks in bytes
+
+        (optional, default: ``HASH_BLOCK_SIZE``)
+    :type block_size: integer
+
+    :param use_mmap: if ``True``, read the file through the ``mmap`` module
+
+        (optional, default: False)
+    :type use_mmap: boolean
+
+    :returns: generator of the file's content blocks
+    :rtype: generator of bytes
+    """
+    if block_size <= 0:
+        raise ValueError("'block_size' must be a positive integer")
+    file_.seek(0)
+    mapped = None
+    if use_mmap:
+        try:
+            mapped = mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, ValueError, EnvironmentError):
+            mapped = None
+    if mapped is None:
+        for block in iter(lambda: file_.read(block_size), b''):
+            yield block
+        return
+    try:
+        for offset in range(0, len(mapped), block_size):
+            yield mapped[offset:offset + block_size]
+    finally:
+        mapped.close()
+
+
+def _sha256_of_file(file_, block_size, use_mmap):
+    """
+    Feed the whole content of the file to the new SHA-256 hash object and
+    set the file position back to the start.
+
+    :returns: SHA-256 hash object
+    """
+    hash_obj = sha256()
+    for block in iter_file_blocks(file_, block_size, use_mmap):
+        hash_obj.update(block)
+    file_.seek(0)
+    return hash_obj
+
+
+def sha256_file(file_, block_size=HASH_BLOCK_SIZE, use_mmap=False):
+    """
+    Calculate the SHA-256 hex-digest of the whole content of the file
+    object incrementally, keeping only one block of the file in memory at
+    a time. After the hashing, the file position is set back to the start.
+
+    :param ``file_``: file object opened in the 'rb' mode
+    :type ``file_``: file object
+
+    :param block_size: size of the blocks read from the file in bytes
+
+        (optional, default: ``HASH_BLOCK_SIZE``)
+    :type block_size: integer
+
+    :param use_mmap: if ``True``, read the file through the ``mmap`` module
+
+        (optional, default: False)
+    :type use_mmap: boolean
+
+    :returns: SHA-256 hex-digest of the file's content
+    :rtype: string
+    """
+    return _sha256_of_file(file_, block_size, use_mmap).hexdigest()
+
+
+def challenge_response(file_, seed, block_size=HASH_BLOCK_SIZE,
+                       use_mmap=False):
+    """
+    Calculate the response to the audit challenge of the file, the same as
+    the MetaCore node does - the SHA-256 hex-digest of the whole content of
+    the file followed by the ``seed`` string. Look at the ``sha256_file()``
+    for the ``block_size`` and ``use_mmap`` arguments.
+
+    :param ``file_``: file object opened in the 'rb' mode
+    :type ``file_``: file object
+
+    :param seed: seed of the challenge
+    :type seed: string
+
+    :returns: SHA-256 hex-digest of the file's content plus the seed
+    :rtype: string
+    """
+    hash_obj = _sha256_of_file(file_, block_size, use_mmap)
+    hash_obj.update(seed.encode())
+    return hash_obj.hexdigest()
+
+
+def sha256_with_challenges(file_, seeds, block_size=HASH_BLOCK_SIZE,
+                           use_mmap=False):
+    """
+    Calculate the SHA-256 hex-digest of the file and the responses to the
+    audit challenges with the given ``seeds`` (look at the
+    ``challenge_response()``) with the single pass over the file. The seed
+    follows the data, so the hash of the data is copied for every seed at
+    the end, instead of hashing the data once per seed. Look at the
+    ``sha256_file()`` for the ``block_size`` and ``use_mmap`` arguments.
+
+    :param ``file_``: file object opened in the 'rb' mode
+    :type ``file_``: file object
+
+    :param seeds: seeds of the challenges
+    :type seeds: sequence of strings
+
+    :returns: SHA-256 hex-digest of the file's content and the list of
+        the challenge responses in the order of the ``seeds``
+    :rtype: tuple
+    """
+    hash_obj = _sha256_of_file(file_, block_size, use_mmap)
+    responses = []
+    for seed in seeds:
+        challenge_obj = hash_obj.copy()
+        challenge_obj.update(seed.encode())
+        responses.append(challenge_obj.hexdigest())
+    return hash_obj.hexdigest(), responses
+
+
+def tree_root(leaves):
+    """
+    Get the root of the binary hash tree over the digests of the chunks.
+    Every node is the SHA-256 of the ``0x01`` byte and it's children's
+    digests, the node without the pair is moved to the next level as is.
+
+    :param leaves: digests of the chunks, returned by the ``chunk_digest()``
+    :type leaves: sequence of bytes
+
+    :returns: digest of the root
+    :rtype: bytes
+    """
+    level = list(leaves) or [chunk_digest(b'')]
+    while len(level) > 1:
+        pairs = [level[i:i + 2] for i in range(0, len(level), 2)]
+        level = [sha256(b'\x01' + pair[0] + pair[1]).digest()
+                 if len(pair) == 2 else pair[0] for pair in pairs]
+    return level[0]
+
+
+def chunk_digest(chunk):
+    """
+    Get the leaf digest of the chunk tree - the SHA-256 of the ``0x00``
+    byte and the chunk, so the leaves never match the inner nodes.
+
+    :param chunk: data of the chunk
+    :type chunk: bytes
+
+    :returns: digest of the chunk
+    :rtype: bytes
+    """
+    return sha256(b'\x00' + chunk).digest()
+
+
+class ChunkTreeHash(object):
+    """
+    Incremental chunk-tree digest of the data, with the ``hashlib`` like
+    interface. The data is split into the chunks of ``chunk_size`` bytes,
+    which are hashed separately and combined by the ``tree_root()``, so
+    the chunks of the same file can be hashed on the different cores (look
+    at the ``metatool.hash_pool.tree_digest()``) and the changed chunk can
+    be found by comparing the leaves.
+
+    It's the digest for the local integrity checks only, the nodes know the
+    files by the plain SHA-256 ``data_hash``.
+
+    :param chunk_size: size of the chunks in bytes
+
+        (optional, default: ``TREE_CHUNK_SIZE``)
+    :type chunk_size: integer
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or TREE_CHUNK_SIZE
+        if self.chunk_size <= 0:
+            raise ValueError("'chunk_size' must be a positive integer")
+        self.leaves = []
+        self._chunk = sha256(b'\x00')
+        self._filled = 0
+
+    def update(self, data):
+        """
+        Hash the next part of the data.
+
+        :param data: data following the already hashed one
+        :type data: bytes
+        """
+        view = memoryview(data)
+        while len(view):
+            size = min(self.chunk_size - self._filled, len(view))
+            self._chunk.update(view[:size])
+            self._filled += size
+            view = view[size:]
+            if self._filled == self.chunk_size:
+                self.leaves.append(self._chunk.digest())
+                self._chunk = sha256(b'\x00')
+                self._filled = 0
+
+    def digest(self):
+        """
+        :returns: digest of the tree's root
+        :rtype: bytes
+        """
+        leaves = self.leaves
+        if self._filled or not leaves:
+            leaves = leaves + [self._chunk.digest()]
+        return tree_root(leaves)
+
+    def hexdigest(self):
+        """
+        :returns: hexadecimal digest of the tree's root
+        :rtype: string
+        """
+        return binascii.hexlify(self.digest()).decode()
+
+
+def chunk_tree_file(file_, chunk_size=None, block_size=HASH_BLOCK_SIZE,
+                    use_mmap=False):
+    """
+    Calculate the chunk-tree digest (look at the ``ChunkTreeHash``) of the
+    whole content of the file object. Look at the ``sha256_file()`` for the
+    ``block_size`` and ``use_mmap`` arguments.
+
+    :param ``file_``: file object opened in the 'rb' mode
+    :type ``file_``: file object
+
+    :param chunk_size: size of the chunks in bytes
+
+        (optional, default: ``TREE_CHUNK_SIZE``)
+    :type chunk_size: integer
+
+    :returns: hexadecimal chunk-tree digest of the file's content
+    :rtype: string
+    """
+    tree = ChunkTreeHash(chunk_size)
+    for block in iter_file_blocks(file_, block_size, use_mmap):
+        tree.update(block)
+    file_.seek(0)
+    return tree.hexdigest()
@@ -0,0 +1,90 @@
+"""
+This module keeps the sender's identity of the MetaTool CLI - the private
+key, which signs the requests to the nodes. The key is generated on the
+first use and saved to the ``sender.key`` file in the state directory
+(look at the ``metatool.state`` module), so every run of the CLI has the
+same sender address and doesn't spend time on the key generation.
+
+The key can also be given by the ``METATOOL_SENDER_KEY`` environment
+variable, which takes precedence over the saved one.
+"""
+import errno
+import os
+import tempfile
+
+from metatool.state import state_path
+
+#: Environment variable with the sender's private key.
+SENDER_KEY_ENV = 'METATOOL_SENDER_KEY'
+
+#: Name of the sender's key file in the state directory.
+SENDER_KEY_FILE_NAME = 'sender.key'
+
+
+def _read_key(path):
+    """
+    Read the key saved to the file.
+    """
+    with open(path) as fp:
+        return fp.read().strip()
+
+
+def _link_new_file(source, destination):
+    """
+    Give the ``source`` file the second name, unless the ``destination``
+    file already exists.
+
+    :raises OSError: with the ``errno.EEXIST``, if the destination exists
+    """
+    if hasattr(os, 'link'):
+        os.link(source, destination)
+        return
+    # Python 2 on Windows has no hard links, but it's rename doesn't
+    # replace the existing file either.
+    if os.path.exists(destination):
+        raise OSError(errno.EEXIST, 'File exists', destination)
+    os.rename(source, destination)
+
+
+def load_sender_key(btctx_api, path=None):
+    """
+    Get the sender's private key from the environment or from the key
+    file. When neither has it, the new key is generated and atomically
+    saved to the file, readable by the owner only.
+
+    :param btctx_api: API used to generate the new key
+    :type btctx_api: btctxstore.BtcTxStore object
+
+    :param path: path to the key file
+
+        (optional, default: the ``SENDER_KEY_FILE_NAME`` file in the state
+        directory)
+    :type path: string
+
+    :returns: private key
+    :rtype: string
+    """
+    key = os.environ.get(SENDER_KEY_ENV, '').strip()
+    if key:
+        return key
+    path = path or state_path(SENDER_KEY_FILE_NAME)
+    if os.path.isfile(path):
+        return _read_key(path)
+    key = btctx_api.create_key()
+    # The key is written to the temporary file and then linked into place,
+    # so the concurrent first runs never see the empty key file.
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(key + '\n')
+        _link_new_file(temp_path, path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+        # the key was saved by the concurrent process
+        return _read_key(path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return key
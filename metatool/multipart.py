@@ -0,0 +1,191 @@
+"""
+This module provides the streaming encoder of the "multipart/form-data"
+request bodies. The encoder knows the length of the whole body in advance
+and yields the uploaded file by chunks, so the body is never built in
+memory. An instance of ``MultipartEncoder`` can be passed as the ``data``
+argument of the ``requests`` calls directly.
+"""
+import os
+import sys
+import uuid
+
+#: Default size (in bytes) of the file chunks yielded by the encoder.
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _to_bytes(value):
+    """
+    Convert the text value to bytes with the "utf-8" encoding.
+
+    :param value: value of the form field
+    :type value: string or bytes
+
+    :returns: encoded value
+    :rtype: bytes
+    """
+    if isinstance(value, bytes):
+        return value
+    if sys.version_info.major == 2:
+        return unicode(value).encode('utf-8')  # noqa: F821
+    return str(value).encode('utf-8')
+
+
+def _stream_length(file_):
+    """
+    Get the size of the file object in bytes without reading it.
+
+    :param ``file_``: file object opened in the binary mode
+    :type ``file_``: file object
+
+    :returns: size of the file's content in bytes
+    :rtype: integer
+    """
+    if hasattr(file_, '__len__'):
+        return len(file_)
+    try:
+        return os.fstat(file_.fileno()).st_size
+    except (AttributeError, EnvironmentError):
+        position = file_.tell()
+        file_.seek(0, os.SEEK_END)
+        size = file_.tell()
+        file_.seek(position)
+        return size
+
+
+class MultipartEncoder(object):
+    """
+    Streaming "multipart/form-data" body with the set of text fields,
+    followed by the single file field.
+
+    The body is generated lazily: iteration over the instance (or the
+    sequential ``read()`` calls) yields the leading text parts, then the
+    file's content by the chunks of ``chunk_size`` bytes and the closing
+    boundary. ``len()`` of the instance is the exact ``Content-Length`` of
+    the body. Every new iteration, or ``seek(0)``, starts the body from the
+    beginning, so the same instance can be sent several times.
+
+    :param fields: sequence of the ``(name, value)`` pairs of text fields
+    :type fields: list of tuples
+
+    :param file_field: name of the form field with the file
+    :type file_field: string
+
+    :param ``file_``: file object opened in the 'rb' mode, or any object with
+        ``read(size)``, ``seek(0)`` and ``__len__()`` methods
+    :type ``file_``: file object
+
+    :param chunk_size: max size of the file's chunks in bytes
+
+        (optional, default: ``UPLOAD_CHUNK_SIZE``)
+    :type chunk_size: integer
+
+    :param boundary: boundary string of the body's parts
+
+        (optional, default: random hex-string)
+    :type boundary: string
+    """
+
+    def __init__(self, fields, file_field, file_,
+                 chunk_size=UPLOAD_CHUNK_SIZE, boundary=None):
+        if chunk_size <= 0:
+            raise ValueError("'chunk_size' must be a positive integer")
+        self.fields = list(fields)
+        self.file_field = file_field
+        self.file_ = file_
+        self.chunk_size = chunk_size
+        self.boundary = boundary or uuid.uuid4().hex
+
+        file_name = os.path.basename(getattr(file_, 'name', None) or
+                                     file_field)
+        head = b''
+        for name, value in self.fields:
+            head += self._part_header(
+                'form-data; name="{}"'.format(name)
+            ) + _to_bytes(value) + b'\r\n'
+        head += self._part_header(
+            'form-data; name="{}"; filename="{}"'.format(file_field, file_name)
+        )
+        self._head = head
+        self._tail = b'\r\n--' + _to_bytes(self.boundary) + b'--\r\n'
+        self._length = (len(self._head) + _stream_length(file_) +
+                        len(self._tail))
+        self._reader = None
+        self._buffer = b''
+        self._offset = 0
+        self._position = 0
+
+    def _part_header(self, disposition):
+        """
+        Build the leading boundary and headers of the body's part.
+
+        :param disposition: value of the "Content-Disposition" header
+        :type disposition: string
+
+        :returns: encoded headers of the part
+        :rtype: bytes
+        """
+        return (b'--' + _to_bytes(self.boundary) + b'\r\n' +
+                b'Content-Disposition: ' + _to_bytes(disposition) +
+                b'\r\n\r\n')
+
+    @property
+    def content_type(self):
+        """
+        Value of the "Content-Type" header for the request with this body.
+        """
+        return 'multipart/form-data; boundary={}'.format(self.boundary)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        self.file_.seek(0)
+        yield self._head
+        for chunk in iter(lambda: self.file_.read(self.chunk_size), b''):
+            yield chunk
+        yield self._tail
+
+    def read(self, size=-1):
+        """
+        Read the next ``size`` bytes of the body, or the rest of the body
+        when ``size`` is negative. Returns an empty bytes string at the end.
+        """
+        if self._reader is None:
+            self._reader = iter(self)
+        # the read part of the buffer is skipped by the offset, instead of
+        # copying the rest of the buffer on every small read
+        while size < 0 or len(self._buffer) - self._offset < size:
+            chunk = next(self._reader, None)
+            if chunk is None:
+                break
+            if self._offset:
+                self._buffer = self._buffer[self._offset:]
+                self._offset = 0
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer) - self._offset
+        data = self._buffer[self._offset:self._offset + size]
+        self._offset += len(data)
+        if self._offset == len(self._buffer):
+            self._buffer = b''
+            self._offset = 0
+        self._position += len(data)
+        return data
+
+    def tell(self):
+        """
+        Get the number of bytes already consumed by the ``read()`` calls.
+        """
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """
+        Rewind the body to the beginning. Only ``seek(0)`` is supported.
+        """
+        if offset != 0 or whence != os.SEEK_SET:
+            raise IOError('MultipartEncoder can only be rewound '
+                          'to the beginning')
+        self._reader = None
+        self._buffer = b''
+        self._offset = 0
+        self._position = 0
@@ -0,0 +1,315 @@
+"""
+This module contains the logic of walking through several MetaCore nodes:
+an operation is tried on the nodes one after another, until one of them
+returns an acceptable result. It's shared by the ``metatool`` CLI and the
+batch operations of the ``metatool.batch`` module.
+
+For the idempotent operations the nodes can also be tried concurrently
+with the ``call_hedged()``, so a slow failing node doesn't delay the
+request to the next one.
+
+Both of them accept the ``breaker`` - the
+``metatool.breaker.CircuitBreaker``, which skips the nodes failed several
+times in a row, and the ``deadline`` - the time budget of the whole call,
+which is shared by the nodes: each node gets only what is left of it.
+"""
+import sys
+import threading
+import time
+
+if sys.version_info.major == 3:
+    import queue
+else:
+    import Queue as queue
+
+from metatool.breaker import CircuitOpenError
+
+#: Response statuses, which are treated as "try the next node".
+REDIRECT_ERROR_STATUS = (400, 404, 500, 503)
+
+#: Result of the walking when there were no nodes to visit.
+NO_NODES_MESSAGE = "Sorry, no one server was visited. Check the provided " \
+                   "`--url` argument or the `MEATADISKSERVER` environment " \
+                   "variable"
+
+
+def is_redirect_result(result):
+    """
+    Check whether the result of an operation means, that the operation
+    should be tried on the next node.
+
+    :param result: value returned by the operation
+    :type result: requests.models.Response object
+    :type result: string
+
+    :returns: ``True`` if the next node should be tried
+    :rtype: boolean
+    """
+    status_code = getattr(result, 'status_code', None)
+    return status_code in REDIRECT_ERROR_STATUS
+
+
+def is_node_failure(result):
+    """
+    Check whether the result of an operation means, that the node itself
+    has failed, i.e. it has responded with the server error status. Such
+    results are counted by the circuit breaker, unlike the "not found"
+    responses about the missing files.
+
+    :param result: value returned by the operation
+    :type result: requests.models.Response object
+    :type result: string
+
+    :returns: ``True`` if the node has failed
+    :rtype: boolean
+    """
+    status_code = getattr(result, 'status_code', None)
+    return is_redirect_result(result) and status_code >= 500
+
+
+def is_node_error(error):
+    """
+    Check whether the error raised by an operation means, that the node
+    has failed. The connection issues do, but the errors with the false
+    ``node_failure`` attribute, like the
+    ``metatool.core.DownloadConflictError``, don't: they are caused by the
+    local state, so the circuit breaker doesn't count them.
+
+    :param error: exception raised by the operation
+    :type error: Exception
+
+    :returns: ``True`` if the node has failed
+    :rtype: boolean
+    """
+    return isinstance(error, EnvironmentError) and \
+        getattr(error, 'node_failure', True)
+
+
+def _allowed_nodes(nodes, breaker):
+    """
+    Iterate over the nodes, which are allowed by the circuit breaker.
+    """
+    for url_base in nodes:
+        if breaker is None or breaker.allow(url_base):
+            yield url_base
+
+
+def _unavailable_error(nodes):
+    return CircuitOpenError(
+        "All nodes are skipped, because they have failed several times "
+        "in a row: {}".format(', '.join(nodes)))
+
+
+def call_with_failover(operation, nodes, breaker=None, deadline=None,
+                       **kwargs):
+    """
+    Call the ``operation`` with the ``url_base`` of each node in turn,
+    until it returns an acceptable result, i.e. a string or a response
+    with a status, which is not in the ``REDIRECT_ERROR_STATUS``.
+
+    Connection issues (``EnvironmentError`` and it's subclasses, like the
+    ``requests.exceptions.ConnectionError``) are treated as the bad result
+    too, but when the last node raises an error, it's re-raised.
+
+    With the ``deadline`` each node is called with the ``timeout``
+    argument - the seconds left of the deadline, and the next nodes aren't
+    tried, when the deadline is over.
+
+    :param operation: callable, which takes the ``url_base`` keyword
+        argument, i.e. the ``metatool.core`` API function
+    :type operation: callable
+
+    :param nodes: URL-strings of nodes in the desired order
+    :type nodes: sequence of strings
+
+    :param breaker: circuit breaker, which skips the failing nodes and
+        counts the results of the calls
+
+        (optional, default: None - all nodes are called)
+    :type breaker: metatool.breaker.CircuitBreaker object
+
+    :param deadline: seconds for the whole call, the ``operation`` must
+        take the ``timeout`` keyword argument to use it
+
+        (optional, default: None - no deadline)
+    :type deadline: number
+
+    :param kwargs: other arguments passed to the ``operation``
+
+    :returns: tuple with the URL-string of the last visited node (or
+        ``None``) and the last result of the operation, or the
+        ``NO_NODES_MESSAGE`` when the ``nodes`` are empty
+    :rtype: tuple
+
+    :raises metatool.breaker.CircuitOpenError: when the circuits of all
+        nodes are open
+    """
+    expires_at = None if deadline is None else time.time() + deadline
+    url_base, result, error = None, NO_NODES_MESSAGE, None
+    nodes = list(nodes)
+    for url_base in _allowed_nodes(nodes, breaker):
+        kwargs['url_base'] = url_base
+        if expires_at is not None:
+            kwargs['timeout'] = expires_at - time.time()
+        try:
+            result, error = operation(**kwargs), None
+        except EnvironmentError as exc:
+            error = exc
+        if breaker is not None and (error is None or is_node_error(error)):
+            breaker.record(url_base,
+                           error is None and not is_node_failure(result))
+        if error is None and not is_redirect_result(result):
+            break
+        if expires_at is not None and time.time() >= expires_at:
+            break
+    else:
+        if nodes and url_base is None:
+            raise _unavailable_error(nodes)
+    if error is not None:
+        raise error
+    return url_base, result
+
+
+def call_hedged(operation, nodes, delay=0, breaker=None, deadline=None,
+                cancellable=False, **kwargs):
+    """
+    Call the ``operation`` with the ``url_base`` of the nodes concurrently
+    and return the first acceptable result, like the
+    ``call_with_failover()`` does. The first node is called at once, the
+    next one - when the previous call failed or after the ``delay``
+    seconds, whichever comes first.
+
+    Calls, which are still running when the result is got, are abandoned:
+    they are performed by the daemon threads and their late responses are
+    closed. So the ``operation`` must be idempotent and safe to perform
+    concurrently, like the ``files``, ``info``, ``audit`` and ``download``
+    of the ``metatool.core``. The ``cancellable`` operation is also told to
+    stop by the ``cancel`` event, so the abandoned download doesn't write
+    the file, which is already got from the other node.
+
+    When all nodes fail, the result (or the error) of the last node is
+    returned (or raised), as it's done by the ``call_with_failover()``.
+    With the ``deadline`` each node is called with the ``timeout``
+    argument - the seconds left of the deadline, and the next nodes aren't
+    called, when the deadline is over.
+
+    :param operation: callable, which takes the ``url_base`` keyword
+        argument
+    :type operation: callable
+
+    :param nodes: URL-strings of nodes in the desired order
+    :type nodes: sequence of strings
+
+    :param delay: seconds to wait for the result of the node, before
+        the next node is called too
+
+        (optional, default: 0 - all nodes are called at once)
+    :type delay: number
+
+    :param breaker: circuit breaker, which skips the failing nodes and
+        counts the results of the calls
+
+        (optional, default: None - all nodes are called)
+    :type breaker: metatool.breaker.CircuitBreaker object
+
+    :param deadline: seconds for the whole call, the ``operation`` must
+        take the ``timeout`` keyword argument to use it
+
+        (optional, default: None - no deadline)
+    :type deadline: number
+
+    :param cancellable: if ``True``, the ``operation`` takes the ``cancel``
+        keyword argument - the ``threading.Event``, which is set when the
+        result is got, like the ``metatool.core.download()`` does
+
+        (optional, default: False)
+    :type cancellable: boolean
+
+    :param kwargs: other arguments passed to the ``operation``
+
+    :returns: tuple with the URL-string of the node and it's result, or
+        ``(None, NO_NODES_MESSAGE)`` when the ``nodes`` are empty
+    :rtype: tuple
+
+    :raises metatool.breaker.CircuitOpenError: when the circuits of all
+        nodes are open
+    """
+    all_nodes = list(nodes)
+    if not all_nodes:
+        return None, NO_NODES_MESSAGE
+    nodes = list(_allowed_nodes(all_nodes, breaker))
+    if not nodes:
+        raise _unavailable_error(all_nodes)
+    expires_at = None if deadline is None else time.time() + deadline
+    outcomes = queue.Queue()
+    finished = threading.Event()
+    if cancellable:
+        kwargs['cancel'] = finished
+
+    def attempt(index, url_base, options):
+        try:
+            result = operation(**dict(kwargs, url_base=url_base, **options))
+        except Exception:
+            exc_info = sys.exc_info()
+            if breaker is not None and is_node_error(exc_info[1]):
+                breaker.record(url_base, False)
+            outcomes.put((index, None, exc_info))
+            return
+        if breaker is not None:
+            breaker.record(url_base, not is_node_failure(result))
+        if finished.is_set() and hasattr(result, 'close'):
+            # the late response of the abandoned call
+            result.close()
+        outcomes.put((index, result, None))
+
+    def time_left():
+        return None if expires_at is None else expires_at - time.time()
+
+    def can_start_next():
+        budget = time_left()
+        return len(threads) < len(nodes) and (budget is None or budget > 0)
+
+    def start_next():
+        budget = time_left()
+        options = {} if budget is None else dict(timeout=budget)
+        thread = threading.Thread(
+            target=attempt,
+            args=(len(threads), nodes[len(threads)], options))
+        thread.daemon = True
+        threads.append(thread)
+        thread.start()
+
+    threads = []
+    results = {}
+    start_next()
+    while len(results) < len(threads) or can_start_next():
+        if can_start_next():
+            budget = time_left()
+            wait = delay if budget is None else min(delay, budget)
+        else:
+            wait = None
+        try:
+            index, result, exc_info = outcomes.get(timeout=wait)
+        except queue.Empty:
+            if can_start_next():
+                start_next()
+            continue
+        results[index] = result, exc_info
+        if exc_info is None and not is_redirect_result(result):
+            finished.set()
+            return nodes[index], result
+        if exc_info is not None and \
+                not issubclass(exc_info[0], EnvironmentError):
+            finished.set()
+            raise exc_info[1]
+        if exc_info is not None and not is_node_error(exc_info[1]):
+            # the node is fine, i.e. the file is being downloaded from the
+            # other node, so wait for that one instead of the next node
+            continue
+        if can_start_next():
+            start_next()
+    last = len(threads) - 1
+    result, exc_info = results[last]
+    if exc_info is not None:
+        raise exc_info[1]
+    return nodes[last], result
@@ -0,0 +1,210 @@
+"""
+This module contains the retry policy of the ``MetaToolClient``
+requests. The request, which has failed with the transient error - the
+connection error, the timeout or the "service unavailable" like status -
+is sent to the same node again after the exponentially growing pause with
+the random jitter, so a short hiccup of the node doesn't fail the
+operation or send it to the slower node.
+
+The requests, which change the state of the node (like the uploading),
+are retried only when the node surely hasn't processed them: the
+connection wasn't established, or the node has answered with the
+``SAFE_RETRY_STATUS``.
+"""
+import random
+import time
+
+#: Statuses of the transient failures, after which the idempotent
+#: requests are retried.
+RETRY_STATUS = (429, 502, 503, 504)
+
+#: Statuses, which mean that the node hasn't processed the request, so
+#: any request can be retried.
+SAFE_RETRY_STATUS = (429, 503)
+
+
+def _retry_after(response):
+    """
+    Get the seconds to wait from the "Retry-After" header of the response.
+
+    :returns: seconds, or ``None`` when the header isn't given in seconds
+    :rtype: float
+    """
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return max(float(headers.get('Retry-After')), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy(object):
+    """
+    Policy of retrying the failed requests to the node.
+
+    :param max_attempts: max number of the attempts of the request,
+        ``1`` to not retry
+
+        (optional, default: 3)
+    :type max_attempts: integer
+
+    :param backoff: pause in seconds before the first retry, which is
+        doubled for every next one
+
+        (optional, default: 0.2)
+    :type backoff: number
+
+    :param max_backoff: max pause in seconds, it also limits the
+        "Retry-After" pause asked by the node
+
+        (optional, default: 5)
+    :type max_backoff: number
+
+    :param jitter: if ``True``, the pause is the random one between zero
+        and the backoff ("full jitter"), so the clients failed at the same
+        time don't retry at the same time
+
+        (optional, default: True)
+    :type jitter: boolean
+
+    :param statuses: response statuses, after which the idempotent
+        requests are retried
+
+        (optional, default: ``RETRY_STATUS``)
+    :type statuses: sequence of integers
+
+    :param safe_statuses: response statuses, after which all requests are
+        retried
+
+        (optional, default: ``SAFE_RETRY_STATUS``)
+    :type safe_statuses: sequence of integers
+
+    :param exceptions: exceptions, after which the idempotent requests are
+        retried
+
+        (optional, default: None - the connection errors and the timeouts
+        of the ``requests``)
+    :type exceptions: tuple of exception classes
+
+    :param safe_exceptions: exceptions, after which all requests are
+        retried
+
+        (optional, default: None - the connection timeout of the
+        ``requests``)
+    :type safe_exceptions: tuple of exception classes
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.2, max_backoff=5,
+                 jitter=True, statuses=RETRY_STATUS,
+                 safe_statuses=SAFE_RETRY_STATUS, exceptions=None,
+                 safe_exceptions=None):
+        if max_attempts < 1:
+            raise ValueError("'max_attempts' must be positive")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = tuple(statuses)
+        self.safe_statuses = tuple(safe_statuses)
+        self.exceptions = exceptions
+        self.safe_exceptions = safe_exceptions
+
+    def _exceptions(self, idempotent):
+        """
+        Get the retried exceptions, the ``requests`` ones by default.
+        """
+        import requests
+
+        if idempotent:
+            return self.exceptions or (requests.exceptions.ConnectionError,
+                                       requests.exceptions.Timeout)
+        return self.safe_exceptions or (requests.exceptions.ConnectTimeout,)
+
+    def is_retryable(self, idempotent, response=None, error=None):
+        """
+        Check whether the request should be retried after the result.
+
+        :param idempotent: whether the request can be repeated safely
+        :type idempotent: boolean
+
+        :param response: response to the request
+        :type response: requests.models.Response object
+
+        :param error: exception raised by the request
+        :type error: Exception
+
+        :returns: ``True`` if the request should be retried
+        :rtype: boolean
+        """
+        if error is not None:
+            return isinstance(error, self._exceptions(idempotent))
+        statuses = self.statuses if idempotent else self.safe_statuses
+        return getattr(response, 'status_code', None) in statuses
+
+    def delay(self, retry, response=None):
+        """
+        Get the pause before the retry.
+
+        :param retry: number of the retry, starting from 1
+        :type retry: integer
+
+        :param response: the failed response, which may ask for the pause
+            with the "Retry-After" header
+        :type response: requests.models.Response object
+
+        :returns: seconds to wait
+        :rtype: float
+        """
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.backoff * 2 ** (retry - 1), self.max_backoff)
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def call(self, send, idempotent=True, timeout=None):
+        """
+        Send the request, retrying it while it fails with the retryable
+        errors, there are attempts left and the pause doesn't exceed the
+        ``timeout``.
+
+        :param send: callable, which sends the request, takes the time
+            budget in seconds (or ``None``) and returns the response
+        :type send: callable
+
+        :param idempotent: whether the request can be repeated safely
+
+            (optional, default: True)
+        :type idempotent: boolean
+
+        :param timeout: time budget of all attempts in seconds
+
+            (optional, default: None - no limit)
+        :type timeout: number
+
+        :returns: the response of the last attempt
+        :rtype: requests.models.Response object
+        :raises: the error of the last attempt
+        """
+        expires_at = None if timeout is None else time.time() + timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            response, error = None, None
+            budget = None if expires_at is None else expires_at - time.time()
+            try:
+                response = send(budget)
+            except Exception as exc:
+                error = exc
+            if attempt >= self.max_attempts or \
+                    not self.is_retryable(idempotent, response, error):
+                break
+            delay = self.delay(attempt, response)
+            if expires_at is not None and \
+                    time.time() + delay >= expires_at:
+                break
+            if response is not None:
+                # release the connection of the discarded response
+                response.close()
+            time.sleep(delay)
+        if error is not None:
+            raise error
+        return response
@@ -0,0 +1,199 @@
+"""
+This module contains the scoreboard of the MetaCore nodes' health. It
+keeps the exponentially weighted moving averages (EWMA) of the latency of
+the successful calls and of the error rate of every node, and ranks the
+nodes, so the fastest healthy one is tried first.
+
+The scoreboard is saved to the ``nodes.json`` file in the state directory
+(look at the ``metatool.state`` module) between the runs of the CLI.
+"""
+import json
+import os.path
+import threading
+import time
+
+from metatool.nodes import is_node_error, is_node_failure
+from metatool.state import state_path, write_file
+
+#: Name of the default scoreboard file in the state directory.
+DEFAULT_SCOREBOARD_NAME = 'nodes.json'
+
+#: Weight of the new sample in the moving averages.
+EWMA_ALPHA = 0.3
+
+#: Nodes with the bigger average error rate are treated as unhealthy.
+MAX_HEALTHY_ERROR_RATE = 0.5
+
+
+class Scoreboard(object):
+    """
+    Thread-safe scoreboard of the nodes' latency and error rate.
+
+    :param path: path to the scoreboard file, or ``False`` to not save it
+
+        (optional, default: the ``DEFAULT_SCOREBOARD_NAME`` file in the
+        state directory)
+    :type path: string or boolean
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = state_path(DEFAULT_SCOREBOARD_NAME)
+        self.path = path
+        self._lock = threading.Lock()
+        self.stats = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path) as fp:
+                    stats = json.load(fp)
+                if isinstance(stats, dict):
+                    self.stats = stats
+            except (EnvironmentError, ValueError):
+                # broken scoreboard is started from scratch
+                pass
+
+    def record(self, url_base, latency, success):
+        """
+        Add the result of the call to the node.
+
+        :param url_base: URL-string of the node
+        :type url_base: string
+
+        :param latency: duration of the call in seconds
+        :type latency: float
+
+        :param success: whether the node returned the acceptable result
+        :type success: boolean
+        """
+        with self._lock:
+            stats = self.stats.setdefault(url_base, dict(
+                latency=None, error_rate=0.0, calls=0, errors=0))
+            stats['calls'] += 1
+            stats['last_call'] = time.time()
+            stats['error_rate'] = round(
+                (1 - EWMA_ALPHA) * stats['error_rate'] +
+                EWMA_ALPHA * (0 if success else 1), 6)
+            if success:
+                stats['latency'] = round(
+                    latency if stats['latency'] is None else
+                    (1 - EWMA_ALPHA) * stats['latency'] +
+                    EWMA_ALPHA * latency, 6)
+            else:
+                stats['errors'] += 1
+
+    def _sort_key(self, url_base):
+        """
+        Key of the node's rank: the healthy nodes by their latency first,
+        then the nodes without the statistics, then the unhealthy ones and
+        the nodes, which have never answered, last.
+        """
+        stats = self.stats.get(url_base)
+        if stats is None:
+            return 1, False, 0
+        if stats['error_rate'] > MAX_HEALTHY_ERROR_RATE or \
+                stats['latency'] is None:
+            return 2, stats['latency'] is None, stats['error_rate']
+        return 0, False, stats['latency']
+
+    def rank(self, nodes):
+        """
+        Order the nodes from the best one. Nodes with the same rank keep
+        their given order.
+
+        :param nodes: URL-strings of the nodes
+        :type nodes: sequence of strings
+
+        :returns: ordered URL-strings
+        :rtype: tuple of strings
+        """
+        with self._lock:
+            return tuple(sorted(nodes, key=self._sort_key))
+
+    def rankings(self, nodes=()):
+        """
+        Get the statistics of the known and the given nodes, from the best
+        one.
+
+        :param nodes: URL-strings of the nodes to include too
+        :type nodes: sequence of strings
+
+        :returns: list of dictionaries with the ``node``, it's average
+            ``latency`` (in seconds), ``error_rate``, number of ``calls``
+            and ``errors``, and whether the node is ``healthy``
+        :rtype: list
+        """
+        with self._lock:
+            all_nodes = list(nodes) + sorted(set(self.stats) - set(nodes))
+            rankings = []
+            for url_base in sorted(all_nodes, key=self._sort_key):
+                stats = self.stats.get(url_base, {})
+                rankings.append(dict(
+                    node=url_base,
+                    latency=stats.get('latency'),
+                    error_rate=stats.get('error_rate'),
+                    calls=stats.get('calls', 0),
+                    errors=stats.get('errors', 0),
+                    healthy=self._sort_key(url_base)[0] < 2,
+                ))
+            return rankings
+
+    def timed(self, operation):
+        """
+        Wrap the operation, which takes the ``url_base`` keyword argument,
+        to record the duration and the result of it's calls. The failures
+        are counted like the ``metatool.breaker.CircuitBreaker`` counts
+        them (look at the ``metatool.nodes.is_node_failure()``), so the
+        "not found" responses are not the node's errors. The calls with the
+        ``link=True``, which don't send requests, aren't recorded.
+
+        :param operation: callable like the ``metatool.core`` functions
+        :type operation: callable
+
+        :returns: wrapped operation
+        :rtype: callable
+        """
+        def timed_operation(**kwargs):
+            if kwargs.get('link'):
+                return operation(**kwargs)
+            start = time.time()
+            try:
+                result = operation(**kwargs)
+            except EnvironmentError as exc:
+                if is_node_error(exc):
+                    self.record(kwargs['url_base'], time.time() - start,
+                                False)
+                raise
+            self.record(kwargs['url_base'], time.time() - start,
+                        not is_node_failure(result))
+            return result
+        timed_operation.__wrapped__ = operation
+        return timed_operation
+
+    def save(self):
+        """
+        Save the scoreboard to it's file.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            content = json.dumps(self.stats, indent=2, sort_keys=True)
+        write_file(self.path, content)
+
+
+def report(scoreboard, known_nodes=()):
+    """
+    Get the rankings of the nodes as the JSON string, used by the
+    ``metatool nodes`` action.
+
+    :param scoreboard: the scoreboard
+    :type scoreboard: Scoreboard object
+
+    :param known_nodes: URL-strings of the nodes to include, even when
+        they weren't called yet
+    :type known_nodes: sequence of strings
+
+    :returns: JSON list of the nodes' statistics, from the best node
+    :rtype: string
+    """
+    return json.dumps(scoreboard.rankings(known_nodes), indent=2,
+                      sort_keys=True)
@@ -0,0 +1,157 @@
+"""
+This module contains the caching wrapper of the ``btctxstore.BtcTxStore``
+API, used to sign the requests to the nodes. Deriving the address of the
+key and signing the message are pure Python elliptic curve operations, and
+the same ones are repeated for every request about the same file - the
+retried downloads, the audits of the same files, the upload tried on
+several nodes. ``CachingSigner`` keeps their results in a bounded LRU cache.
+
+The signatures of the ``btctxstore`` are deterministic (RFC 6979), so the
+cached signature is the same as the newly calculated one.
+"""
+import collections
+import threading
+import weakref
+
+#: Default max number of the cached addresses and signatures.
+DEFAULT_CACHE_SIZE = 4096
+
+
+class CachingSigner(object):
+    """
+    Thread-safe wrapper of the ``btctxstore.BtcTxStore`` instance, which
+    caches the addresses of the keys and the signatures of the messages.
+    Other attributes are taken from the wrapped API, so the signer can be
+    passed everywhere as the ``btctx_api`` argument.
+
+    :param btctx_api: the wrapped API
+    :type btctx_api: btctxstore.BtcTxStore object
+
+    :param maxsize: max number of the cached results, the least recently
+        used ones are dropped first
+
+        (optional, default: ``DEFAULT_CACHE_SIZE``)
+    :type maxsize: integer
+    """
+
+    def __init__(self, btctx_api, maxsize=DEFAULT_CACHE_SIZE):
+        if maxsize < 1:
+            raise ValueError("'maxsize' must be positive")
+        self.btctx_api = btctx_api
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+
+    def __getattr__(self, name):
+        if name == 'btctx_api':
+            raise AttributeError(name)
+        return getattr(self.btctx_api, name)
+
+    def _cached(self, cache_key, function, *args):
+        """
+        Get the cached result of the ``function`` call, or call it and
+        cache the result.
+        """
+        with self._lock:
+            if cache_key in self._cache:
+                self.hits += 1
+                value = self._cache.pop(cache_key)
+                self._cache[cache_key] = value
+                return value
+            self.misses += 1
+        # calculate without the lock, the concurrent calls for the same key
+        # just calculate the same value
+        value = function(*args)
+        with self._lock:
+            self._cache[cache_key] = value
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return value
+
+    def get_address(self, key):
+        """
+        Get the address of the private key.
+
+        :param key: private key
+        :type key: string
+
+        :returns: address of the key
+        :rtype: string
+        """
+        return self._cached(('address', key),
+                            self.btctx_api.get_address, key)
+
+    def sign_unicode(self, key, message):
+        """
+        Sign the unicode message with the private key.
+
+        :param key: private key
+        :type key: string
+
+        :param message: signed message
+        :type message: string
+
+        :returns: signature, in the type returned by the wrapped API
+        :rtype: string or bytes
+        """
+        return self._cached(('signature', key, message),
+                            self.btctx_api.sign_unicode, key, message)
+
+    def stats(self):
+        """
+        :returns: numbers of the cache ``hits`` and ``misses``, their
+            ``hit_rate`` and the number of ``cached`` results
+        :rtype: dictionary
+        """
+        with self._lock:
+            calls = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=round(float(self.hits) / calls, 4) if calls else 0.0,
+                cached=len(self._cache),
+            )
+
+
+class SignerRegistry(object):
+    """
+    Thread-safe mapping of the ``btctxstore.BtcTxStore`` instances to
+    their ``CachingSigner`` wrappers, used by the clients to share one
+    cache per API instance. The wrappers are dropped together with their
+    API instances.
+
+    :param maxsize: max number of the cached results of every signer
+
+        (optional, default: ``DEFAULT_CACHE_SIZE``)
+    :type maxsize: integer
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._signers = weakref.WeakKeyDictionary()
+
+    def get(self, btctx_api):
+        """
+        Get the signer of the API instance, creating it on the first call.
+        The ``CachingSigner`` itself is returned as is.
+
+        :param btctx_api: the API instance
+        :type btctx_api: btctxstore.BtcTxStore object
+
+        :returns: the signer
+        :rtype: CachingSigner object
+        """
+        if isinstance(btctx_api, CachingSigner):
+            return btctx_api
+        with self._lock:
+            signer = self._signers.get(btctx_api)
+            if signer is None:
+                # the signer refers to the API weakly, to not keep the key
+                # of the weak dictionary alive
+                signer = CachingSigner(weakref.proxy(btctx_api),
+                                       self.maxsize)
+                self._signers[btctx_api] = signer
+            return signer
@@ -0,0 +1,88 @@
+"""
+This module defines where the MetaTool keeps it's local state between the
+runs - the index of uploaded files, caches and so on. All of it lives in
+one directory, which is ``~/.metatool`` by default and can be changed with
+the ``METATOOL_HOME`` environment variable.
+"""
+import os
+import os.path
+import tempfile
+
+#: Environment variable with the path to the state directory.
+STATE_DIR_ENV = 'METATOOL_HOME'
+
+#: Default path to the state directory.
+DEFAULT_STATE_DIR = os.path.join('~', '.metatool')
+
+
+def get_state_dir():
+    """
+    Get the path to the state directory, creating it when it's missing.
+
+    :returns: absolute path to the directory
+    :rtype: string
+    """
+    state_dir = os.path.abspath(os.path.expanduser(
+        os.environ.get(STATE_DIR_ENV) or DEFAULT_STATE_DIR))
+    if not os.path.isdir(state_dir):
+        try:
+            os.makedirs(state_dir)
+        except OSError:
+            # it may be created by the concurrent process
+            if not os.path.isdir(state_dir):
+                raise
+    return state_dir
+
+
+def state_path(name):
+    """
+    Get the path to the file in the state directory.
+
+    :param name: name of the file
+    :type name: string
+
+    :returns: absolute path to the file
+    :rtype: string
+    """
+    return os.path.join(get_state_dir(), name)
+
+
+def replace_file(source, destination):
+    """
+    Atomically rename the file, replacing the existing destination one.
+
+    :param source: path to the renamed file
+    :type source: string
+
+    :param destination: new path of the file
+    :type destination: string
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        if os.name == 'nt' and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+def write_file(path, content):
+    """
+    Atomically write the text file: the content is written to the
+    temporary file in the same directory, which then replaces the file.
+    So the concurrent readers get either the old or the new content.
+
+    :param path: path to the file
+    :type path: string
+
+    :param content: new content of the file
+    :type content: string
+    """
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(content)
+        replace_file(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
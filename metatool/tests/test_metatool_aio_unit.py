@@ -0,0 +1,289 @@
+import os
+import sys
+import json
+import time
+import threading
+import unittest
+import tempfile
+import binascii
+from hashlib import sha256
+
+import file_encryptor
+from btctxstore import BtcTxStore
+
+from metatool.retry import RetryPolicy
+
+try:
+    import asyncio
+    from metatool import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+# make the parent tests package importable for the direct running
+parent_dir = os.path.dirname(os.path.dirname(__file__))
+if not parent_dir in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from tests.testing_server import RecordingHTTPServer, use_temp_state_dir
+
+
+def setUpModule():
+    # keep the state of the tested clients out of the user's home
+    global restore_state_dir
+    restore_state_dir = use_temp_state_dir()
+
+
+def tearDownModule():
+    restore_state_dir()
+
+
+def run(coroutine):
+    """
+    Run the coroutine in the new event loop and return it's result.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(aio is None, 'aiohttp is not available')
+class TestAsyncMetaToolClient(unittest.TestCase):
+    """
+    Test case of the ``metatool.aio.AsyncMetaToolClient`` class against the
+    local stand-in server.
+    """
+
+    def start_server(self, responder):
+        server = RecordingHTTPServer(responder).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def make_file(self, content):
+        temp_file = tempfile.NamedTemporaryFile(prefix='tmp_',
+                                                suffix='.spam', delete=False)
+        self.addCleanup(os.remove, temp_file.name)
+        with temp_file:
+            temp_file.write(content)
+        return temp_file.name
+
+    def test_info_and_files(self):
+        """
+        Test that the simple requests return the read ``requests`` response.
+        """
+        server = self.start_server(
+            lambda handler: (200, {'Content-Type': 'application/json'},
+                             json.dumps([handler.path]).encode())
+        )
+
+        async def scenario():
+            async with aio.AsyncMetaToolClient() as client:
+                return (await client.info(server.url),
+                        await client.files(server.url))
+
+        info_response, files_response = run(scenario())
+        self.assertEqual(info_response.status_code, 200)
+        self.assertEqual(info_response.json(), ['/api/nodes/me/'])
+        self.assertEqual(files_response.json(), ['/api/files/'])
+
+    def test_upload_streams_body_with_credentials(self):
+        """
+        Test that the uploaded body is the multipart body with the file and
+        the credential headers are generated with the ``btctx_api``.
+        """
+        server = self.start_server(
+            lambda handler: (201, {'Content-Type': 'application/json'},
+                             b'{"data_hash": "HASH", "file_role": "001"}')
+        )
+        content = os.urandom(300000)
+        file_name = self.make_file(content)
+        btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        sender_key = btctx_api.create_key()
+        data_hash = sha256(content).hexdigest()
+
+        async def scenario():
+            async with aio.AsyncMetaToolClient() as client:
+                return await client.upload(server.url, sender_key, btctx_api,
+                                           open(file_name, 'rb'), '001')
+
+        response = run(scenario())
+        self.assertEqual(response.status_code, 201)
+        received = server.received[0]
+        self.assertEqual(int(received['headers']['Content-Length']),
+                         len(received['body']))
+        self.assertNotIn('Transfer-Encoding', received['headers'])
+        self.assertIn(b'name="data_hash"\r\n\r\n' + data_hash.encode(),
+                      received['body'])
+        self.assertIn(b'\r\n\r\n' + content + b'\r\n--', received['body'])
+        self.assertEqual(received['headers']['sender-address'],
+                         btctx_api.get_address(sender_key))
+
+    def test_encrypted_upload_adds_decryption_key(self):
+        server = self.start_server(
+            lambda handler: (201, {'Content-Type': 'application/json'},
+                             b'{"data_hash": "HASH", "file_role": "001"}')
+        )
+        file_name = self.make_file(b'some file content')
+        btctx_api = BtcTxStore(testnet=True, dryrun=True)
+
+        async def scenario():
+            async with aio.AsyncMetaToolClient() as client:
+                return await client.upload(
+                    server.url, btctx_api.create_key(), btctx_api,
+                    open(file_name, 'rb'), '001', encrypt=True)
+
+        response = run(scenario())
+        self.assertIn('decryption_key', response.json())
+        self.assertNotIn(b'some file content', server.received[0]['body'])
+
+    def test_download(self):
+        """
+        Test of saving the downloaded file and returning the error response.
+        """
+        content = os.urandom(200000)
+        target_name = os.path.join(tempfile.mkdtemp(), 'downloaded.spam')
+        self.addCleanup(os.rmdir, os.path.dirname(target_name))
+        self.addCleanup(os.remove, target_name)
+
+        def responder(handler):
+            if 'missing' in handler.path:
+                return 404, {}, b'{"error_code": 404}'
+            return 200, {'X-Sendfile': target_name}, content
+
+        server = self.start_server(responder)
+
+        async def scenario():
+            async with aio.AsyncMetaToolClient(chunk_size=1000) as client:
+                return (await client.download(server.url, 'HASH'),
+                        await client.download(server.url, 'missing'))
+
+        file_name, error_response = run(scenario())
+        self.assertEqual(file_name, target_name)
+        with open(target_name, 'rb') as file_:
+            self.assertEqual(file_.read(), content)
+        self.assertEqual(error_response.status_code, 404)
+        self.assertEqual(
+            run(aio.AsyncMetaToolClient().download(
+                'http://test.url.com', 'HASH', link=True)),
+            'http://test.url.com/api/files/HASH'
+        )
+
+    def test_download_checks_hash(self):
+        """
+        Test that the downloaded data is written to the partial file and
+        renamed into place only when it matches the ``file_hash``.
+        """
+        content = os.urandom(100000)
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, temp_dir)
+        target_name = os.path.join(temp_dir, 'downloaded.spam')
+        server = self.start_server(
+            lambda handler: (200, {'X-Sendfile': target_name}, content))
+
+        async def scenario(file_hash):
+            async with aio.AsyncMetaToolClient(chunk_size=1000) as client:
+                return await client.download(server.url, file_hash)
+
+        self.assertRaises(aio.DownloadError, run,
+                          scenario(sha256(b'other content').hexdigest()))
+        self.assertEqual(os.listdir(temp_dir), [])
+        self.assertEqual(run(scenario(sha256(content).hexdigest())),
+                         target_name)
+        self.addCleanup(os.remove, target_name)
+        self.assertEqual(os.listdir(temp_dir), ['downloaded.spam'])
+        with open(target_name, 'rb') as file_:
+            self.assertEqual(file_.read(), content)
+
+    def test_download_with_decryption(self):
+        content = os.urandom(100000)
+        file_name = self.make_file(content)
+        key = file_encryptor.convergence.encrypt_file_inline(file_name, None)
+        with open(file_name, 'rb') as file_:
+            encrypted = file_.read()
+        server = self.start_server(
+            lambda handler: (200, {'X-Sendfile': file_name}, encrypted))
+
+        async def scenario():
+            async with aio.AsyncMetaToolClient(chunk_size=999) as client:
+                return await client.download(
+                    server.url, 'HASH',
+                    decryption_key=binascii.hexlify(key).decode())
+
+        self.assertEqual(run(scenario()), file_name)
+        with open(file_name, 'rb') as file_:
+            self.assertEqual(file_.read(), content)
+
+    def test_bounded_concurrency(self):
+        """
+        Test that no more than ``max_concurrency`` requests are in flight.
+        """
+        lock = threading.Lock()
+        in_flight = [0, 0]
+
+        def responder(handler):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+            return 200, {}, b'[]'
+
+        server = self.start_server(responder)
+
+        async def scenario():
+            async with aio.AsyncMetaToolClient(max_concurrency=3) as client:
+                return await asyncio.gather(
+                    *[client.files(server.url) for _ in range(12)])
+
+        responses = run(scenario())
+        self.assertEqual([r.status_code for r in responses], [200] * 12)
+        self.assertEqual(in_flight[1], 3)
+
+    def test_retried_upload_sends_whole_body(self):
+        """
+        Test that the upload refused with the "service unavailable" status
+        is retried with the body streamed from the beginning.
+        """
+        statuses = [503, 201]
+        server = self.start_server(
+            lambda handler: (statuses.pop(0),
+                             {'Content-Type': 'application/json'}, b'{}')
+        )
+        content = os.urandom(100000)
+        file_name = self.make_file(content)
+        btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        retry = RetryPolicy(backoff=0.01, jitter=False)
+
+        async def scenario():
+            async with aio.AsyncMetaToolClient(retry=retry) as client:
+                return await client.upload(
+                    server.url, btctx_api.create_key(), btctx_api,
+                    open(file_name, 'rb'), '001')
+
+        self.assertEqual(run(scenario()).status_code, 201)
+        self.assertEqual(len(server.received), 2)
+        self.assertEqual(server.received[0]['body'],
+                         server.received[1]['body'])
+        self.assertIn(content, server.received[1]['body'])
+
+    def test_time_budget(self):
+        """
+        Test that the operation's ``timeout`` limits the request, and the
+        request isn't sent when the budget is already over.
+        """
+        def slow_responder(handler):
+            time.sleep(0.5)
+            return 200, {}, b'[]'
+
+        server = self.start_server(slow_responder)
+
+        async def scenario(timeout):
+            async with aio.AsyncMetaToolClient(retry=False) as client:
+                return await client.info(server.url, timeout=timeout)
+
+        self.assertRaises(asyncio.TimeoutError, run, scenario(0.1))
+        self.assertRaises(asyncio.TimeoutError, run, scenario(0))
+        self.assertEqual(len(server.received), 1)
+        self.assertEqual(run(scenario(5)).status_code, 200)
@@ -0,0 +1,522 @@
+import os
+import sys
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import binascii
+from hashlib import sha256
+
+if sys.version_info.major == 3:
+    from urllib.parse import parse_qs
+else:
+    from urlparse import parse_qs
+
+import file_encryptor
+
+from btctxstore import BtcTxStore
+
+from metatool import batch
+from metatool.breaker import CircuitBreaker
+from metatool.challenges import ChallengeBank
+from metatool.retry import RetryPolicy
+
+# make the parent tests package importable for the direct running
+parent_dir = os.path.dirname(os.path.dirname(__file__))
+if not parent_dir in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from tests.testing_server import RecordingHTTPServer, use_temp_state_dir
+
+
+def setUpModule():
+    # keep the state of the tested clients out of the user's home
+    global restore_state_dir
+    restore_state_dir = use_temp_state_dir()
+
+
+def tearDownModule():
+    restore_state_dir()
+
+
+def upload_responder(handler):
+    """
+    Answer the upload request like the MetaCore node, with the hash of the
+    uploaded file's content.
+    """
+    body = handler.body
+    content = body.split(b'filename=')[1].split(b'\r\n\r\n', 1)[1]
+    content = content.rsplit(b'\r\n--', 1)[0]
+    file_role = body.split(b'name="file_role"\r\n\r\n')[1][:3]
+    return 201, {'Content-Type': 'application/json'}, json.dumps({
+        'data_hash': sha256(content).hexdigest(),
+        'file_role': file_role.decode(),
+    }).encode()
+
+
+def counts(summary):
+    """
+    Get the numbers of the succeeded and failed items from the summary.
+    """
+    return dict((key, summary[key]) for key in ('succeeded', 'failed'))
+
+
+class TestBatchRunConcurrently(unittest.TestCase):
+
+    def test_all_items_processed_with_bounded_concurrency(self):
+        lock = threading.Lock()
+        in_flight = [0, 0]
+
+        def function(item):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return item * 2
+
+        results = list(batch.run_concurrently(function, range(40), 4))
+        self.assertEqual(sorted(results), [i * 2 for i in range(40)])
+        self.assertLessEqual(in_flight[1], 4)
+        self.assertRaises(ValueError, list,
+                          batch.run_concurrently(function, range(3), 0))
+
+
+class TestBatchUploadDir(unittest.TestCase):
+    """
+    Test case of the ``metatool.batch.upload_dir()`` function.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.files = {}
+        for i in range(12):
+            sub_dir = os.path.join(self.directory, 'dir{}'.format(i % 3))
+            if not os.path.exists(sub_dir):
+                os.makedirs(sub_dir)
+            path = os.path.join(sub_dir, 'file{}.txt'.format(i))
+            content = 'content of the file {}'.format(i).encode()
+            with open(path, 'wb') as file_:
+                file_.write(content)
+            self.files[path] = content
+        self.btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        self.sender_key = self.btctx_api.create_key()
+
+        self.bad_server = RecordingHTTPServer(
+            lambda handler: (503, {}, b'{"error_code": 503}')).start()
+        self.addCleanup(self.bad_server.stop)
+        self.server = RecordingHTTPServer(upload_responder).start()
+        self.addCleanup(self.server.stop)
+
+    def test_upload_with_failover(self):
+        """
+        Test that every file is uploaded to the healthy node after the
+        failed one and gets it's own result record.
+        """
+        output = io.StringIO()
+        summary = batch.upload_dir(
+            [self.bad_server.url, self.server.url], self.sender_key,
+            self.btctx_api, self.directory, file_role='002', workers=4,
+            output=output
+        )
+        self.assertEqual(counts(summary), dict(succeeded=12, failed=0))
+        records = [json.loads(line) for line in
+                   output.getvalue().splitlines()]
+        self.assertEqual(sorted(record['path'] for record in records),
+                         sorted(self.files))
+        for record in records:
+            self.assertEqual(record['node'], self.server.url)
+            self.assertEqual(record['status'], 201)
+            self.assertEqual(record['file_role'], '002')
+            self.assertEqual(record['data_hash'],
+                             sha256(self.files[record['path']]).hexdigest())
+        # the "service unavailable" node is retried before the next one
+        self.assertEqual(len(self.bad_server.received),
+                         12 * RetryPolicy().max_attempts)
+        self.assertEqual(len(self.server.received), 12)
+        # every file is signed once and the signature is reused on the
+        # next node, the address is derived once per worker at most
+        self.assertEqual(summary['signer']['hits'] +
+                         summary['signer']['misses'], 48)
+        self.assertLessEqual(summary['signer']['misses'], 12 + 4)
+        self.assertGreaterEqual(summary['signer']['hit_rate'], 0.5)
+
+    def test_encrypted_upload_and_errors(self):
+        output = io.StringIO()
+        summary = batch.upload_dir(
+            [self.server.url], self.sender_key, self.btctx_api,
+            self.directory, encrypt=True, workers=3, output=output
+        )
+        self.assertEqual(counts(summary), dict(succeeded=12, failed=0))
+        for line in output.getvalue().splitlines():
+            self.assertIn('decryption_key', json.loads(line))
+
+        output = io.StringIO()
+        summary = batch.upload_dir(
+            [self.bad_server.url], self.sender_key, self.btctx_api,
+            self.directory, workers=3, output=output
+        )
+        self.assertEqual(counts(summary), dict(succeeded=0, failed=12))
+        for line in output.getvalue().splitlines():
+            record = json.loads(line)
+            self.assertEqual(record['error'], {'error_code': 503})
+            self.assertEqual(record['status'], 503)
+
+    def test_hash_workers(self):
+        """
+        Test that the data hashes calculated by the pool of processes match
+        the data sent by the uploading threads.
+        """
+        output = io.StringIO()
+        summary = batch.upload_dir(
+            [self.server.url], self.sender_key, self.btctx_api,
+            self.directory, encrypt=True, workers=3, output=output,
+            hash_workers=2
+        )
+        self.assertEqual(counts(summary), dict(succeeded=12, failed=0))
+        sent_hashes = set(
+            request['body'].split(b'name="data_hash"\r\n\r\n')[1][:64]
+            .decode() for request in self.server.received
+        )
+        for line in output.getvalue().splitlines():
+            record = json.loads(line)
+            self.assertIn('decryption_key', record)
+            self.assertIn(record['data_hash'], sent_hashes)
+
+
+class TestBatchHashFiles(unittest.TestCase):
+
+    def test_hash_files(self):
+        directory = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, directory)
+        expected = {}
+        for i in range(6):
+            path = os.path.join(directory, 'file{}'.format(i))
+            content = os.urandom(1000 * i)
+            with open(path, 'wb') as file_:
+                file_.write(content)
+            expected[path] = sha256(content).hexdigest()
+        missing = os.path.join(directory, 'missing')
+        digests = dict(
+            (digest['path'], digest) for digest in
+            batch.hash_files(sorted(expected) + [missing], workers=3)
+        )
+        self.assertIn('error', digests.pop(missing))
+        self.assertEqual(
+            dict((path, digest['data_hash'])
+                 for path, digest in digests.items()),
+            expected
+        )
+
+
+class TestBatchHashList(unittest.TestCase):
+
+    def test_iter_hash_list(self):
+        lines = [
+            '# comment\n',
+            'HASH_1\n',
+            '\n',
+            '  HASH_2  {}  some dir/new name.txt \n'.format('ab' * 16),
+            'HASH_3 - renamed.txt\n',
+            'HASH_4 not-a-key\n',
+            'HASH_5 aabb\n',
+        ]
+        self.assertListEqual(list(batch.iter_hash_list(lines)), [
+            dict(line=2, file_hash='HASH_1', decryption_key=None,
+                 rename_file=None),
+            dict(line=4, file_hash='HASH_2', decryption_key='ab' * 16,
+                 rename_file='some dir/new name.txt'),
+            dict(line=5, file_hash='HASH_3', decryption_key=None,
+                 rename_file='renamed.txt'),
+            dict(line=6, file_hash='HASH_4', decryption_key='not-a-key',
+                 rename_file=None, error='malformed decryption key'),
+            # valid hexadecimal string of the wrong key length
+            dict(line=7, file_hash='HASH_5', decryption_key='aabb',
+                 rename_file=None, error='malformed decryption key'),
+        ])
+
+
+class TestBatchDownload(unittest.TestCase):
+    """
+    Test case of the ``metatool.batch.download_batch()`` function.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.stored = {}
+        for i in range(10):
+            content = os.urandom(1000 + i)
+            self.stored[sha256(content).hexdigest()] = content
+        self.btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        self.sender_key = self.btctx_api.create_key()
+
+        def responder(handler):
+            file_hash = handler.path.split('?')[0].split('/')[-1]
+            if file_hash not in self.stored:
+                return 404, {}, b'{"error_code": 404}'
+            return 200, {'X-Sendfile': os.path.join(self.directory,
+                                                    file_hash)}, \
+                self.stored[file_hash]
+
+        self.bad_server = RecordingHTTPServer(
+            lambda handler: (503, {}, b'{"error_code": 503}')).start()
+        self.addCleanup(self.bad_server.stop)
+        self.server = RecordingHTTPServer(responder).start()
+        self.addCleanup(self.server.stop)
+
+    def test_download_with_failover(self):
+        """
+        Test that every listed file is saved from the healthy node and the
+        missing one is reported with the error.
+        """
+        hash_list = io.StringIO(
+            '\n'.join(sorted(self.stored)) + '\nMISSING_HASH\n')
+        output = io.StringIO()
+        summary = batch.download_batch(
+            [self.bad_server.url, self.server.url], self.sender_key,
+            self.btctx_api, hash_list, workers=4, output=output
+        )
+        self.assertEqual(counts(summary), dict(succeeded=10, failed=1))
+        records = {}
+        for line in output.getvalue().splitlines():
+            record = json.loads(line)
+            records[record['file_hash']] = record
+        for file_hash, content in self.stored.items():
+            self.assertEqual(records[file_hash]['node'], self.server.url)
+            with open(records[file_hash]['path'], 'rb') as file_:
+                self.assertEqual(file_.read(), content)
+        self.assertEqual(records['MISSING_HASH']['line'], 11)
+        self.assertEqual(records['MISSING_HASH']['status'], 404)
+        self.assertEqual(records['MISSING_HASH']['error'],
+                         {'error_code': 404})
+
+    def test_decryption_and_renaming(self):
+        plain_name = os.path.join(self.directory, 'plain.txt')
+        with open(plain_name, 'wb') as file_:
+            file_.write(b'secret content')
+        key = file_encryptor.convergence.encrypt_file_inline(plain_name,
+                                                             None)
+        with open(plain_name, 'rb') as file_:
+            encrypted = file_.read()
+        file_hash = sha256(encrypted).hexdigest()
+        self.stored[file_hash] = encrypted
+        target_name = os.path.join(self.directory, 'decrypted.txt')
+
+        def responder(handler):
+            return 200, {'X-Sendfile': target_name}, encrypted
+
+        server = RecordingHTTPServer(responder).start()
+        self.addCleanup(server.stop)
+        hash_list = ['{} {} decrypted.txt\n'.format(
+            file_hash, binascii.hexlify(key).decode())]
+        output = io.StringIO()
+        summary = batch.download_batch(
+            [server.url], self.sender_key, self.btctx_api, hash_list,
+            output=output
+        )
+        self.assertEqual(counts(summary), dict(succeeded=1, failed=0))
+        self.assertIn('file_alias=decrypted.txt',
+                      server.received[0]['path'])
+        with open(target_name, 'rb') as file_:
+            self.assertEqual(file_.read(), b'secret content')
+
+
+class TestBatchAuditList(unittest.TestCase):
+
+    def test_iter_audit_list(self):
+        lines = [
+            '# file_hash seed\n',
+            'HASH_1 SEED_1\n',
+            '\n',
+            '  HASH_2\tSEED_2  \n',
+            'HASH_3\n',
+            'HASH_4 SEED_4 spam\n',
+        ]
+        self.assertListEqual(list(batch.iter_audit_list(lines)), [
+            dict(line=2, file_hash='HASH_1', seed='SEED_1'),
+            dict(line=4, file_hash='HASH_2', seed='SEED_2'),
+            dict(line=5, file_hash='HASH_3', seed=None),
+            dict(line=6, file_hash='HASH_4', seed='SEED_4',
+                 error='expected the file hash and the seed'),
+        ])
+
+
+class TestBatchAudit(unittest.TestCase):
+    """
+    Test case of the ``metatool.batch.audit_batch()`` function.
+    """
+
+    def setUp(self):
+        self.stored = {}
+        for i in range(8):
+            content = os.urandom(100 + i)
+            self.stored[sha256(content).hexdigest()] = content
+        self.btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        self.sender_key = self.btctx_api.create_key()
+
+        def responder(handler):
+            form = parse_qs(handler.body.decode())
+            file_hash = form['data_hash'][0]
+            seed = form['challenge_seed'][0]
+            if file_hash not in self.stored:
+                return 404, {}, b'{"error_code": 404}'
+            return 201, {'Content-Type': 'application/json'}, json.dumps({
+                'data_hash': file_hash,
+                'challenge_seed': seed,
+                'challenge_response': sha256(
+                    self.stored[file_hash] + seed.encode()).hexdigest(),
+            }).encode()
+
+        self.bad_server = RecordingHTTPServer(
+            lambda handler: (503, {}, b'{"error_code": 503}')).start()
+        self.addCleanup(self.bad_server.stop)
+        self.server = RecordingHTTPServer(responder).start()
+        self.addCleanup(self.server.stop)
+
+    def test_audit_with_failover(self):
+        """
+        Test that every listed audit is answered by the healthy node,
+        once the failing one is skipped by the breaker, and the missing
+        file and the malformed line are reported with the errors.
+        """
+        audit_list = io.StringIO(''.join(
+            '{} seed{}\n'.format(file_hash, i)
+            for i, file_hash in enumerate(sorted(self.stored))
+        ) + 'MISSING_HASH seed\nMALFORMED_LINE\n')
+        output = io.StringIO()
+        summary = batch.audit_batch(
+            [self.bad_server.url, self.server.url], self.sender_key,
+            self.btctx_api, audit_list, workers=4, output=output,
+            breaker=CircuitBreaker(failure_threshold=1, path=False)
+        )
+        self.assertEqual(counts(summary), dict(succeeded=8, failed=2))
+        self.assertGreater(summary['per_second'], 0)
+        self.assertGreater(summary['signer']['hits'], 0)
+        self.assertLess(len(self.bad_server.received),
+                        4 * RetryPolicy().max_attempts + 1)
+        records = {}
+        for line in output.getvalue().splitlines():
+            record = json.loads(line)
+            records[record['file_hash']] = record
+        for i, file_hash in enumerate(sorted(self.stored)):
+            record = records[file_hash]
+            self.assertEqual(record['node'], self.server.url)
+            self.assertEqual(record['status'], 201)
+            self.assertEqual(record['seed'], 'seed{}'.format(i))
+            self.assertEqual(
+                record['challenge_response'],
+                sha256(self.stored[file_hash] +
+                       record['seed'].encode()).hexdigest()
+            )
+        self.assertEqual(records['MISSING_HASH']['line'], 9)
+        self.assertEqual(records['MISSING_HASH']['status'], 404)
+        self.assertEqual(records['MALFORMED_LINE']['error'],
+                         'expected the file hash and the seed')
+
+    def test_verify_responses(self):
+        """
+        Test that the responses are checked against the local copies and
+        the wrong one is reported with the error.
+        """
+        directory = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, directory)
+        for file_hash, content in self.stored.items():
+            with open(os.path.join(directory, file_hash), 'wb') as fp:
+                fp.write(content)
+        corrupted_hash = sorted(self.stored)[0]
+        self.stored[corrupted_hash] = b'corrupted data'
+        audit_list = ['{} seed\n'.format(file_hash)
+                      for file_hash in sorted(self.stored)]
+        output = io.StringIO()
+        summary = batch.audit_batch(
+            [self.server.url], self.sender_key, self.btctx_api, audit_list,
+            output=output, verify=directory
+        )
+        self.assertEqual(counts(summary), dict(succeeded=7, failed=1))
+        for line in output.getvalue().splitlines():
+            record = json.loads(line)
+            self.assertEqual(record['verified'],
+                             record['file_hash'] != corrupted_hash)
+            if record['file_hash'] == corrupted_hash:
+                self.assertEqual(record['error'],
+                                 'challenge response mismatch')
+
+    def test_banked_challenges(self):
+        """
+        Test that the challenges of the files listed without the seed are
+        taken from the bank once, and the responses are verified against
+        the banked ones.
+        """
+        directory = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, directory)
+        bank = ChallengeBank(os.path.join(directory, 'bank.sqlite'))
+        self.addCleanup(bank.close)
+        hashes = sorted(self.stored)[:3]
+        for file_hash in hashes:
+            bank.add(file_hash, [
+                (seed, sha256(self.stored[file_hash] +
+                              seed.encode()).hexdigest())
+                for seed in ('seed_1', 'seed_2')
+            ])
+        self.stored[hashes[0]] = b'corrupted data'
+        audit_list = ['{}\n'.format(file_hash) for file_hash in hashes]
+        output = io.StringIO()
+        for _ in range(3):
+            batch.audit_batch([self.server.url], self.sender_key,
+                              self.btctx_api, audit_list, output=output,
+                              bank=bank)
+        records = [json.loads(line)
+                   for line in output.getvalue().splitlines()]
+        self.assertEqual(len(records), 9)
+        self.assertEqual(len(self.server.received), 6)
+        for record in records:
+            if record['seed'] is None:
+                self.assertEqual(record['error'],
+                                 'no challenges left in the bank')
+            elif record['file_hash'] == hashes[0]:
+                self.assertFalse(record['verified'])
+                self.assertEqual(record['error'],
+                                 'challenge response mismatch')
+            else:
+                self.assertTrue(record['verified'])
+                self.assertNotIn('error', record)
+        self.assertEqual([record['seed'] for record in records
+                          if record['file_hash'] == hashes[1]],
+                         ['seed_1', 'seed_2', None])
+
+    def test_unsent_challenges_are_kept(self):
+        """
+        Test that the banked challenges, which didn't reach any node, are
+        returned to the bank.
+        """
+        directory = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, directory)
+        bank = ChallengeBank(os.path.join(directory, 'bank.sqlite'))
+        self.addCleanup(bank.close)
+        file_hash = sorted(self.stored)[0]
+        bank.add(file_hash, [('seed_1', sha256(
+            self.stored[file_hash] + b'seed_1').hexdigest())])
+        breaker = CircuitBreaker(failure_threshold=1, path=False)
+        breaker.record(self.server.url, False)
+        summary = batch.audit_batch([self.server.url], self.sender_key,
+                                    self.btctx_api, [file_hash],
+                                    breaker=breaker, bank=bank)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(bank.count(file_hash), 1)
+        # no nodes to answer the challenge
+        summary = batch.audit_batch([], self.sender_key, self.btctx_api,
+                                    [file_hash], bank=bank)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(bank.count(file_hash), 1)
+        output = io.StringIO()
+        batch.audit_batch([self.server.url], self.sender_key,
+                          self.btctx_api, [file_hash], output=output,
+                          bank=bank)
+        self.assertTrue(json.loads(output.getvalue())['verified'])
+        self.assertEqual(bank.count(file_hash), 0)
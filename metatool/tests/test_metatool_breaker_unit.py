@@ -0,0 +1,77 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from metatool.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+if sys.version_info.major == 3:
+    from unittest.mock import patch
+else:
+    from mock import patch
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """
+    Test case of the ``metatool.breaker.CircuitBreaker`` class.
+    """
+
+    def setUp(self):
+        self.now = 1000.0
+        time_patch = patch('metatool.breaker.time.time',
+                           lambda: self.now)
+        time_patch.start()
+        self.addCleanup(time_patch.stop)
+
+    def test_consecutive_failures_open_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=3, path=False)
+        breaker.record('node', False)
+        breaker.record('node', False)
+        breaker.record('node', True)
+        breaker.record('node', False)
+        breaker.record('node', False)
+        self.assertEqual(breaker.state('node'), CLOSED)
+        self.assertTrue(breaker.allow('node'))
+        breaker.record('node', False)
+        self.assertEqual(breaker.state('node'), OPEN)
+        self.assertFalse(breaker.allow('node'))
+        self.assertTrue(breaker.allow('other'))
+        self.assertRaises(ValueError, CircuitBreaker, 0)
+
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=10,
+                                 path=False)
+        breaker.record('node', False)
+        self.now += 10
+        self.assertEqual(breaker.state('node'), HALF_OPEN)
+        # the only trial call is let through
+        self.assertTrue(breaker.allow('node'))
+        self.assertFalse(breaker.allow('node'))
+        breaker.record('node', False)
+        self.now += 5
+        self.assertFalse(breaker.allow('node'))
+        self.now += 5
+        self.assertTrue(breaker.allow('node'))
+        breaker.record('node', True)
+        self.assertEqual(breaker.state('node'), CLOSED)
+        self.assertTrue(breaker.allow('node'))
+
+    def test_saved_between_runs(self):
+        temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, temp_dir)
+        path = os.path.join(temp_dir, 'breaker.json')
+        breaker = CircuitBreaker(failure_threshold=1, path=path)
+        breaker.record('node', False)
+        breaker.save()
+        self.assertEqual(CircuitBreaker(path=path).state('node'), CLOSED)
+        self.assertEqual(
+            CircuitBreaker(failure_threshold=1, path=path).state('node'),
+            OPEN
+        )
+        with open(path, 'w') as fp:
+            fp.write('broken')
+        self.assertEqual(
+            CircuitBreaker(failure_threshold=1, path=path).state('node'),
+            CLOSED
+        )
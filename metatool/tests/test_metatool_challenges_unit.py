@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from hashlib import sha256
+
+from btctxstore import BtcTxStore
+from file_encryptor import convergence
+
+from metatool import core
+from metatool import challenges
+from metatool import hashing
+from metatool.challenges import ChallengeBank
+
+if sys.version_info.major == 3:
+    from unittest.mock import patch
+else:
+    from mock import patch
+
+# make the parent tests package importable for the direct running
+parent_dir = os.path.dirname(os.path.dirname(__file__))
+if not parent_dir in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from tests.testing_server import RecordingHTTPServer, use_temp_state_dir
+
+
+def setUpModule():
+    # keep the state of the tested clients out of the user's home
+    global restore_state_dir
+    restore_state_dir = use_temp_state_dir()
+
+
+def tearDownModule():
+    restore_state_dir()
+
+
+def response(data, seed):
+    """
+    Get the expected response to the challenge of the data.
+    """
+    return sha256(data + seed.encode()).hexdigest()
+
+
+class TestChallengeBank(unittest.TestCase):
+    """
+    Test case of the ``metatool.challenges.ChallengeBank`` class.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.bank_path = os.path.join(self.temp_dir, 'bank.sqlite')
+
+    def test_generate_seeds(self):
+        seeds = challenges.generate_seeds(5)
+        self.assertEqual(len(set(seeds)), 5)
+        self.assertTrue(all(len(seed) == 2 * challenges.SEED_SIZE
+                            for seed in seeds))
+
+    def test_challenges_are_taken_once(self):
+        with ChallengeBank(self.bank_path) as bank:
+            bank.add('HASH', [('seed_1', 'RESPONSE_1'),
+                              ('seed_2', 'RESPONSE_2')])
+            bank.add('OTHER_HASH', [('seed_1', 'OTHER_RESPONSE')])
+        with ChallengeBank(self.bank_path) as bank:
+            self.assertEqual(bank.count('HASH'), 2)
+            self.assertEqual(bank.take('HASH'),
+                             dict(seed='seed_1', response='RESPONSE_1'))
+            self.assertEqual(bank.take('HASH'),
+                             dict(seed='seed_2', response='RESPONSE_2'))
+            self.assertIsNone(bank.take('HASH'))
+            self.assertEqual(bank.count('HASH'), 0)
+            self.assertEqual(bank.count('OTHER_HASH'), 1)
+            self.assertEqual(bank.find('HASH', 'seed_2'), 'RESPONSE_2')
+            self.assertIsNone(bank.find('HASH', 'seed_3'))
+
+    def test_released_challenge_is_taken_again(self):
+        with ChallengeBank(self.bank_path) as bank:
+            bank.add('HASH', [('seed_1', 'RESPONSE_1'),
+                              ('seed_2', 'RESPONSE_2')])
+            self.assertEqual(bank.take('HASH')['seed'], 'seed_1')
+            bank.release('HASH', 'seed_1')
+            self.assertEqual(bank.count('HASH'), 2)
+            self.assertEqual(bank.take('HASH')['seed'], 'seed_1')
+            bank.use('HASH', 'seed_1')
+            self.assertEqual(bank.take('HASH')['seed'], 'seed_2')
+        # the reservations aren't saved, the used challenges are
+        with ChallengeBank(self.bank_path) as bank:
+            self.assertEqual(bank.count('HASH'), 1)
+            self.assertEqual(bank.take('HASH')['seed'], 'seed_2')
+
+    def test_open_bank(self):
+        self.assertIsNone(challenges.open_bank(None))
+        with ChallengeBank(self.bank_path) as bank:
+            self.assertIs(challenges.open_bank(bank), bank)
+        with patch.dict(os.environ, {'METATOOL_HOME': self.temp_dir}):
+            bank = challenges.open_bank(True)
+            self.addCleanup(bank.close)
+        self.assertEqual(bank.path,
+                         os.path.join(self.temp_dir, 'challenges.sqlite'))
+
+    def test_bank_file(self):
+        content = os.urandom(20000)
+        file_name = os.path.join(self.temp_dir, 'file.txt')
+        with open(file_name, 'wb') as file_:
+            file_.write(content)
+        with open(file_name, 'rb') as file_:
+            result = json.loads(challenges.bank_file(
+                file_, 3, bank=self.bank_path, use_mmap=True))
+        data_hash = sha256(content).hexdigest()
+        self.assertEqual(result, dict(data_hash=data_hash, challenges=3))
+        with ChallengeBank(self.bank_path) as bank:
+            challenge = bank.take(data_hash)
+        self.assertEqual(challenge['response'],
+                         response(content, challenge['seed']))
+
+        convergence.encrypt_file_inline(file_name, None)
+        with open(file_name, 'rb') as file_:
+            encrypted = file_.read()
+        with open(file_name, 'wb') as file_:
+            file_.write(content)
+        with open(file_name, 'rb') as file_:
+            result = json.loads(challenges.bank_file(
+                file_, 2, encrypt=True, bank=self.bank_path))
+        self.assertEqual(result['data_hash'], sha256(encrypted).hexdigest())
+        with ChallengeBank(self.bank_path) as bank:
+            challenge = bank.take(result['data_hash'])
+        self.assertEqual(challenge['response'],
+                         response(encrypted, challenge['seed']))
+
+
+class TestCoreUploadWithChallenges(unittest.TestCase):
+    """
+    Test that the ``metatool.core.upload()`` banks the challenges of the
+    uploaded file with the same pass over it, which calculates the
+    ``data_hash``.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.content = os.urandom(100000)
+        self.file_name = os.path.join(self.temp_dir, 'file.txt')
+        with open(self.file_name, 'wb') as file_:
+            file_.write(self.content)
+        self.bank = ChallengeBank(os.path.join(self.temp_dir, 'bank.sqlite'))
+        self.addCleanup(self.bank.close)
+        self.status = 201
+        self.server = RecordingHTTPServer(
+            lambda handler: (self.status,
+                             {'Content-Type': 'application/json'},
+                             b'{}')).start()
+        self.addCleanup(self.server.stop)
+        btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        self.upload_param = dict(url_base=self.server.url,
+                                 btctx_api=btctx_api,
+                                 sender_key=btctx_api.create_key(),
+                                 file_role='001', bank=self.bank)
+
+    def test_challenges_of_single_pass(self):
+        data_hash = sha256(self.content).hexdigest()
+        with patch('metatool.hashing.iter_file_blocks',
+                   side_effect=hashing.iter_file_blocks) as mock_blocks:
+            with open(self.file_name, 'rb') as file_:
+                result = core.upload(file_=file_, challenges=4,
+                                     **self.upload_param)
+        self.assertEqual(result.status_code, 201)
+        self.assertEqual(mock_blocks.call_count, 1)
+        self.assertEqual(self.bank.count(data_hash), 4)
+        for _ in range(4):
+            challenge = self.bank.take(data_hash)
+            self.assertEqual(challenge['response'],
+                             response(self.content, challenge['seed']))
+
+    def test_failed_upload_is_not_banked(self):
+        self.status = 500
+        with open(self.file_name, 'rb') as file_:
+            core.upload(file_=file_, challenges=4, **self.upload_param)
+        self.assertEqual(self.bank.count(sha256(self.content).hexdigest()),
+                         0)
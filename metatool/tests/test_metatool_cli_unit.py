@@ -6,19 +6,45 @@ import binascii
 import random
 import string
 import argparse
+import json
+import shutil
+import tempfile
+import subprocess
 
 from requests.models import Response
 
 from metatool.cli import (show_data, parse, get_all_func_args, args_prepare,
-                          main, CORE_NODES_URL, decryption_key_type)
+                          main, CORE_NODES_URL, decryption_key_type,
+                          positive_int_type)
 from metatool import core
+from metatool import batch
 
 if sys.version_info.major == 3:
     from io import StringIO
-    from unittest.mock import patch, Mock, call, mock_open
+    from unittest.mock import patch, Mock, call, mock_open, ANY
 else:
     from io import BytesIO as StringIO
-    from mock import patch, Mock, call, mock_open
+    from mock import patch, Mock, call, mock_open, ANY
+
+import metatool.scoreboard
+import metatool.breaker
+import metatool.challenges
+from metatool import identity
+from metatool.state import STATE_DIR_ENV
+
+
+def setUpModule():
+    # keep the generated sender's key out of the user's state directory
+    global state_dir_patch
+    state_dir = tempfile.mkdtemp(prefix='metatool_test_')
+    state_dir_patch = patch.dict(os.environ, {STATE_DIR_ENV: state_dir})
+    state_dir_patch.start()
+    os.environ.pop(identity.SENDER_KEY_ENV, None)
+
+
+def tearDownModule():
+    shutil.rmtree(os.environ[STATE_DIR_ENV])
+    state_dir_patch.stop()
 
 
 class TestCliDecryptionKeyType(unittest.TestCase):
@@ -168,7 +194,9 @@ class TestCliParseFunction(unittest.TestCase):
             'execute_case': core.audit,
             'file_hash': args_list[1],
             'seed': args_list[2],
-            'url_base': None
+            'url_base': None,
+            'hedge': None,
+            'timeout': None,
         }
         parsed_args = parse().parse_args(args_list)
         real_parsed_args_dict = dict(parsed_args._get_kwargs())
@@ -195,7 +223,10 @@ class TestCliParseFunction(unittest.TestCase):
             'file_hash': args_list[1],
             'link': False,
             'rename_file': None,
-            'url_base': None
+            'url_base': None,
+            'chunk_size': core.DOWNLOAD_CHUNK_SIZE,
+            'hedge': None,
+            'timeout': None,
         }
         parsed_args = parse().parse_args(args_list)
         real_parsed_args_dict = dict(parsed_args._get_kwargs())
@@ -209,14 +240,18 @@ class TestCliParseFunction(unittest.TestCase):
         args_list = 'download FILE_HASH ' \
                     '--decryption_key {} ' \
                     '--rename_file TEST_RENAME_FILE ' \
-                    '--link'.format(test_dec_key.decode()).split()
+                    '--link --chunk_size 1024 --hedge 0.5'.format(
+                        test_dec_key.decode()).split()
         expected_args_dict = {
             'file_hash': args_list[1],
             'decryption_key': args_list[3],
             'rename_file': args_list[5],
             'link': True,
             'execute_case': core.download,
-            'url_base': None
+            'url_base': None,
+            'chunk_size': 1024,
+            'hedge': 0.5,
+            'timeout': None,
         }
         parsed_args = parse().parse_args(args_list)
         real_parsed_args_dict = dict(parsed_args._get_kwargs())
@@ -266,6 +301,10 @@ class TestCliParseFunction(unittest.TestCase):
             'url_base': None,
             'execute_case': core.upload,
             'encrypt': False,
+            'index': None,
+            'dedup': False,
+            'challenges': 0,
+            'timeout': None,
         }
         self.assertDictEqual(
             real_parsed_args_dict,
@@ -285,6 +324,10 @@ class TestCliParseFunction(unittest.TestCase):
             'url_base': args_list[3],
             'execute_case': core.upload,
             'encrypt': False,
+            'index': None,
+            'dedup': False,
+            'challenges': 0,
+            'timeout': None,
         }
         self.assertDictEqual(
             real_parsed_args_dict,
@@ -299,6 +342,15 @@ class TestCliParseFunction(unittest.TestCase):
         self.assertEqual(parsed_args.file_role, args_list[3])
         parsed_args.file_.close()
 
+        # test "--index" optional argument with and without the path
+        for args_list, expected_index in (
+                (['upload', full_file_path, '--index'], True),
+                (['upload', full_file_path, '--index', 'path.sqlite'],
+                 'path.sqlite')):
+            parsed_args = parse().parse_args(args_list)
+            self.assertEqual(parsed_args.index, expected_index)
+            parsed_args.file_.close()
+
     def test_info_argument(self):
         """
         Test of parsing appropriate default "core function".
@@ -311,6 +363,127 @@ class TestCliParseFunction(unittest.TestCase):
         parsed_args = parse().parse_args('files'.split())
         self.assertEqual(parsed_args.execute_case, core.files)
 
+    def test_hedge_argument(self):
+        """
+        Test of parsing the "--hedge" delay of the idempotent actions.
+        """
+        for action in ('files', 'info', 'audit HASH SEED', 'download HASH'):
+            parsed_args = parse().parse_args(action.split())
+            self.assertIsNone(parsed_args.hedge)
+            parsed_args = parse().parse_args(
+                '{} --hedge 0'.format(action).split())
+            self.assertEqual(parsed_args.hedge, 0)
+        with patch('sys.stderr', new_callable=StringIO):
+            for args in ('files --hedge -1', 'info --hedge spam',
+                         'upload-dir some/dir --hedge 1'):
+                with self.assertRaises(SystemExit):
+                    parse().parse_args(args.split())
+
+    def test_upload_dir_arguments(self):
+        """
+        Test of parsing the "upload-dir" arguments and their defaults.
+        """
+        parsed_args = parse().parse_args('upload-dir some/dir'.split())
+        self.assertEqual(parsed_args.execute_case, batch.upload_dir)
+        self.assertEqual(parsed_args.directory, 'some/dir')
+        self.assertEqual(parsed_args.file_role, '001')
+        self.assertEqual(parsed_args.workers, batch.DEFAULT_WORKERS)
+        self.assertFalse(parsed_args.encrypt)
+        self.assertIs(parsed_args.output, sys.stdout)
+
+        parsed_args = parse().parse_args(
+            'upload-dir some/dir --encrypt -r 002 -w 3'.split())
+        self.assertTrue(parsed_args.encrypt)
+        self.assertEqual(parsed_args.file_role, '002')
+        self.assertEqual(parsed_args.workers, 3)
+        self.assertEqual(parsed_args.hash_workers, 0)
+        parsed_args = parse().parse_args(
+            'upload-dir some/dir --hash-workers 16'.split())
+        self.assertEqual(parsed_args.hash_workers, 16)
+
+    def test_download_batch_arguments(self):
+        parsed_args = parse().parse_args('download-batch'.split())
+        self.assertEqual(parsed_args.execute_case, batch.download_batch)
+        self.assertIs(parsed_args.hash_list, sys.stdin)
+        self.assertEqual(parsed_args.workers, batch.DEFAULT_WORKERS)
+        self.assertIs(parsed_args.output, sys.stdout)
+
+        parsed_args = parse().parse_args(
+            'download-batch {} -w 32'.format(__file__).split())
+        self.assertEqual(parsed_args.hash_list.name, __file__)
+        self.assertEqual(parsed_args.workers, 32)
+        parsed_args.hash_list.close()
+
+    def test_audit_batch_arguments(self):
+        parsed_args = parse().parse_args('audit-batch'.split())
+        self.assertEqual(parsed_args.execute_case, batch.audit_batch)
+        self.assertIs(parsed_args.audit_list, sys.stdin)
+        self.assertEqual(parsed_args.workers, batch.DEFAULT_WORKERS)
+        self.assertIs(parsed_args.output, sys.stdout)
+        self.assertIsNone(parsed_args.timeout)
+        self.assertIsNone(parsed_args.verify)
+
+        parsed_args = parse().parse_args(
+            'audit-batch {} -w 64 --timeout 5 --verify some/dir'.format(
+                __file__).split())
+        self.assertEqual(parsed_args.audit_list.name, __file__)
+        self.assertEqual(parsed_args.workers, 64)
+        self.assertEqual(parsed_args.timeout, 5)
+        self.assertEqual(parsed_args.verify, 'some/dir')
+        parsed_args.audit_list.close()
+        parsed_args = parse().parse_args('audit-batch --verify'.split())
+        self.assertIs(parsed_args.verify, True)
+        self.assertFalse(parsed_args.bank)
+        parsed_args = parse().parse_args('audit-batch --bank'.split())
+        self.assertTrue(parsed_args.bank)
+
+    def test_challenges_arguments(self):
+        for action in ('upload {}'.format(__file__), 'upload-dir some/dir'):
+            parsed_args = parse().parse_args(
+                '{} --challenges 5'.format(action).split())
+            self.assertEqual(parsed_args.challenges, 5)
+            if hasattr(parsed_args, 'file_'):
+                parsed_args.file_.close()
+
+        parsed_args = parse().parse_args(
+            'challenges {}'.format(__file__).split())
+        self.assertEqual(parsed_args.execute_case,
+                         metatool.challenges.bank_file)
+        self.assertEqual(parsed_args.challenges,
+                         metatool.challenges.DEFAULT_CHALLENGES)
+        self.assertFalse(parsed_args.encrypt)
+        parsed_args.file_.close()
+        parsed_args = parse().parse_args(
+            'challenges {} -k 100 --encrypt'.format(__file__).split())
+        self.assertEqual(parsed_args.challenges, 100)
+        self.assertTrue(parsed_args.encrypt)
+        parsed_args.file_.close()
+
+    def test_timeout_argument(self):
+        """
+        Test of parsing the "--timeout" of the actions sending requests.
+        """
+        for action in ('files', 'info', 'audit HASH SEED', 'download HASH',
+                       'upload {}'.format(__file__), 'upload-dir some/dir',
+                       'download-batch', 'audit-batch'):
+            parsed_args = parse().parse_args(
+                '{} --timeout 2.5'.format(action).split())
+            self.assertEqual(parsed_args.timeout, 2.5)
+            for file_ in ('file_', 'hash_list', 'audit_list'):
+                if hasattr(parsed_args, file_):
+                    getattr(parsed_args, file_).close()
+        with patch('sys.stderr', new_callable=StringIO):
+            for args in ('files --timeout 0', 'info --timeout spam',
+                         'nodes --timeout 1'):
+                with self.assertRaises(SystemExit):
+                    parse().parse_args(args.split())
+
+    def test_positive_int_type(self):
+        self.assertEqual(positive_int_type('12'), 12)
+        for argument in ('0', '-3', 'spam'):
+            self.assertRaises(argparse.ArgumentTypeError,
+                              positive_int_type, argument)
+
 
 class TestCliArgumentsPreparation(unittest.TestCase):
     def test_get_all_func_args(self):
@@ -335,7 +508,7 @@ class TestCliArgumentsPreparation(unittest.TestCase):
             '"get_all_func_args" must return tuple like "expected_args_set" !'
         )
 
-    @patch('metatool.cli.BtcTxStore')
+    @patch('btctxstore.BtcTxStore')
     def test_args_prepare(self, mock_btctx_store):
         """
         Test on accurate setting-up all omitted required arguments
@@ -343,6 +516,10 @@ class TestCliArgumentsPreparation(unittest.TestCase):
         """
         mock_btctx_api = mock_btctx_store.return_value
         mock_btctx_api.create_key.return_value = 'TEST_SENDER_KEY'
+        key_file = os.path.join(os.environ[STATE_DIR_ENV],
+                                identity.SENDER_KEY_FILE_NAME)
+        if os.path.exists(key_file):
+            os.remove(key_file)
         # testing for minimal providing of arguments
         expected_args_dict = dict(
             one='TEST 1',
@@ -371,9 +548,27 @@ class TestCliArgumentsPreparation(unittest.TestCase):
             "The `args_prepare()` should provide the full set of arguments!"
         )
 
+        # the key is generated once and loaded by the next runs
+        mock_btctx_api.create_key.return_value = 'OTHER_SENDER_KEY'
+        self.assertEqual(
+            args_prepare(given_required_names,
+                         given_namespace)['sender_key'],
+            'TEST_SENDER_KEY'
+        )
+        self.assertEqual(mock_btctx_api.create_key.call_count, 1)
+
 
 class TestCliStarter(unittest.TestCase):
 
+    def setUp(self):
+        # the nodes are ranked and skipped by the results of the previous
+        # tests
+        for name in (metatool.scoreboard.DEFAULT_SCOREBOARD_NAME,
+                     metatool.breaker.DEFAULT_BREAKER_NAME):
+            path = os.path.join(os.environ[STATE_DIR_ENV], name)
+            if os.path.exists(path):
+                os.remove(path)
+
     @staticmethod
     def sys_stdout_help_run(tested_callable, sample_callable, *args):
         """
@@ -423,6 +618,11 @@ class TestCliStarter(unittest.TestCase):
             (['', 'download', '-h'], ['download', '-h']),
             (['', 'audit', '-h'], ['audit', '-h']),
             (['', 'upload', '-h'], ['upload', '-h']),
+            (['', 'upload-dir', '-h'], ['upload-dir', '-h']),
+            (['', 'download-batch', '-h'], ['download-batch', '-h']),
+            (['', 'audit-batch', '-h'], ['audit-batch', '-h']),
+            (['', 'challenges', '-h'], ['challenges', '-h']),
+            (['', 'nodes', '-h'], ['nodes', '-h']),
             (['', 'info', '--help'], ['info', '--help']),
             (['', 'files', '--help'], ['files', '--help']),
             (['', 'download', '--help'], ['download', '--help']),
@@ -445,7 +645,7 @@ class TestCliStarter(unittest.TestCase):
                     'sys.argv={}'.format(test_[0])
                 )
 
-    @patch('requests.get', side_effect=SystemExit)
+    @patch('requests.Session.get', side_effect=SystemExit)
     def test_url_env_providing(self, mock_requests_get):
         """
         Test to getting the `url_base` argument from the environment variable
@@ -464,7 +664,7 @@ class TestCliStarter(unittest.TestCase):
                     "Request should use the http://env.var.com address"
                 )
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_url_default_providing(self, mock_requests_get):
         """
         Test on default using the `url_base` argument from the CORE_NODES_URL
@@ -486,7 +686,7 @@ class TestCliStarter(unittest.TestCase):
             "Must be called in the order of `CORE_NODES_URL` list items"
         )
 
-    @patch('requests.get', side_effect=SystemExit)
+    @patch('requests.Session.get', side_effect=SystemExit)
     def test_url_parser_providing(self, mock_requests_get):
         """
         Test on priority of using the `--url` provided in the terminal.
@@ -597,7 +797,7 @@ class TestCliStarter(unittest.TestCase):
             'object!'
         )
 
-    @patch('metatool.cli.BtcTxStore')
+    @patch('btctxstore.BtcTxStore')
     @patch('metatool.cli.show_data', Mock())
     def test_omit_btctx_api_and_send_key_for_download_when_link_true(
             self, mock_btctxstore):
@@ -630,8 +830,9 @@ class TestCliStarter(unittest.TestCase):
             "The btctxstore.BtcTxStore module should not be called when "
             "the --link argument wasn't parsed!"
         )
+        # the "cancel" event is passed by the hedged calls only
         self.assertSetEqual(
-            omitted_args, {'btctx_api', 'sender_key'},
+            omitted_args, {'btctx_api', 'sender_key', 'cancel'},
             "Only btctx_api and sender_key arguments should not be passed "
             "to the download() call, when the `--link` argument is occurred."
         )
@@ -641,7 +842,7 @@ class TestCliStarter(unittest.TestCase):
             '"download" should be called only once!'
         )
 
-    @patch('metatool.cli.BtcTxStore')
+    @patch('btctxstore.BtcTxStore')
     @patch('metatool.cli.show_data', Mock())
     def test_prepare_btctx_api_and_send_key_for_download_when_link_true(
             self, mock_btctxstore):
@@ -653,6 +854,12 @@ class TestCliStarter(unittest.TestCase):
         """
         # Make a list of arguments for the parser.
         mock_sys_argv = '__file__ download FILE_HASH'.split()
+        # The key is generated, when there is no saved one.
+        key_file = os.path.join(os.environ[STATE_DIR_ENV],
+                                identity.SENDER_KEY_FILE_NAME)
+        if os.path.exists(key_file):
+            os.remove(key_file)
+        mock_btctxstore.return_value.create_key.return_value = 'SENDER_KEY'
         # Get argument's list from the "download" function before as mock it.
         download_available_args = get_all_func_args(core.download)
         # mock the Response object for the mocking the download's return
@@ -667,8 +874,9 @@ class TestCliStarter(unittest.TestCase):
                     main()
         passed_args = mock_download.call_args[1]
         omitted_args = set(download_available_args) - set(passed_args.keys())
+        # the "cancel" event is passed by the hedged calls only
         self.assertSetEqual(
-            omitted_args, set(),
+            omitted_args, {'cancel'},
             'Full set of arguments should be passed '
             'to the download() call, when the "--link" is not occured.'
         )
@@ -680,8 +888,191 @@ class TestCliStarter(unittest.TestCase):
             "credentials, as expected when the --link argument was parsed!"
 
         )
+        self.assertEqual(passed_args['sender_key'], 'SENDER_KEY')
         self.assertEqual(
             mock_download.call_count,
             1,
             '"download" should be called only once!'
-        )
\ No newline at end of file
+        )
+
+    @patch('metatool.cli.show_data')
+    def test_hedged_action(self, mock_show_data):
+        """
+        Test that the action with the "--hedge" argument is sent to the
+        nodes by the ``metatool.nodes.call_hedged()``.
+        """
+        with patch('metatool.nodes.call_hedged',
+                   return_value=('NODE', 'RESULT')) as mock_hedged:
+            with patch('metatool.nodes.call_with_failover') as mock_failover:
+                with patch('os.getenv', Mock(return_value=None)):
+                    with patch('sys.argv', ['', 'files', '--hedge', '0.2']):
+                        main()
+        mock_hedged.assert_called_once_with(ANY, CORE_NODES_URL,
+                                            delay=0.2, breaker=ANY,
+                                            deadline=None, cancellable=False,
+                                            timeout=None, url_base=None)
+        self.assertFalse(mock_failover.called)
+        mock_show_data.assert_called_once_with('RESULT')
+        # the action is timed for the scoreboard
+        self.assertIs(mock_hedged.call_args[0][0].__wrapped__, core.files)
+
+    @patch('metatool.cli.show_data')
+    def test_nodes_ranked_by_scoreboard(self, mock_show_data):
+        """
+        Test that the nodes are tried from the fastest healthy one, and the
+        results of the calls are saved to the scoreboard.
+        """
+        slow_node, fast_node = CORE_NODES_URL
+        scoreboard = metatool.scoreboard.Scoreboard()
+        scoreboard.record(slow_node, 2.0, True)
+        scoreboard.record(fast_node, 0.1, True)
+        scoreboard.save()
+        called_nodes = []
+
+        def failed_info(url_base=None):
+            called_nodes.append(url_base)
+            raise IOError('connection failed')
+
+        with patch('metatool.core.info', failed_info):
+            with patch('os.getenv', Mock(return_value=None)):
+                with patch('sys.argv', ['', 'info']):
+                    self.assertRaises(IOError, main)
+        self.assertEqual(called_nodes, [fast_node, slow_node])
+        stats = metatool.scoreboard.Scoreboard().stats
+        self.assertEqual(stats[fast_node]['errors'], 1)
+        self.assertEqual(stats[slow_node]['calls'], 2)
+
+        # a single failure doesn't make the node unhealthy
+        with patch('sys.argv', ['', 'nodes']):
+            with patch('os.getenv', Mock(return_value=None)):
+                main()
+        rankings = json.loads(mock_show_data.call_args[0][0])
+        self.assertEqual([item['node'] for item in rankings],
+                         [fast_node, slow_node])
+        self.assertEqual([item['healthy'] for item in rankings],
+                         [True, True])
+
+    def test_dead_node_is_skipped(self):
+        """
+        Test that the node failed several times in a row is skipped by
+        the next runs.
+        """
+        called_nodes = []
+
+        def info(url_base=None):
+            called_nodes.append(url_base)
+            raise IOError('connection refused')
+
+        with patch('metatool.core.info', info):
+            with patch('sys.argv', ['', 'info', '--url', 'http://dead/']):
+                for _ in range(5):
+                    self.assertRaises(EnvironmentError, main)
+        self.assertEqual(len(called_nodes),
+                         metatool.breaker.DEFAULT_FAILURE_THRESHOLD)
+        self.assertEqual(
+            metatool.breaker.CircuitBreaker().state('http://dead/'),
+            metatool.breaker.OPEN
+        )
+
+    @patch('metatool.cli.show_data')
+    def test_timeout_is_deadline_of_action(self, mock_show_data):
+        """
+        Test that the "--timeout" is the deadline shared by the nodes.
+        """
+        with patch('metatool.nodes.call_with_failover',
+                   return_value=('NODE', 'RESULT')) as mock_failover:
+            with patch('os.getenv', Mock(return_value=None)):
+                with patch('sys.argv', ['', 'info', '--timeout', '3']):
+                    main()
+        mock_failover.assert_called_once_with(
+            ANY, CORE_NODES_URL, breaker=ANY, deadline=3, timeout=3,
+            url_base=None)
+
+    @patch('metatool.cli.show_data')
+    def test_local_action(self, mock_show_data):
+        """
+        Test that the "challenges" action banks the challenges of the file
+        without calling the nodes.
+        """
+        file_name = os.path.join(os.environ[STATE_DIR_ENV], 'banked.txt')
+        with open(file_name, 'wb') as file_:
+            file_.write(os.urandom(1000))
+        with patch('metatool.nodes.call_with_failover') as mock_failover:
+            with patch('sys.argv', ['', 'challenges', file_name, '-k', '3']):
+                main()
+        self.assertFalse(mock_failover.called)
+        result = json.loads(mock_show_data.call_args[0][0])
+        self.assertEqual(result['challenges'], 3)
+        with metatool.challenges.ChallengeBank() as bank:
+            self.assertEqual(bank.count(result['data_hash']), 3)
+
+    def test_batch_action_gets_all_nodes(self):
+        """
+        Test that a batch action is called once with the whole list of
+        nodes and it's summary is printed to the stderr.
+        """
+        calls = []
+
+        def fake_upload_dir(nodes, sender_key, btctx_api, directory,
+                            file_role='001', encrypt=False, workers=8,
+                            output=None):
+            calls.append(dict(nodes=nodes, directory=directory,
+                              workers=workers))
+            return dict(succeeded=2, failed=1)
+
+        with patch('metatool.batch.upload_dir', fake_upload_dir):
+            with patch('sys.stderr', new_callable=StringIO) as mock_stderr:
+                with patch('os.getenv', Mock(return_value=None)):
+                    with patch('sys.argv',
+                               ['', 'upload-dir', 'some/dir', '-w', '2']):
+                        main()
+        self.assertListEqual(
+            calls,
+            [dict(nodes=CORE_NODES_URL, directory='some/dir', workers=2)]
+        )
+        self.assertEqual(mock_stderr.getvalue().strip(),
+                         '{"failed": 1, "succeeded": 2}')
+
+
+class TestCliStartup(unittest.TestCase):
+    """
+    Test of the CLI startup for the actions, which don't send requests.
+    """
+
+    #: Modules, which must not be imported by the tested actions.
+    HEAVY_MODULES = ('requests', 'btctxstore', 'aiohttp', 'Crypto',
+                     'file_encryptor', 'sqlite3', 'multiprocessing')
+
+    SCRIPT = """\
+import json, os, sys
+import metatool.cli
+sys.argv = ['metatool'] + sys.argv[1:]
+metatool.cli.main()
+print(json.dumps(dict(
+    heavy=sorted(name for name in {heavy!r} if name in sys.modules),
+    state=os.listdir(os.environ['METATOOL_HOME']),
+)))
+"""
+
+    def run_cli(self, *args):
+        """
+        Run the CLI in the separate interpreter with the empty state
+        directory and get the imported heavy modules and the saved state
+        files.
+        """
+        package_dir = os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))))
+        script = self.SCRIPT.format(heavy=self.HEAVY_MODULES)
+        state_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, state_dir)
+        output = subprocess.check_output(
+            [sys.executable, '-c', script] + list(args),
+            cwd=package_dir,
+            env=dict(os.environ, **{STATE_DIR_ENV: state_dir})
+        )
+        return json.loads(output.decode().strip().splitlines()[-1])
+
+    def test_download_link_startup(self):
+        result = self.run_cli('download', 'a' * 64, '--link')
+        self.assertEqual(result['heavy'], [])
+        self.assertEqual(result['state'], [])
@@ -2,6 +2,8 @@ from __future__ import print_function
 import json
 import os
 import sys
+import shutil
+import tempfile
 import threading
 import time
 import unittest
@@ -40,6 +42,9 @@ class MetadiskTest(unittest.TestCase):
         # Set the test server address like an environment variable which will
         # be used by the __main__.py whilst the testing.
         os.environ['MEATADISKSERVER'] = 'http://{}:{}'.format(host, port)
+        # Keep the generated sender's key in the temporary state directory.
+        cls.state_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        os.environ['METATOOL_HOME'] = cls.state_dir
         path = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
         os.chdir(path)
 
@@ -47,6 +52,8 @@ class MetadiskTest(unittest.TestCase):
     def tearDownClass(cls):
         cls.server.shutdown()
         cls.server.server_close()
+        os.environ.pop('METATOOL_HOME', None)
+        shutil.rmtree(cls.state_dir)
 
     def test_info(self):
         """
@@ -1,38 +1,192 @@
 import os
 import sys
+import time
+import threading
+import itertools
 import unittest
 import binascii
 import tempfile
 import shutil
 import filecmp
 import json
+import requests
 from requests.models import Response
 from btctxstore import BtcTxStore
 from hashlib import sha256
 from metatool import core
+from metatool.breaker import CircuitBreaker, CircuitOpenError, OPEN
+from metatool.multipart import MultipartEncoder
+from metatool.encryption import (StreamCipher, EncryptingReader,
+                                 convergent_key)
 
 if sys.version_info.major == 3:
-    from unittest.mock import patch, Mock, call, mock_open
+    from unittest.mock import patch, Mock, call
     from urllib.parse import urljoin, quote_plus, urlparse
 else:
-    from mock import patch, Mock, call, mock_open
+    from mock import patch, Mock, call
     from urlparse import urljoin, urlparse
     from urllib import quote_plus
     
 from file_encryptor import convergence
 
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
 # make the parent tests package importable for the direct running
 parent_dir = os.path.dirname(os.path.dirname(__file__))
 if not parent_dir in sys.path:
     sys.path.insert(0, parent_dir)
 
 
+from tests.testing_server import RecordingHTTPServer, use_temp_state_dir
+
+
+def setUpModule():
+    # keep the state of the tested clients out of the user's home
+    global restore_state_dir
+    restore_state_dir = use_temp_state_dir()
+
+
+def tearDownModule():
+    restore_state_dir()
+
+
+class TestCoreClient(unittest.TestCase):
+    """
+    Test-case for the ``metatool.core.MetaToolClient`` class and the shared
+    client used by the API functions.
+    """
+
+    def setUp(self):
+        self.addCleanup(core.set_default_client, None)
+
+    def test_session_configuration(self):
+        """
+        Test of mounting the pooled adapter and setting default headers.
+        """
+        client = core.MetaToolClient(pool_connections=3, pool_maxsize=7,
+                                     headers={'X-Test': 'value'})
+        self.addCleanup(client.close)
+        for prefix in ('http://', 'https://'):
+            adapter = client.session.get_adapter(prefix + 'test.url.com')
+            self.assertEqual(adapter._pool_connections, 3)
+            self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(client.session.headers['X-Test'], 'value')
+
+        session = Mock()
+        self.assertIs(core.MetaToolClient(session=session).session, session)
+
+    def test_api_functions_use_shared_client(self):
+        """
+        Test that the API functions delegate to the shared client, which is
+        created once and can be replaced.
+        """
+        shared_client = core.get_default_client()
+        self.assertIsInstance(shared_client, core.MetaToolClient)
+        self.assertIs(core.get_default_client(), shared_client)
+
+        mock_client = Mock()
+        core.set_default_client(mock_client)
+        self.assertIs(core.info('http://test.url.com'),
+                      mock_client.info.return_value)
+        self.assertIs(core.files('http://test.url.com'),
+                      mock_client.files.return_value)
+        mock_client.info.assert_called_once_with('http://test.url.com',
+                                                 None)
+        mock_client.files.assert_called_once_with('http://test.url.com',
+                                                  None)
+
+        core.set_default_client(None)
+        self.assertIsNot(core.get_default_client(), mock_client)
+
+    def test_connection_keep_alive(self):
+        """
+        Test that the sequential calls to the same node reuse the single
+        kept-alive connection.
+        """
+        server = RecordingHTTPServer(
+            lambda handler: (200, {'Content-Type': 'application/json'},
+                             b'[]')
+        ).start()
+        self.addCleanup(server.stop)
+        with core.MetaToolClient() as client:
+            for _ in range(5):
+                self.assertEqual(client.files(server.url).status_code, 200)
+                self.assertEqual(client.info(server.url).status_code, 200)
+        client_addresses = set(
+            request['client_address'] for request in server.received)
+        self.assertEqual(len(server.received), 10)
+        self.assertEqual(len(client_addresses), 1,
+                         'All requests should use the same connection!')
+
+    def test_request_timeouts(self):
+        """
+        Test that the requests wait for the slow node no longer than the
+        client's timeout, or than the operation's time budget.
+        """
+        def slow_responder(handler):
+            time.sleep(0.5)
+            return 200, {}, b'[]'
+
+        server = RecordingHTTPServer(slow_responder).start()
+        self.addCleanup(server.stop)
+        with core.MetaToolClient(timeout=(1, 0.1)) as client:
+            self.assertRaises(requests.exceptions.Timeout,
+                              client.files, server.url)
+        with core.MetaToolClient(timeout=None) as client:
+            self.assertRaises(requests.exceptions.Timeout,
+                              client.info, server.url, timeout=0.1)
+            self.assertEqual(client.info(server.url).status_code, 200)
+        self.assertEqual(core._limit_timeout((10, 60), 30), (10, 30))
+        self.assertEqual(core._limit_timeout(None, 5), (5, 5))
+
+    def test_used_up_time_budget(self):
+        """
+        Test that the request isn't sent, when the time budget of the
+        operation is already over, and the timeout error is raised.
+        """
+        session = Mock()
+        client = core.MetaToolClient(session=session, files_cache=False)
+        for budget in (0, -0.5):
+            self.assertRaises(requests.exceptions.Timeout, client._send,
+                              'get', 'http://test.url.com/', budget)
+            self.assertRaises(requests.exceptions.Timeout, client.info,
+                              'http://test.url.com/', timeout=budget)
+        self.assertFalse(session.get.called)
+
+    def test_breaker_skips_failed_node(self):
+        """
+        Test that the client's breaker counts the server errors and the
+        connection errors of the node, and skips the node failed several
+        times in a row.
+        """
+        session = Mock()
+        session.get.side_effect = [
+            Mock(status_code=500),
+            requests.exceptions.ConnectionError('refused'),
+            Mock(status_code=200),
+        ]
+        breaker = CircuitBreaker(failure_threshold=2, path=False)
+        client = core.MetaToolClient(session=session, files_cache=False,
+                                     retry=False, breaker=breaker)
+        self.assertEqual(client.info('http://node1/').status_code, 500)
+        self.assertRaises(requests.exceptions.ConnectionError,
+                          client.info, 'http://node1/')
+        self.assertEqual(breaker.state('http://node1/'), OPEN)
+        self.assertRaises(CircuitOpenError, client.info, 'http://node1/')
+        self.assertEqual(session.get.call_count, 2)
+        # the other nodes are called as usual
+        self.assertEqual(client.info('http://node2/').status_code, 200)
+
+
 class TestCoreFiles(unittest.TestCase):
     """
     Test-case for the ``metatool.core.files()`` API function.
     """
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_use_url_argument(self, mock_requests_get):
         """
         Test of making the GET-request with provided ``url_base`` argument
@@ -64,7 +218,7 @@ class TestCoreInfo(unittest.TestCase):
     Test-case for the ``metatool.core.info()`` API function.
     """
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_use_url_argument(self, mock_requests_get):
         """
         Test of making the GET-request with provided ``url_base`` argument
@@ -108,7 +262,7 @@ class TestCoreUpload(unittest.TestCase):
         self.test_source_file.flush()
 
         # Mock the ``requests`` package.
-        self.post_patch = patch('requests.post')
+        self.post_patch = patch('requests.Session.post')
         self.mock_post = self.post_patch.start()
         self.mock_post.return_value = Response()
 
@@ -134,22 +288,22 @@ class TestCoreUpload(unittest.TestCase):
             data_hash = sha256(temp_file_obj.read()).hexdigest()
             upload_call_result = core.upload(file_=temp_file_obj,
                                              **self.upload_param)
+            args, kwargs = self.mock_post.call_args
+            sent_body = kwargs['data']
+            expected_headers = {
+                'Content-Type': sent_body.content_type,
+                'sender-address': self.upload_param[
+                    'btctx_api'
+                    ].get_address(self.upload_param['sender_key']),
+                'signature':  self.upload_param[
+                    'btctx_api'
+                    ].sign_unicode(self.upload_param['sender_key'],
+                                   data_hash)
+            }
             expected_calls = [call(
                 urljoin(self.upload_param['url_base'], '/api/files/'),
-                data={
-                    'data_hash': data_hash,
-                    'file_role': self.upload_param['file_role'],
-                },
-                files={'file_data': temp_file_obj},
-                headers={
-                    'sender-address': self.upload_param[
-                        'btctx_api'
-                        ].get_address(self.upload_param['sender_key']),
-                    'signature':  self.upload_param[
-                        'btctx_api'
-                        ].sign_unicode(self.upload_param['sender_key'],
-                                       data_hash)
-                }
+                data=sent_body,
+                headers=expected_headers
             )]
 
         self.assertListEqual(
@@ -157,6 +311,17 @@ class TestCoreUpload(unittest.TestCase):
             expected_calls,
             'In the upload() function requests.post() calls are unexpected!'
         )
+        self.assertIsInstance(sent_body, MultipartEncoder,
+                              'The body must be sent by the streaming '
+                              'multipart encoder!')
+        self.assertListEqual(
+            sent_body.fields,
+            [('data_hash', data_hash),
+             ('file_role', self.upload_param['file_role'])],
+            'Unexpected form fields of the sent body!'
+        )
+        self.assertIs(sent_body.file_, temp_file_obj)
+        self.assertEqual(sent_body.file_field, 'file_data')
         self.assertIs(
             self.mock_post.return_value,
             upload_call_result,
@@ -164,11 +329,64 @@ class TestCoreUpload(unittest.TestCase):
             '``requests.post()``.'
         )
 
+    def test_failed_key_derivation_closes_file(self):
+        """
+        Test that the file opened for the encryption is closed, when the
+        key can't be derived.
+        """
+        opened = []
+
+        def open_file(*args):
+            opened.append(open(*args))
+            return opened[-1]
+
+        with patch('metatool.core.open', create=True, side_effect=open_file):
+            with patch('metatool.encryption.convergent_key',
+                       side_effect=IOError('read error')):
+                with open(self.test_source_file.name, 'rb') as file_:
+                    self.assertRaises(IOError, core.upload, file_=file_,
+                                      encrypt=True, **self.upload_param)
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].closed)
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc is not available')
+    def test_upload_peak_memory_is_bounded(self):
+        """
+        Test that calculating the ``data_hash`` of a big file doesn't read
+        the whole file into the memory.
+        """
+        file_size = 32 * 1024 * 1024
+        memory_ceiling = 2 * 1024 * 1024
+        big_file = tempfile.NamedTemporaryFile(prefix='tmp_', suffix='.spam',
+                                               dir=self.testing_dir)
+        self.addCleanup(big_file.close)
+        block = b'x' * 1024 * 1024
+        for _ in range(file_size // len(block)):
+            big_file.write(block)
+        big_file.flush()
+        for use_mmap in (False, True):
+            with open(big_file.name, 'rb') as file_obj:
+                tracemalloc.start()
+                try:
+                    core.upload(file_=file_obj, use_mmap=use_mmap,
+                                **self.upload_param)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            self.assertLess(
+                peak, memory_ceiling,
+                'upload() of the {} bytes file with use_mmap={} has '
+                'allocated {} bytes at peak!'.format(file_size, use_mmap, peak)
+            )
+            args, kwargs = self.mock_post.call_args
+            self.assertEqual(dict(kwargs['data'].fields)['data_hash'],
+                             sha256(block * (file_size // len(block))
+                                    ).hexdigest())
+
     def test_doesnt_encrypt_original_file(self):
         """
         Check that when the ``encrypt=True`` the source file remains the
-        same, but the temporary copy of this file was created, encrypted
-        and uploaded.
+        same, but it's data is encrypted on the fly and uploaded.
         """
         # Check that by default (encrypt=False) API passes the original file
         # object to the requests.post().
@@ -176,7 +394,7 @@ class TestCoreUpload(unittest.TestCase):
             core.upload(file_=temp_file_obj, **self.upload_param)
             # get the source file object used as encrypted sent data.
             args, kwargs = self.mock_post.call_args
-            self.assertIs(kwargs['files']['file_data'], temp_file_obj,
+            self.assertIs(kwargs['data'].file_, temp_file_obj,
                           'When encrypt=False the upload() should use '
                           'exactly the originally passed object!')
 
@@ -186,10 +404,10 @@ class TestCoreUpload(unittest.TestCase):
             core.upload(encrypt=True, file_=temp_file_obj, **self.upload_param)
             # get the source file object used as encrypted sent data.
             args, kwargs = self.mock_post.call_args
-            self.assertIsNot(kwargs['files']['file_data'], temp_file_obj,
-                             "When encrypt=True the upload() should make a "
-                             "copy of originally passed file object and "
-                             "processing this copy now!")
+            self.assertIsInstance(kwargs['data'].file_, EncryptingReader,
+                                  "When encrypt=True the upload() should "
+                                  "send the encrypted data of originally "
+                                  "passed file!")
 
         # Check that the originally passed to the API function file object
         # wasn't changed.
@@ -235,15 +453,15 @@ class TestCoreUpload(unittest.TestCase):
             It asserts that file, which is passed to the ``requests.post()``
             are properly encrypted.
 
-            It will be called inside the upload function, where is temporary
-            encrypted copy of original file is available.
+            It will be called inside the upload function, where is the
+            streamed body with encrypted data of original file is available.
 
             :param args: positional arguments of the ``requests.post()`` func.
             :param kwargs: optional args of the ``requests.post()`` func.
             :return: empty response object
             :rtype: requests.models.Response object
             """
-            tested_file_obj = kwargs['files']['file_data']
+            sent_body = b''.join(kwargs['data'])
             sampler_encrypted_file_name = os.path.join(
                 self.testing_dir,
                 'copy_' + os.path.split(test_source_file.name)[-1]
@@ -254,9 +472,12 @@ class TestCoreUpload(unittest.TestCase):
             convergence.encrypt_file_inline(
                 sampler_encrypted_file_name, None
             )
-            self.assertTrue(
-                filecmp.cmp(tested_file_obj.name, sampler_encrypted_file_name),
-                "A generated copy of the file that was originally passed "
+            with open(sampler_encrypted_file_name, 'rb') as sampler_file:
+                sampler_encrypted_data = sampler_file.read()
+            self.assertIn(
+                b'\r\n\r\n' + sampler_encrypted_data + b'\r\n--',
+                sent_body,
+                "The sent data of the file that was originally passed "
                 "to upload(), should be the same as encrypted test sampler "
                 "file!"
             )
@@ -300,55 +521,35 @@ class TestCoreUpload(unittest.TestCase):
             "Response content should remains unchanged!"
         )
 
-    def test_delete_temporary_copy_when_encrypt(self):
+    def test_no_temporary_copy_when_encrypt(self):
         """
-        Test, whether the temporary file was created and deleted in the
-        course of ``upload()`` function running with ``encrypt=True``.
+        Test, that no temporary copy of the file is created in the course
+        of ``upload()`` function running with ``encrypt=True`` - the sent
+        data is read from the original file.
         """
-        initial_existed_file_name = os.path.abspath(__file__)
-        self.tested_temp_file_name = initial_existed_file_name
-        self.addCleanup(delattr, self, 'tested_temp_file_name')
-        self.assertTrue(
-            os.path.exists(self.tested_temp_file_name),
-            "Setting up the test fixture was failed!"
-        )
+        sent_file_names = []
 
-        def internal_temp_file_checker(*args, **kwargs):
+        def internal_sent_file_checker(*args, **kwargs):
             """
             This function will be called by "upload" core function,
             instead of performing POST-request to the MetaCore server.
-            It ensures existence of the temporary file whilst running
-            API's function, because this is only time when this file exists.
-            It assigns the name of this file to the test instance attribute
-            for further testing the deletion of this file.
+            It saves the name of the file, which data is sent.
 
             :param args: positional arguments of the ``requests.post()`` func.
             :param kwargs: optional args of the ``requests.post()`` func.
             :return: empty response object
             :rtype: requests.models.Response object
             """
-            self.tested_temp_file_name = kwargs['files']['file_data'].name
-            self.assertTrue(
-                os.path.exists(self.tested_temp_file_name),
-                "Temporary copy of the source file object doesn't exists!"
-            )
+            sent_file_names.append(kwargs['data'].file_.name)
             return Response()
 
-        self.mock_post.side_effect = internal_temp_file_checker
-        core.upload(file_=self.test_source_file, encrypt=True,
-                    **self.upload_param)
-
-        self.assertNotEqual(
-            self.tested_temp_file_name,
-            initial_existed_file_name,
-            'The name of tested temporary file name has not been obtained '
-            'whilst "upload" function running!'
-        )
-        self.assertFalse(
-            os.path.exists(self.tested_temp_file_name),
-            'Temporary file should be deleted after calling the "upload()" '
-            'function!'
-        )
+        self.mock_post.side_effect = internal_sent_file_checker
+        with patch('tempfile.mkdtemp') as mock_mkdtemp:
+            core.upload(file_=self.test_source_file, encrypt=True,
+                        **self.upload_param)
+        self.assertFalse(mock_mkdtemp.called,
+                         'The temporary directory should not be created!')
+        self.assertListEqual(sent_file_names, [self.test_source_file.name])
 
     def test_dont_add_decryption_key_in_json_when_not_encrypt(self):
         """
@@ -438,12 +639,124 @@ class TestCoreUpload(unittest.TestCase):
         )
 
 
+class TestCoreUploadDedup(unittest.TestCase):
+    """
+    Test of the ``dedup`` argument of the ``metatool.core.upload()``.
+    """
+    def setUp(self):
+        self.test_source_file = tempfile.NamedTemporaryFile(
+            prefix='tmp_', suffix='.spam', mode='w+b')
+        self.test_source_file.write(b'some file content')
+        self.test_source_file.flush()
+        self.data_hash = sha256(b'some file content').hexdigest()
+
+        self.get_patch = patch('requests.Session.get')
+        self.mock_get = self.get_patch.start()
+        self.mock_get.return_value = Response()
+        self.mock_get.return_value.status_code = 200
+        self.mock_get.return_value._content = json.dumps(
+            [self.data_hash]).encode('ascii')
+        self.post_patch = patch('requests.Session.post')
+        self.mock_post = self.post_patch.start()
+        self.mock_post.return_value = Response()
+        self.mock_post.return_value.status_code = 201
+
+        btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        self.upload_param = dict(
+            url_base='http://test.url.com',
+            btctx_api=btctx_api,
+            sender_key=btctx_api.create_key(),
+            file_role='101',
+        )
+        # every check gets the list from the node
+        core.set_default_client(core.MetaToolClient(files_cache=False))
+
+    def tearDown(self):
+        core.set_default_client(None)
+        self.get_patch.stop()
+        self.post_patch.stop()
+        self.test_source_file.close()
+
+    def upload(self, **kwargs):
+        with open(self.test_source_file.name, 'rb') as file_:
+            return core.upload(file_=file_, dedup=True,
+                               **dict(self.upload_param, **kwargs))
+
+    def test_stored_file_is_not_sent(self):
+        """
+        Test that the file, listed by the node, isn't sent, and the
+        response looks like the response of the successful uploading.
+        """
+        response = self.upload()
+        self.mock_get.assert_called_once_with(
+            urljoin(self.upload_param['url_base'], '/api/files/'))
+        self.assertFalse(self.mock_post.called)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.url,
+                         urljoin(self.upload_param['url_base'],
+                                 '/api/files/'))
+        self.assertDictEqual(response.json(),
+                             {'data_hash': self.data_hash,
+                              'file_role': '101'})
+
+    def test_stored_encrypted_file_gets_decryption_key(self):
+        """
+        Test that the skipped encrypted file still gets the
+        ``decryption_key`` in the response.
+        """
+        with open(self.test_source_file.name, 'rb') as file_:
+            key = convergent_key(file_)
+            file_.seek(0)
+            data_hash = sha256(
+                StreamCipher(key).transform(file_.read())).hexdigest()
+        self.mock_get.return_value._content = json.dumps(
+            [data_hash]).encode('ascii')
+        response = self.upload(encrypt=True)
+        self.assertFalse(self.mock_post.called)
+        self.assertDictEqual(
+            response.json(),
+            {'data_hash': data_hash, 'file_role': '101',
+             'decryption_key': binascii.hexlify(key).decode()}
+        )
+
+    def test_missing_file_is_sent(self):
+        """
+        Test that the file, which isn't listed by the node, is uploaded.
+        """
+        self.mock_get.return_value._content = b'[]'
+        response = self.upload()
+        self.assertTrue(self.mock_post.called)
+        self.assertIs(response, self.mock_post.return_value)
+
+    def test_unavailable_list_of_files(self):
+        """
+        Test that the file is uploaded, when the list of files can't be
+        got from the node.
+        """
+        self.mock_get.return_value.status_code = 500
+        self.mock_get.return_value._content = b'Internal Server Error'
+        self.assertIs(self.upload(), self.mock_post.return_value)
+
+        self.mock_get.side_effect = requests.ConnectionError
+        self.assertIs(self.upload(), self.mock_post.return_value)
+
+    def test_no_check_by_default(self):
+        """
+        Test that the node's list of files isn't requested without the
+        ``dedup`` argument.
+        """
+        with open(self.test_source_file.name, 'rb') as file_:
+            core.upload(file_=file_, **self.upload_param)
+        self.assertFalse(self.mock_get.called)
+        self.assertTrue(self.mock_post.called)
+
+
 class TestCoreAudit(unittest.TestCase):
     """
     Test of the ``metatool.core.audit()`` API function.
     """
     def setUp(self):
-        self.post_patch = patch('requests.post')
+        self.post_patch = patch('requests.Session.post')
         self.mock_post = self.post_patch.start()
         self.mock_post.return_value = Response()
 
@@ -492,14 +805,14 @@ class TestCoreDownload(unittest.TestCase):
     Test case for the ``metatool.core.download()`` API function.
     """
     def setUp(self):
-        self.post_patch = patch('requests.get')
+        self.post_patch = patch('requests.Session.get')
         self.mock_get = self.post_patch.start()
 
         # set common data for tests
         self.test_url_address = 'http://test.url.com'
         self.file_content = b'some test data'
         self.file_hash = sha256(self.file_content).hexdigest()
-        self.test_data_for_requests = dict(params={})
+        self.test_data_for_requests = dict(params={}, stream=True)
 
         # initial filling the base response object
         self.mock_get.return_value = Mock()
@@ -507,6 +820,8 @@ class TestCoreDownload(unittest.TestCase):
         mock_response.status_code = 200
         mock_response.headers = {'X-Sendfile': self.file_hash}
         mock_response.content = self.file_content
+        mock_response.iter_content.side_effect = \
+            lambda chunk_size: iter([self.file_content])
 
     def tearDown(self):
         self.post_patch.stop()
@@ -667,8 +982,18 @@ class TestCoreDownload(unittest.TestCase):
             ' and "file_hash" arguments are given to the core.download()'
         )
 
-    @patch('core.file_encryptor.convergence.decrypt_file_inline')
-    def test_provide_decryption_key(self, mock_decryptor):
+    def decrypted_content(self, decryption_key):
+        """
+        Decrypt the served content with the ``file_encryptor`` itself.
+        """
+        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+            temp_file.write(self.file_content)
+        self.addCleanup(os.unlink, temp_file.name)
+        convergence.decrypt_file_inline(temp_file.name, decryption_key)
+        with open(temp_file.name, 'rb') as temp_file:
+            return temp_file.read()
+
+    def test_provide_decryption_key(self):
         """
         Test of providing ``decryption_key`` to the ``core.download()``.
         """
@@ -676,18 +1001,11 @@ class TestCoreDownload(unittest.TestCase):
         self.mock_get.return_value.status_code = 200
         decryption_key = b'test 32 character long key......'
         decryption_key_hex = binascii.hexlify(decryption_key)
-        self.test_data_for_requests = dict(params={})
+        self.test_data_for_requests = dict(params={}, stream=True)
 
-        # Get a appropriate "builtin" module name for pythons 2/3
-        # and mocking the builtin `open` function.
-        if sys.version_info.major == 3:
-            builtin_module_name = 'builtins'
-        else:
-            builtin_module_name = '__builtin__'
-        with patch('{}.open'.format(builtin_module_name),
-                   mock_open(), create=False):
-            core.download(self.test_url_address, self.file_hash,
-                          decryption_key=decryption_key_hex)
+        self.addCleanup(os.unlink, os.path.abspath(self.file_hash))
+        core.download(self.test_url_address, self.file_hash,
+                      decryption_key=decryption_key_hex)
 
         # Test of args, passed to `requests.get()` in the `core.download()`.
         expected_request_args = [call(
@@ -701,19 +1019,14 @@ class TestCoreDownload(unittest.TestCase):
             '"file_hash" and "decryption_key" arguments are given to the '
             'core.download()'
         )
-        # Test of args, passed to
-        # `core.file_encryptor.convergence.decrypt_file_inline()`
-        # in the `core.download()`.
-        expected_decryption_args = [call(
-            os.path.join(os.path.abspath(self.file_hash)),
-            decryption_key)]
-        self.assertListEqual(
-            mock_decryptor.call_args_list,
-            expected_decryption_args,
-            'Wrong call of the '
-            'core.file_encryptor.convergence.decrypt_file_inline() inside '
-            'the metatool.core.download() function.'
-        )
+        # Test that the saved file is decrypted like with the
+        # `file_encryptor.convergence.decrypt_file_inline()`.
+        with open(self.file_hash, 'rb') as downloaded_file:
+            self.assertEqual(
+                downloaded_file.read(),
+                self.decrypted_content(decryption_key),
+                "The downloaded file isn't properly decrypted"
+            )
 
     def test_provide_rename_file(self):
         """
@@ -724,7 +1037,7 @@ class TestCoreDownload(unittest.TestCase):
         file_alias = 'some new name'
         self.test_data_for_requests = dict(params={
             'file_alias': file_alias
-        })
+        }, stream=True)
         core.download(self.test_url_address, self.file_hash,
                       rename_file=file_alias)
 
@@ -741,8 +1054,7 @@ class TestCoreDownload(unittest.TestCase):
             'to the core.download()'
         )
 
-    @patch('core.file_encryptor.convergence.decrypt_file_inline')
-    def test_provide_rename_file_and_decryption_key(self, mock_decryptor):
+    def test_provide_rename_file_and_decryption_key(self):
         """
         Test of providing ``file_alias`` to the ``core.download()``.
         """
@@ -754,18 +1066,11 @@ class TestCoreDownload(unittest.TestCase):
         self.mock_get.return_value.headers['X-Sendfile'] = file_alias
         self.test_data_for_requests = dict(params={
             'file_alias': file_alias,
-        })
-        # Get a appropriate "builtin" module name for pythons 2/3
-        # and mocking the builtin `open` function.
-        if sys.version_info.major == 3:
-            builtin_module_name = 'builtins'
-        else:
-            builtin_module_name = '__builtin__'
-        with patch('{}.open'.format(builtin_module_name),
-                   mock_open(), create=False):
-            core.download(self.test_url_address, self.file_hash,
-                          rename_file=file_alias,
-                          decryption_key=decryption_key_hex)
+        }, stream=True)
+        self.addCleanup(os.unlink, os.path.abspath(file_alias))
+        core.download(self.test_url_address, self.file_hash,
+                      rename_file=file_alias,
+                      decryption_key=decryption_key_hex)
         expected_request_args = [call(
             urljoin(self.test_url_address, '/api/files/' + self.file_hash),
             **self.test_data_for_requests
@@ -778,19 +1083,14 @@ class TestCoreDownload(unittest.TestCase):
             '"file_hash", "rename_file" and "decryption_key" arguments are '
             'given to the core.download()'
         )
-        # Test of args, passed to
-        # `core.file_encryptor.convergence.decrypt_file_inline()`
-        # in the `core.download()`.
-        expected_decryption_args = [call(
-            os.path.join(os.path.abspath(file_alias)),
-            decryption_key)]
-        self.assertListEqual(
-            mock_decryptor.call_args_list,
-            expected_decryption_args,
-            'Wrong call of the '
-            'core.file_encryptor.convergence.decrypt_file_inline() inside '
-            'the metatool.core.download() function.'
-        )
+        # Test that the saved file is decrypted like with the
+        # `file_encryptor.convergence.decrypt_file_inline()`.
+        with open(file_alias, 'rb') as downloaded_file:
+            self.assertEqual(
+                downloaded_file.read(),
+                self.decrypted_content(decryption_key),
+                "The downloaded file isn't properly decrypted"
+            )
 
     def test_link_argument(self):
         """
@@ -930,3 +1230,237 @@ class TestCoreDownload(unittest.TestCase):
         )
         self.assertIsInstance(download_call_result, Response,
                               'Must return a response object')
+
+
+class TestCoreStreamedDownload(unittest.TestCase):
+    """
+    Test of the ``metatool.core.download()`` against the local stand-in
+    server, which serves a big synthetic file.
+    """
+
+    def setUp(self):
+        self.testing_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.testing_dir)
+        self.file_size = 32 * 1024 * 1024
+        self.file_content = b'x' * self.file_size
+        self.target_name = os.path.join(self.testing_dir, 'big.file')
+        self.server = RecordingHTTPServer(
+            lambda handler: (200, {'X-Sendfile': self.target_name},
+                             self.file_content)
+        ).start()
+        self.addCleanup(self.server.stop)
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc is not available')
+    def test_download_peak_memory_is_bounded(self):
+        """
+        Test that the downloaded body is written to the file by chunks and
+        isn't kept in the memory as a whole.
+        """
+        memory_ceiling = 2 * 1024 * 1024
+        client = core.MetaToolClient()
+        self.addCleanup(client.close)
+        tracemalloc.start()
+        try:
+            result = client.download(self.server.url, 'HASH',
+                                     chunk_size=16 * 1024)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(result, self.target_name)
+        self.assertLess(
+            peak, memory_ceiling,
+            'download() of the {} bytes file has allocated {} bytes at '
+            'peak!'.format(self.file_size, peak)
+        )
+        self.assertEqual(os.path.getsize(self.target_name), self.file_size)
+        with open(self.target_name, 'rb') as file_:
+            self.assertEqual(sha256(file_.read()).digest(),
+                             sha256(self.file_content).digest())
+
+
+class TestCoreResumableDownload(unittest.TestCase):
+    """
+    Test of resuming the broken downloading with the "Range" requests.
+    """
+
+    def setUp(self):
+        self.testing_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.testing_dir)
+        self.file_content = os.urandom(300000)
+        self.file_hash = sha256(self.file_content).hexdigest()
+        self.target_name = os.path.join(self.testing_dir, 'restored.file')
+        self.part_name = self.target_name + core.PART_SUFFIX
+        # number of bytes to send before breaking the connection
+        self.break_after = None
+        self.support_range = True
+        self.server = RecordingHTTPServer(self.responder).start()
+        self.addCleanup(self.server.stop)
+        self.client = core.MetaToolClient()
+        self.addCleanup(self.client.close)
+
+    def responder(self, handler):
+        headers = {'X-Sendfile': self.target_name}
+        content = self.file_content
+        status_code = 200
+        range_header = handler.headers.get('Range')
+        if range_header and self.support_range:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if start >= len(content):
+                return 416, {}, b''
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                start, len(content) - 1, len(content))
+            content = content[start:]
+            status_code = 206
+        if self.break_after is not None:
+            headers['Content-Length'] = str(len(content))
+            headers['Connection'] = 'close'
+            content = content[:self.break_after]
+        return status_code, headers, content
+
+    def download(self):
+        return self.client.download(self.server.url, self.file_hash,
+                                    rename_file=self.target_name)
+
+    def assert_restored(self):
+        self.assertFalse(os.path.exists(self.part_name))
+        with open(self.target_name, 'rb') as file_:
+            self.assertEqual(file_.read(), self.file_content)
+
+    def test_concurrent_download_of_the_same_file(self):
+        """
+        Test that the file, which is being written by the other download
+        (i.e. the hedged one) of this process, isn't written again.
+        """
+        core._active_parts.add(self.part_name)
+        try:
+            self.assertRaises(core.DownloadConflictError, self.download)
+            self.assertFalse(os.path.exists(self.part_name))
+        finally:
+            core._active_parts.discard(self.part_name)
+        self.assertEqual(self.download(), self.target_name)
+        self.assert_restored()
+        self.assertFalse(core._active_parts)
+
+    def test_cancelled_download(self):
+        """
+        Test that the late response of the cancelled downloading (i.e. the
+        hedged one) isn't written, and the partial file of the downloading
+        cancelled while writing is removed.
+        """
+        cancel = threading.Event()
+        cancel.set()
+        self.assertRaises(core.DownloadCancelledError, self.client.download,
+                          self.server.url, self.file_hash,
+                          rename_file=self.target_name, cancel=cancel)
+        self.assertFalse(os.path.exists(self.part_name))
+
+        cancel = Mock(**{'is_set.side_effect': itertools.chain(
+            [False, False], itertools.repeat(True))})
+        self.assertRaises(core.DownloadCancelledError, self.client.download,
+                          self.server.url, self.file_hash,
+                          rename_file=self.target_name, cancel=cancel,
+                          chunk_size=1024)
+        self.assertFalse(os.path.exists(self.part_name))
+        self.assertFalse(os.path.exists(self.target_name))
+        self.assertFalse(core._active_parts)
+
+    def test_download_timeout(self):
+        """
+        Test that the downloading is stopped, when it's time budget is
+        over, and the partial file is kept for resuming.
+        """
+        mock_time = Mock()
+        mock_time.time.side_effect = itertools.chain([0],
+                                                     itertools.repeat(100))
+        with patch('metatool.core.time', mock_time):
+            self.assertRaises(core.DownloadError, self.client.download,
+                              self.server.url, self.file_hash,
+                              rename_file=self.target_name, timeout=10)
+        self.assertFalse(os.path.exists(self.target_name))
+        self.assertTrue(0 < os.path.getsize(self.part_name) <
+                        len(self.file_content))
+        self.assertEqual(self.download(), self.target_name)
+        self.assert_restored()
+
+    def test_resume_broken_download(self):
+        """
+        Test that the broken downloading leaves the partial file and the
+        next call requests only the missing bytes.
+        """
+        self.break_after = 100000
+        self.assertRaises(IOError, self.download)
+        self.assertFalse(os.path.exists(self.target_name))
+        # the last incomplete chunk may be lost with the connection
+        part_size = os.path.getsize(self.part_name)
+        self.assertTrue(0 < part_size <= 100000)
+
+        self.break_after = None
+        self.assertEqual(self.download(), self.target_name)
+        self.assert_restored()
+        self.assertNotIn('Range', self.server.received[0]['headers'])
+        self.assertEqual(self.server.received[1]['headers']['Range'],
+                         'bytes={}-'.format(part_size))
+
+    def test_server_ignores_range(self):
+        with open(self.part_name, 'wb') as file_:
+            file_.write(b'some stale data')
+        self.support_range = False
+        self.assertEqual(self.download(), self.target_name)
+        self.assert_restored()
+
+    def test_not_satisfiable_range(self):
+        """
+        Test that the partial file, which isn't shorter than the stored one,
+        is dropped and the file is downloaded again from the start.
+        """
+        with open(self.part_name, 'wb') as file_:
+            file_.write(self.file_content + b'garbage')
+        self.assertEqual(self.download(), self.target_name)
+        self.assert_restored()
+        self.assertEqual(len(self.server.received), 2)
+
+    def test_wrong_hash(self):
+        """
+        Test that the corrupted partial file is removed and the target file
+        isn't created when the hash of the data doesn't match.
+        """
+        with open(self.part_name, 'wb') as file_:
+            file_.write(b'x' * 1000)
+        self.assertRaises(core.DownloadError, self.download)
+        self.assertFalse(os.path.exists(self.part_name))
+        self.assertFalse(os.path.exists(self.target_name))
+        # the next try starts from the scratch
+        self.assertEqual(self.download(), self.target_name)
+        self.assert_restored()
+
+    def test_resume_with_decryption(self):
+        """
+        Test that the encrypted file is decrypted on the fly - the partial
+        file holds the plain data only, and the hash of the resumed file is
+        still checked against the encrypted data.
+        """
+        plain_content = self.file_content
+        with open(self.target_name, 'wb') as file_:
+            file_.write(plain_content)
+        key = convergence.encrypt_file_inline(self.target_name, None)
+        os.remove(self.target_name)
+        encrypted_content = StreamCipher(key).transform(plain_content)
+        self.file_content = encrypted_content
+        self.file_hash = sha256(encrypted_content).hexdigest()
+
+        self.break_after = 100000
+        with self.assertRaises(IOError):
+            self.client.download(self.server.url, self.file_hash,
+                                 rename_file=self.target_name,
+                                 decryption_key=binascii.hexlify(key))
+        with open(self.part_name, 'rb') as file_:
+            part_content = file_.read()
+        self.assertTrue(part_content)
+        self.assertTrue(plain_content.startswith(part_content))
+
+        self.break_after = None
+        self.client.download(self.server.url, self.file_hash,
+                             rename_file=self.target_name,
+                             decryption_key=binascii.hexlify(key))
+        self.file_content = plain_content
+        self.assert_restored()
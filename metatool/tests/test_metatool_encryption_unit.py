@@ -0,0 +1,105 @@
+import io
+import os
+import unittest
+import tempfile
+
+from file_encryptor import convergence
+
+from metatool.encryption import (StreamCipher, EncryptingReader,
+                                 convergent_key)
+from metatool.hashing import sha256_file
+
+
+class EncryptedFileFixture(object):
+    """
+    Random file's content, it's encrypted with the ``file_encryptor`` copy
+    and the key.
+    """
+
+    def setUp(self):
+        self.content = os.urandom(50003)
+        temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.addCleanup(os.unlink, temp_file.name)
+        with temp_file:
+            temp_file.write(self.content)
+        self.plain_file = tempfile.NamedTemporaryFile()
+        self.addCleanup(self.plain_file.close)
+        self.plain_file.write(self.content)
+        self.plain_file.flush()
+        self.key = convergence.encrypt_file_inline(temp_file.name, None)
+        with open(temp_file.name, 'rb') as encrypted_file:
+            self.encrypted = encrypted_file.read()
+
+
+class TestStreamCipher(EncryptedFileFixture, unittest.TestCase):
+    """
+    Test case of the ``metatool.encryption.StreamCipher`` class against
+    the ``file_encryptor`` library.
+    """
+
+    def test_encrypt_like_file_encryptor(self):
+        cipher = StreamCipher(self.key)
+        self.assertEqual(cipher.transform(self.content), self.encrypted)
+        self.assertEqual(cipher.offset, len(self.content))
+
+    def test_decrypt_from_offset_by_chunks(self):
+        """
+        Test that the data is decrypted properly from any offset and by
+        the chunks of any size, not aligned to the AES blocks.
+        """
+        for offset in (0, 1, 15, 16, 17, 4099, len(self.content) - 1):
+            for chunk_size in (1, 7, 16, 1000):
+                if chunk_size == 1 and offset < 4099:
+                    continue
+                cipher = StreamCipher(self.key, offset)
+                decrypted = b''.join(
+                    cipher.transform(self.encrypted[i:i + chunk_size])
+                    for i in range(offset, len(self.encrypted), chunk_size)
+                )
+                self.assertEqual(decrypted, self.content[offset:],
+                                 'offset={}, chunk_size={}'.format(
+                                     offset, chunk_size))
+
+    def test_negative_offset(self):
+        self.assertRaises(ValueError, StreamCipher, self.key, -1)
+
+
+class TestEncryptingReader(EncryptedFileFixture, unittest.TestCase):
+    """
+    Test case of the streaming encryption of the file, without changing
+    it, against the ``file_encryptor`` library.
+    """
+
+    def test_convergent_key(self):
+        for use_mmap in (False, True):
+            self.assertEqual(
+                convergent_key(self.plain_file, block_size=1000,
+                               use_mmap=use_mmap),
+                self.key
+            )
+        self.assertNotEqual(convergent_key(self.plain_file, 'passphrase'),
+                            self.key)
+
+    def test_read_and_seek(self):
+        reader = EncryptingReader(self.plain_file, self.key)
+        self.assertEqual(len(reader), len(self.content))
+        self.assertEqual(reader.name, self.plain_file.name)
+        reader.seek(0)
+        self.assertEqual(b''.join(iter(lambda: reader.read(333), b'')),
+                         self.encrypted)
+        self.assertEqual(reader.tell(), len(self.content))
+        reader.seek(1234)
+        self.assertEqual(reader.read(), self.encrypted[1234:])
+        reader.seek(0)
+        self.assertEqual(reader.read(), self.encrypted)
+
+    def test_hash_of_encrypted_data(self):
+        """
+        Test that the hashing of the reader doesn't map the plain file into
+        the memory, even when it's asked to.
+        """
+        reader = EncryptingReader(self.plain_file, self.key)
+        expected = sha256_file(io.BytesIO(self.encrypted))
+        self.assertEqual(sha256_file(reader, use_mmap=True), expected)
+        reader.close()
+        self.assertTrue(self.plain_file.closed)
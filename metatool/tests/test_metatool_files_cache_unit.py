@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+from requests.models import Response
+
+from metatool import core
+from metatool import files_cache
+from metatool.files_cache import FilesCache
+
+if sys.version_info.major == 3:
+    from unittest.mock import patch, Mock
+else:
+    from mock import patch, Mock
+
+# make the parent tests package importable for the direct running
+parent_dir = os.path.dirname(os.path.dirname(__file__))
+if not parent_dir in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from tests.testing_server import RecordingHTTPServer
+
+
+def listing_response(status_code, hashes=None, headers=None):
+    """
+    Make the response of the ``/api/files/`` request.
+    """
+    response = Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = json.dumps(hashes).encode('ascii') \
+        if hashes is not None else b''
+    return response
+
+
+class TestFilesCache(unittest.TestCase):
+    """
+    Test case of the ``metatool.files_cache.FilesCache`` class.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.url_base = 'http://node/'
+
+    def test_update_and_fresh(self):
+        cache = FilesCache(self.temp_dir)
+        self.assertIsNone(cache.fresh(self.url_base))
+        self.assertEqual(cache.request_headers(self.url_base), {})
+        hashes = cache.update(self.url_base, listing_response(
+            200, ['a', 'b'], {'ETag': '"v1"',
+                              'Last-Modified': 'Mon, 01 Jan 2018'}))
+        self.assertEqual(hashes, frozenset(['a', 'b']))
+        self.assertEqual(cache.fresh(self.url_base), hashes)
+        self.assertEqual(cache.request_headers(self.url_base),
+                         {'If-None-Match': '"v1"',
+                          'If-Modified-Since': 'Mon, 01 Jan 2018'})
+        self.assertIsNone(cache.fresh('http://other/'))
+
+    def test_expired_list_is_revalidated(self):
+        cache = FilesCache(self.temp_dir, ttl=10)
+        with patch.object(files_cache.time, 'time', return_value=1000):
+            cache.update(self.url_base,
+                         listing_response(200, ['a'], {'ETag': '"v1"'}))
+        with patch.object(files_cache.time, 'time', return_value=1011):
+            self.assertIsNone(cache.fresh(self.url_base))
+            self.assertEqual(cache.update(self.url_base,
+                                          listing_response(304)),
+                             frozenset(['a']))
+            self.assertEqual(cache.fresh(self.url_base), frozenset(['a']))
+
+    def test_failed_response(self):
+        cache = FilesCache(self.temp_dir)
+        self.assertIsNone(cache.update(self.url_base, listing_response(304)))
+        self.assertIsNone(cache.update(self.url_base,
+                                       listing_response(500, {})))
+        self.assertIsNone(cache.fresh(self.url_base))
+        with self.assertRaises(ValueError):
+            cache.update(self.url_base, listing_response(200))
+
+    def test_persistent_entries(self):
+        FilesCache(self.temp_dir).update(
+            self.url_base, listing_response(200, ['a'], {'ETag': '"v1"'}))
+        cache = FilesCache(self.temp_dir)
+        self.assertEqual(cache.fresh(self.url_base), frozenset(['a']))
+        cache.add(self.url_base, 'b')
+        self.assertEqual(FilesCache(self.temp_dir).fresh(self.url_base),
+                         frozenset(['a', 'b']))
+
+        cache.clear(self.url_base)
+        self.assertIsNone(FilesCache(self.temp_dir).fresh(self.url_base))
+        cache.update(self.url_base, listing_response(200, ['a']))
+        cache.update('http://other/', listing_response(200, ['a']))
+        cache.clear()
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_broken_entry_is_ignored(self):
+        cache = FilesCache(self.temp_dir)
+        cache.update(self.url_base, listing_response(200, ['a']))
+        path, = [os.path.join(self.temp_dir, name)
+                 for name in os.listdir(self.temp_dir)]
+        with open(path, 'w') as fp:
+            fp.write('{broken')
+        self.assertIsNone(FilesCache(self.temp_dir).fresh(self.url_base))
+
+    def test_memory_only_cache(self):
+        cache = FilesCache(False)
+        cache.update(self.url_base, listing_response(200, ['a']))
+        cache.add(self.url_base, 'b')
+        self.assertEqual(cache.fresh(self.url_base), frozenset(['a', 'b']))
+        self.assertIsNone(FilesCache(False).fresh(self.url_base))
+
+    def test_default_directory(self):
+        with patch.dict(os.environ, {'METATOOL_HOME': self.temp_dir}):
+            FilesCache().update(self.url_base, listing_response(200, ['a']))
+        self.assertEqual(
+            len(os.listdir(os.path.join(
+                self.temp_dir, files_cache.DEFAULT_CACHE_DIR_NAME))),
+            1
+        )
+
+
+class TestClientFilesCache(unittest.TestCase):
+    """
+    Test of the ``has()`` of the ``metatool.core.MetaToolClient`` with the
+    cached list of files.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.hashes = ['a' * 64, 'b' * 64]
+
+        def responder(handler):
+            if handler.headers.get('If-None-Match') == '"v1"':
+                return 304, {}, b''
+            return (200,
+                    {'Content-Type': 'application/json', 'ETag': '"v1"'},
+                    json.dumps(self.hashes).encode('ascii'))
+
+        self.server = RecordingHTTPServer(responder).start()
+        self.addCleanup(self.server.stop)
+        self.cache = FilesCache(self.temp_dir)
+        self.client = core.MetaToolClient(files_cache=self.cache)
+        self.addCleanup(self.client.close)
+
+    def test_fresh_list_is_not_requested(self):
+        self.assertTrue(self.client.has(self.server.url, 'a' * 64))
+        self.assertFalse(self.client.has(self.server.url, 'c' * 64))
+        self.assertTrue(self.client.has(self.server.url, 'b' * 64))
+        self.assertEqual(len(self.server.received), 1)
+        self.assertEqual(self.server.received[0]['path'], '/api/files/')
+
+    def test_expired_list_is_revalidated(self):
+        self.cache.ttl = 0
+        self.assertTrue(self.client.has(self.server.url, 'a' * 64))
+        self.hashes = []
+        self.assertTrue(self.client.has(self.server.url, 'a' * 64))
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(
+            self.server.received[1]['headers'].get('If-None-Match'), '"v1"')
+
+    def test_uploaded_file_is_added(self):
+        self.client.has(self.server.url, 'a' * 64)
+        with patch('requests.Session.post') as mock_post, \
+                tempfile.NamedTemporaryFile() as temp_file:
+            mock_post.return_value = listing_response(201, {})
+            temp_file.write(b'content')
+            temp_file.flush()
+            with open(temp_file.name, 'rb') as file_:
+                self.client.upload(self.server.url, 'KEY', Mock(), file_,
+                                   '001')
+        data_hash = mock_post.call_args[1]['data'].fields[0][1]
+        self.assertTrue(self.client.has(self.server.url, data_hash))
+        self.assertEqual(len(self.server.received), 1)
+
+    def test_client_without_cache(self):
+        client = core.MetaToolClient(files_cache=False)
+        self.addCleanup(client.close)
+        self.assertIsNone(client.files_cache)
+        self.assertTrue(client.has(self.server.url, 'a' * 64))
+        self.assertTrue(client.has(self.server.url, 'a' * 64))
+        self.assertEqual(len(self.server.received), 2)
+        self.assertNotIn('If-None-Match', self.server.received[1]['headers'])
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+import binascii
+from hashlib import sha256
+
+from file_encryptor import convergence
+
+from metatool import hash_pool
+from metatool import hashing
+
+
+class HashPoolFixture(object):
+    """
+    Directory with the random files.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.contents = {}
+        for i, size in enumerate((0, 1000, 300000, 1000000)):
+            path = os.path.join(self.directory, 'file{}'.format(i))
+            self.contents[path] = os.urandom(size)
+            with open(path, 'wb') as file_:
+                file_.write(self.contents[path])
+
+
+class TestHashPoolFileDigest(HashPoolFixture, unittest.TestCase):
+    """
+    Test case of the ``metatool.hash_pool.file_digest()`` function.
+    """
+
+    def test_plain_digest(self):
+        for path, content in self.contents.items():
+            tree = hashing.ChunkTreeHash()
+            tree.update(content)
+            self.assertEqual(
+                hash_pool.file_digest(path, tree=True),
+                dict(path=path, data_hash=sha256(content).hexdigest(),
+                     decryption_key=None, tree_digest=tree.hexdigest())
+            )
+
+    def test_encrypted_digest(self):
+        path = sorted(self.contents)[2]
+        digest = hash_pool.file_digest(path, encrypt=True)
+        key = convergence.encrypt_file_inline(path, None)
+        with open(path, 'rb') as file_:
+            encrypted = file_.read()
+        self.assertEqual(digest['data_hash'], sha256(encrypted).hexdigest())
+        self.assertEqual(digest['decryption_key'],
+                         binascii.hexlify(key).decode())
+        self.assertNotIn('tree_digest', digest)
+
+    def test_unreadable_file(self):
+        path = os.path.join(self.directory, 'missing')
+        digest = hash_pool.file_digest(path)
+        self.assertEqual(digest['path'], path)
+        self.assertIn('error', digest)
+
+
+class TestHashPoolTreeDigest(HashPoolFixture, unittest.TestCase):
+    """
+    Test that the chunks of the file, hashed by the pool of processes, give
+    the same digest as the incremental hashing.
+    """
+
+    def test_same_as_incremental(self):
+        for path, content in self.contents.items():
+            for chunk_size in (4096, 100000):
+                tree = hashing.ChunkTreeHash(chunk_size)
+                tree.update(content)
+                for workers in (1, 4):
+                    self.assertEqual(
+                        hash_pool.tree_digest(path, chunk_size, workers),
+                        tree.hexdigest()
+                    )
+
+
+class TestHashPoolBenchmark(HashPoolFixture, unittest.TestCase):
+    """
+    Benchmark of the hashing of the files by the pool of processes.
+    """
+
+    def test_benchmark(self):
+        results = hash_pool.benchmark(sorted(self.contents) * 4)
+        self.assertEqual([result['workers'] for result in results],
+                         list(hash_pool.BENCHMARK_WORKERS))
+        expected = dict((path, sha256(content).hexdigest())
+                        for path, content in self.contents.items())
+        for result in results:
+            self.assertEqual(result['data_hashes'], expected)
+            self.assertGreater(result['mb_per_second'], 0)
+            self.assertGreater(result['files_per_second'], 0)
@@ -0,0 +1,173 @@
+import os
+import unittest
+import tempfile
+from hashlib import sha256
+
+from metatool import hashing
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def make_temp_file(test_case, size, pattern=b'0123456789abcdef'):
+    """
+    Create a temporary file of the given size filled with the repeated
+    ``pattern`` and register it's deletion as the cleanup of the test case.
+
+    :param test_case: test case instance which will clean up the file
+    :param size: size of the created file in bytes
+    :param pattern: bytes repeated through the file's content
+    :returns: name of the created file
+    """
+    temp_file = tempfile.NamedTemporaryFile(prefix='tmp_', suffix='.spam',
+                                            delete=False)
+    test_case.addCleanup(os.remove, temp_file.name)
+    block = pattern * (1024 * 1024 // len(pattern))
+    with temp_file:
+        for _ in range(size // len(block)):
+            temp_file.write(block)
+        temp_file.write(block[:size % len(block)])
+    return temp_file.name
+
+
+class TestHashingSha256File(unittest.TestCase):
+    """
+    Test case of the ``metatool.hashing.sha256_file()`` function.
+    """
+
+    def test_same_digest_as_whole_read(self):
+        """
+        Test that the incremental hashing gives the same digest as the
+        hashing of the whole content at once, for any block size and with
+        or without the ``mmap`` usage.
+        """
+        for size in (0, 1, 1000, hashing.HASH_BLOCK_SIZE + 1):
+            file_name = make_temp_file(self, size)
+            with open(file_name, 'rb') as file_:
+                expected_digest = sha256(file_.read()).hexdigest()
+                for block_size in (1, 7, 4096, hashing.HASH_BLOCK_SIZE):
+                    for use_mmap in (False, True):
+                        self.assertEqual(
+                            hashing.sha256_file(file_, block_size, use_mmap),
+                            expected_digest,
+                            'Unexpected digest with the size={}, '
+                            'block_size={}, use_mmap={}'.format(
+                                size, block_size, use_mmap)
+                        )
+
+    def test_hash_from_the_start_and_rewind(self):
+        """
+        Test that the whole file is hashed despite the current position
+        and the position is set to the start after the hashing.
+        """
+        file_name = make_temp_file(self, 5000)
+        with open(file_name, 'rb') as file_:
+            expected_digest = sha256(file_.read()).hexdigest()
+            self.assertEqual(hashing.sha256_file(file_), expected_digest)
+            self.assertEqual(file_.tell(), 0)
+
+    def test_wrong_block_size(self):
+        """
+        Test of raising ``ValueError`` when the block size isn't positive.
+        """
+        file_name = make_temp_file(self, 10)
+        with open(file_name, 'rb') as file_:
+            for block_size in (0, -1):
+                self.assertRaises(ValueError, hashing.sha256_file,
+                                  file_, block_size)
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc is not available')
+    def test_peak_memory_is_bounded(self):
+        """
+        Test that the memory allocated while hashing a file stays under the
+        fixed ceiling, which is much smaller than the file itself.
+        """
+        file_size = 32 * 1024 * 1024
+        memory_ceiling = 1024 * 1024
+        file_name = make_temp_file(self, file_size)
+        for use_mmap in (False, True):
+            with open(file_name, 'rb') as file_:
+                tracemalloc.start()
+                try:
+                    hashing.sha256_file(file_, use_mmap=use_mmap)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            self.assertLess(
+                peak, memory_ceiling,
+                'Hashing of the {} bytes file with use_mmap={} has allocated '
+                '{} bytes at peak!'.format(file_size, use_mmap, peak)
+            )
+
+
+class TestHashingChallengeResponse(unittest.TestCase):
+    """
+    Test case of the ``metatool.hashing.challenge_response()`` function.
+    """
+
+    def test_digest_of_content_and_seed(self):
+        seed = '19b25856e1c150ca834cffc8b59b23ad'
+        for size in (0, 1000, hashing.HASH_BLOCK_SIZE + 1):
+            file_name = make_temp_file(self, size)
+            with open(file_name, 'rb') as file_:
+                expected_digest = sha256(
+                    file_.read() + seed.encode()).hexdigest()
+                for use_mmap in (False, True):
+                    self.assertEqual(
+                        hashing.challenge_response(file_, seed, 4096,
+                                                   use_mmap),
+                        expected_digest
+                    )
+                    self.assertEqual(file_.tell(), 0)
+
+    def test_single_pass_with_data_hash(self):
+        seeds = ['seed_{}'.format(i) for i in range(5)]
+        file_name = make_temp_file(self, hashing.HASH_BLOCK_SIZE * 3 + 1)
+        with open(file_name, 'rb') as file_:
+            content = file_.read()
+            data_hash, responses = hashing.sha256_with_challenges(
+                file_, seeds, use_mmap=True)
+            self.assertEqual(data_hash, sha256(content).hexdigest())
+            self.assertEqual(responses, [
+                hashing.challenge_response(file_, seed) for seed in seeds])
+            self.assertEqual(
+                hashing.sha256_with_challenges(file_, []), (data_hash, []))
+
+
+class TestHashingChunkTree(unittest.TestCase):
+    """
+    Test case of the ``metatool.hashing.ChunkTreeHash`` class.
+    """
+
+    def test_tree_of_chunks(self):
+        content = os.urandom(2500)
+        leaves = [hashing.chunk_digest(content[i:i + 1000])
+                  for i in (0, 1000, 2000)]
+        expected = sha256(b'\x01' + sha256(
+            b'\x01' + leaves[0] + leaves[1]).digest() + leaves[2]).hexdigest()
+        for block_size in (1, 7, 999, 1000, 4096):
+            tree = hashing.ChunkTreeHash(1000)
+            for i in range(0, len(content), block_size):
+                tree.update(content[i:i + block_size])
+            self.assertEqual(tree.hexdigest(), expected)
+            self.assertEqual(tree.leaves, leaves[:2])
+
+    def test_chunk_tree_file(self):
+        empty_digest = sha256(b'\x00').hexdigest()
+        self.assertEqual(hashing.ChunkTreeHash().hexdigest(), empty_digest)
+        file_name = make_temp_file(self, 10000)
+        with open(file_name, 'rb') as file_:
+            content = file_.read()
+            for chunk_size in (100, 4096, 10000, 20000):
+                tree = hashing.ChunkTreeHash(chunk_size)
+                tree.update(content)
+                for use_mmap in (False, True):
+                    self.assertEqual(
+                        hashing.chunk_tree_file(file_, chunk_size, 333,
+                                                use_mmap),
+                        tree.hexdigest()
+                    )
+        self.assertNotEqual(tree.hexdigest(), sha256(content).hexdigest())
+        self.assertRaises(ValueError, hashing.ChunkTreeHash, -1)
@@ -0,0 +1,120 @@
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import threading
+import unittest
+
+from btctxstore import BtcTxStore
+
+from metatool import identity
+from metatool.state import STATE_DIR_ENV
+
+if sys.version_info.major == 3:
+    from unittest.mock import patch, Mock
+else:
+    from mock import patch, Mock
+
+
+class TestLoadSenderKey(unittest.TestCase):
+    """
+    Test case of the ``metatool.identity.load_sender_key()`` function.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        env_patch = patch.dict(os.environ, {STATE_DIR_ENV: self.temp_dir})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        os.environ.pop(identity.SENDER_KEY_ENV, None)
+        self.btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        self.key_file = os.path.join(self.temp_dir,
+                                     identity.SENDER_KEY_FILE_NAME)
+
+    def test_key_is_generated_once(self):
+        key = identity.load_sender_key(self.btctx_api)
+        self.assertTrue(self.btctx_api.validate_key(key))
+        self.assertEqual(stat.S_IMODE(os.stat(self.key_file).st_mode)
+                         & 0o077, 0)
+        mock_api = Mock()
+        self.assertEqual(identity.load_sender_key(mock_api), key)
+        self.assertFalse(mock_api.create_key.called)
+
+    def test_key_from_environment(self):
+        own_key = self.btctx_api.create_key()
+        with patch.dict(os.environ, {identity.SENDER_KEY_ENV: own_key}):
+            self.assertEqual(identity.load_sender_key(self.btctx_api),
+                             own_key)
+        self.assertFalse(os.path.exists(self.key_file))
+
+    def test_key_from_given_file(self):
+        key_file = os.path.join(self.temp_dir, 'own.key')
+        with open(key_file, 'w') as fp:
+            fp.write(' OWN_KEY \n')
+        self.assertEqual(identity.load_sender_key(Mock(), key_file),
+                         'OWN_KEY')
+
+    def test_key_saved_by_concurrent_process(self):
+        mock_api = Mock()
+
+        def create_key():
+            with open(self.key_file, 'w') as fp:
+                fp.write('CONCURRENT_KEY\n')
+            return 'LOST_KEY'
+
+        mock_api.create_key.side_effect = create_key
+        self.assertEqual(identity.load_sender_key(mock_api),
+                         'CONCURRENT_KEY')
+
+    def test_concurrent_first_runs(self):
+        """
+        Test that the concurrent first runs get the same complete key.
+        """
+        keys = []
+        threads = [threading.Thread(
+            target=lambda: keys.append(identity.load_sender_key(
+                self.btctx_api))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(keys), 8)
+        self.assertEqual(set(keys), set([identity._read_key(self.key_file)]))
+        self.assertTrue(self.btctx_api.validate_key(keys[0]))
+        self.assertEqual(os.listdir(self.temp_dir),
+                         [identity.SENDER_KEY_FILE_NAME])
+
+    def test_key_saved_without_hard_links(self):
+        """
+        Test that the key is saved by the renaming, when the platform has
+        no hard links.
+        """
+        link = os.link
+        del os.link
+        self.addCleanup(setattr, os, 'link', link)
+        key = identity.load_sender_key(self.btctx_api)
+        self.assertEqual(identity._read_key(self.key_file), key)
+        self.assertEqual(os.listdir(self.temp_dir),
+                         [identity.SENDER_KEY_FILE_NAME])
+        # the key saved meanwhile isn't replaced
+        os.remove(self.key_file)
+        mock_api = Mock()
+
+        def create_key():
+            with open(self.key_file, 'w') as fp:
+                fp.write('CONCURRENT_KEY\n')
+            return 'LOST_KEY'
+
+        mock_api.create_key.side_effect = create_key
+        self.assertEqual(identity.load_sender_key(mock_api),
+                         'CONCURRENT_KEY')
+        self.assertEqual(os.listdir(self.temp_dir),
+                         [identity.SENDER_KEY_FILE_NAME])
+
+    def test_failed_saving_leaves_no_file(self):
+        mock_api = Mock()
+        mock_api.create_key.return_value = None
+        self.assertRaises(TypeError, identity.load_sender_key, mock_api)
+        self.assertFalse(os.path.exists(self.key_file))
@@ -0,0 +1,185 @@
+import os
+import sys
+import unittest
+import tempfile
+import json
+from hashlib import sha256
+
+import requests
+from btctxstore import BtcTxStore
+
+from metatool import core
+from metatool.multipart import MultipartEncoder
+
+# make the parent tests package importable for the direct running
+parent_dir = os.path.dirname(os.path.dirname(__file__))
+if not parent_dir in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from tests.testing_server import RecordingHTTPServer, use_temp_state_dir
+
+
+def setUpModule():
+    # keep the state of the tested clients out of the user's home
+    global restore_state_dir
+    restore_state_dir = use_temp_state_dir()
+
+
+def tearDownModule():
+    restore_state_dir()
+
+
+def expected_body(boundary, fields, file_field, file_name, file_content):
+    """
+    Build the "multipart/form-data" body in the straightforward way to
+    compare it with the body generated by the encoder.
+    """
+    lines = []
+    for name, value in fields:
+        lines.append('--{}\r\n'
+                     'Content-Disposition: form-data; name="{}"\r\n'
+                     '\r\n'
+                     '{}\r\n'.format(boundary, name, value).encode())
+    lines.append('--{}\r\n'
+                 'Content-Disposition: form-data; name="{}"; filename="{}"\r\n'
+                 '\r\n'.format(boundary, file_field, file_name).encode())
+    lines.append(file_content)
+    lines.append('\r\n--{}--\r\n'.format(boundary).encode())
+    return b''.join(lines)
+
+
+class TestMultipartEncoder(unittest.TestCase):
+    """
+    Test case of the ``metatool.multipart.MultipartEncoder`` class.
+    """
+
+    def setUp(self):
+        self.file_content = os.urandom(100000)
+        temp_file = tempfile.NamedTemporaryFile(prefix='tmp_',
+                                                suffix='.spam', delete=False)
+        self.addCleanup(os.remove, temp_file.name)
+        with temp_file:
+            temp_file.write(self.file_content)
+        self.file_ = open(temp_file.name, 'rb')
+        self.addCleanup(self.file_.close)
+        self.fields = [('data_hash', sha256(self.file_content).hexdigest()),
+                       ('file_role', '001')]
+        self.expected = expected_body(
+            'TEST_BOUNDARY', self.fields, 'file_data',
+            os.path.basename(temp_file.name), self.file_content
+        )
+
+    def make_encoder(self, chunk_size=4096):
+        return MultipartEncoder(self.fields, 'file_data', self.file_,
+                                chunk_size=chunk_size,
+                                boundary='TEST_BOUNDARY')
+
+    def test_iteration_and_length(self):
+        """
+        Test that the iteration gives the expected body by the chunks of
+        bounded size and the length of the encoder is the exact body length.
+        """
+        encoder = self.make_encoder()
+        chunks = list(encoder)
+        self.assertEqual(b''.join(chunks), self.expected)
+        self.assertEqual(len(encoder), len(self.expected))
+        self.assertLessEqual(max(len(chunk) for chunk in chunks[1:-1]), 4096)
+        self.assertEqual(
+            encoder.content_type,
+            'multipart/form-data; boundary=TEST_BOUNDARY'
+        )
+        # repeated iteration starts from the beginning
+        self.assertEqual(b''.join(encoder), self.expected)
+
+    def test_read_and_rewind(self):
+        """
+        Test reading of the body by the parts of different sizes and
+        rewinding it with ``seek(0)``.
+        """
+        encoder = self.make_encoder()
+        for read_size in (1, 1000, 16384, len(self.expected) + 1):
+            encoder.seek(0)
+            parts = list(iter(lambda: encoder.read(read_size), b''))
+            self.assertEqual(b''.join(parts), self.expected)
+            self.assertEqual(encoder.tell(), len(self.expected))
+        encoder.seek(0)
+        self.assertEqual(encoder.read(), self.expected)
+        # the rest of the partly read chunk goes first
+        encoder.seek(0)
+        self.assertEqual(encoder.read(10) + encoder.read(5000) +
+                         encoder.read(), self.expected)
+        self.assertRaises(IOError, encoder.seek, 10)
+
+    def test_wrong_chunk_size(self):
+        self.assertRaises(ValueError, self.make_encoder, 0)
+
+
+class TestMultipartOverHTTP(unittest.TestCase):
+    """
+    Test of sending the streaming bodies to the local stand-in server,
+    which records the received bytes.
+    """
+
+    def setUp(self):
+        self.server = RecordingHTTPServer(
+            lambda handler: (201, {'Content-Type': 'application/json'},
+                             b'{}')
+        ).start()
+        self.addCleanup(self.server.stop)
+        self.file_content = os.urandom(3 * 1024 * 1024 + 17)
+        temp_file = tempfile.NamedTemporaryFile(prefix='tmp_',
+                                                suffix='.spam', delete=False)
+        self.addCleanup(os.remove, temp_file.name)
+        with temp_file:
+            temp_file.write(self.file_content)
+        self.file_name = temp_file.name
+
+    def test_body_byte_for_byte(self):
+        """
+        Test that the server receives exactly the encoded body with the
+        correct "Content-Length" and without the chunked transfer encoding.
+        """
+        fields = [('data_hash', 'TEST_HASH'), ('file_role', '002')]
+        with open(self.file_name, 'rb') as file_:
+            encoder = MultipartEncoder(fields, 'file_data', file_)
+            response = requests.post(
+                self.server.url + 'api/files/', data=encoder,
+                headers={'Content-Type': encoder.content_type}
+            )
+        self.assertEqual(response.status_code, 201)
+        received = self.server.received[0]
+        self.assertEqual(
+            received['body'],
+            expected_body(encoder.boundary, fields, 'file_data',
+                          os.path.basename(self.file_name), self.file_content)
+        )
+        self.assertEqual(int(received['headers']['Content-Length']),
+                         len(encoder))
+        self.assertNotIn('Transfer-Encoding', received['headers'])
+
+    def test_core_upload_body(self):
+        """
+        Test that the ``core.upload()`` sends the expected fields and file
+        content in the streamed body.
+        """
+        btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        sender_key = btctx_api.create_key()
+        data_hash = sha256(self.file_content).hexdigest()
+        with open(self.file_name, 'rb') as file_:
+            response = core.upload(self.server.url, sender_key, btctx_api,
+                                   file_, '001')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.text), {})
+        received = self.server.received[0]
+        boundary = received['headers']['Content-Type'].split('boundary=')[-1]
+        self.assertEqual(
+            received['body'],
+            expected_body(boundary,
+                          [('data_hash', data_hash), ('file_role', '001')],
+                          'file_data', os.path.basename(self.file_name),
+                          self.file_content)
+        )
+        signature = btctx_api.sign_unicode(sender_key, data_hash)
+        if isinstance(signature, bytes):
+            signature = signature.decode('ascii')
+        self.assertEqual(received['headers']['signature'], signature)
@@ -0,0 +1,297 @@
+import unittest
+import sys
+import threading
+import time
+
+from requests.models import Response
+
+from metatool import nodes
+from metatool.breaker import CircuitBreaker, CircuitOpenError
+
+if sys.version_info.major == 3:
+    from unittest.mock import Mock, call
+else:
+    from mock import Mock, call
+
+
+class TestNodesFailover(unittest.TestCase):
+    """
+    Test case of the ``metatool.nodes.call_with_failover()`` function.
+    """
+
+    def test_stop_on_acceptable_result(self):
+        bad_response = Mock(__class__=Response, status_code=503)
+        good_response = Mock(__class__=Response, status_code=201)
+        operation = Mock(side_effect=[bad_response, good_response])
+        url_base, result = nodes.call_with_failover(
+            operation, ['first', 'second', 'third'], spam='eggs')
+        self.assertEqual(url_base, 'second')
+        self.assertIs(result, good_response)
+        self.assertListEqual(
+            operation.call_args_list,
+            [call(url_base='first', spam='eggs'),
+             call(url_base='second', spam='eggs')]
+        )
+
+    def test_return_last_bad_result(self):
+        bad_response = Mock(__class__=Response, status_code=404)
+        operation = Mock(return_value=bad_response)
+        self.assertEqual(
+            nodes.call_with_failover(operation, ['first', 'second']),
+            ('second', bad_response)
+        )
+
+    def test_connection_errors(self):
+        """
+        Test that an error goes to the next node, but the error of the last
+        node is re-raised.
+        """
+        operation = Mock(side_effect=[IOError('refused'), 'file/path'])
+        self.assertEqual(
+            nodes.call_with_failover(operation, ['first', 'second']),
+            ('second', 'file/path')
+        )
+        operation = Mock(side_effect=[IOError('refused'), IOError('again')])
+        self.assertRaises(IOError, nodes.call_with_failover,
+                          operation, ['first', 'second'])
+
+    def test_no_nodes(self):
+        operation = Mock()
+        self.assertEqual(nodes.call_with_failover(operation, []),
+                         (None, nodes.NO_NODES_MESSAGE))
+        self.assertFalse(operation.called)
+
+
+class TestNodesDeadline(unittest.TestCase):
+    """
+    Test case of the ``deadline`` of the ``metatool.nodes`` functions.
+    """
+
+    def slow_operation(self, url_base, timeout):
+        self.timeouts.append(timeout)
+        time.sleep(min(timeout, 0.2))
+        raise IOError('timed out')
+
+    def setUp(self):
+        self.timeouts = []
+
+    def test_failover_shares_deadline(self):
+        self.assertRaises(IOError, nodes.call_with_failover,
+                          self.slow_operation, ['first', 'second', 'third'],
+                          deadline=0.3)
+        self.assertEqual(len(self.timeouts), 2)
+        self.assertTrue(0.2 < self.timeouts[0] <= 0.3)
+        self.assertTrue(0 < self.timeouts[1] <= 0.1)
+
+    def test_hedged_shares_deadline(self):
+        start = time.time()
+        self.assertRaises(IOError, nodes.call_hedged,
+                          self.slow_operation, ['first', 'second', 'third'],
+                          delay=0.25, deadline=0.3)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(len(self.timeouts), 2)
+        self.assertTrue(0 < self.timeouts[1] <= 0.1)
+
+    def test_no_deadline(self):
+        operation = Mock(return_value='RESULT')
+        nodes.call_with_failover(operation, ['first'])
+        nodes.call_hedged(operation, ['first'])
+        self.assertListEqual(operation.call_args_list,
+                             [call(url_base='first')] * 2)
+
+
+class TestNodesBreaker(unittest.TestCase):
+    """
+    Test case of the circuit breaker used by the ``metatool.nodes``
+    functions.
+    """
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, path=False)
+
+    def test_failover_skips_dead_node(self):
+        server_error = Mock(__class__=Response, status_code=500)
+        not_found = Mock(__class__=Response, status_code=404)
+
+        def operation(url_base):
+            if url_base == 'dead':
+                raise IOError('connection refused')
+            return server_error if url_base == 'broken' else not_found
+
+        operation = Mock(side_effect=operation)
+        for _ in range(3):
+            nodes.call_with_failover(operation, ['dead', 'broken', 'alive'],
+                                     breaker=self.breaker)
+        self.assertListEqual(
+            [args[1]['url_base'] for args in operation.call_args_list],
+            ['dead', 'broken', 'alive'] * 2 + ['alive']
+        )
+        # "not found" isn't the node's failure
+        self.assertEqual(self.breaker.state('alive'), 'closed')
+        self.assertRaises(CircuitOpenError, nodes.call_with_failover,
+                          operation, ['dead', 'broken'],
+                          breaker=self.breaker)
+
+    def test_hedged_skips_dead_node(self):
+        operation = Mock(side_effect=IOError('connection refused'))
+        for _ in range(2):
+            self.assertRaises(IOError, nodes.call_hedged, operation,
+                              ['dead'], breaker=self.breaker)
+        self.assertRaises(CircuitOpenError, nodes.call_hedged, operation,
+                          ['dead'], breaker=self.breaker)
+        self.assertEqual(operation.call_count, 2)
+
+    def test_local_conflict_is_not_counted(self):
+        conflict = IOError('already being downloaded')
+        conflict.node_failure = False
+        operation = Mock(side_effect=conflict)
+        for _ in range(3):
+            self.assertRaises(IOError, nodes.call_with_failover, operation,
+                              ['alive'], breaker=self.breaker)
+            self.assertRaises(IOError, nodes.call_hedged, operation,
+                              ['alive'], breaker=self.breaker)
+        self.assertEqual(self.breaker.state('alive'), 'closed')
+
+
+class TestNodesHedged(unittest.TestCase):
+    """
+    Test case of the ``metatool.nodes.call_hedged()`` function.
+    """
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.started = []
+
+    def operation(self, behaviour):
+        """
+        Make the operation, which behaves for each node as it's described
+        in the ``behaviour`` - the delay and the status code or exception.
+        """
+        def operation(url_base, **kwargs):
+            self.started.append(url_base)
+            delay, outcome = behaviour[url_base]
+            if delay is None:
+                self.release.wait(5)
+            else:
+                time.sleep(delay)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return Mock(__class__=Response, status_code=outcome,
+                        url_base=url_base, kwargs=kwargs)
+        return operation
+
+    def test_slow_failing_node_is_hedged(self):
+        operation = self.operation({
+            'slow': (None, 503),
+            'fast': (0, 200),
+        })
+        start = time.time()
+        url_base, result = nodes.call_hedged(operation, ['slow', 'fast'],
+                                             delay=0.05, spam='eggs')
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(url_base, 'fast')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.kwargs, dict(spam='eggs'))
+
+    def test_no_hedge_for_fast_node(self):
+        operation = self.operation({
+            'first': (0, 200),
+            'second': (0, 200),
+        })
+        self.assertEqual(
+            nodes.call_hedged(operation, ['first', 'second'], delay=1)[0],
+            'first'
+        )
+        self.assertEqual(self.started, ['first'])
+
+    def test_failed_node_is_hedged_at_once(self):
+        operation = self.operation({
+            'first': (0, IOError('connection refused')),
+            'second': (0, 404),
+            'third': (0, 201),
+        })
+        start = time.time()
+        url_base, result = nodes.call_hedged(
+            operation, ['first', 'second', 'third'], delay=10)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(url_base, 'third')
+
+    def test_all_nodes_failed(self):
+        operation = self.operation({
+            'first': (0.1, 503),
+            'second': (0, 404),
+        })
+        url_base, result = nodes.call_hedged(operation, ['first', 'second'])
+        self.assertEqual(url_base, 'second')
+        self.assertEqual(result.status_code, 404)
+
+        operation = self.operation({
+            'first': (0, 503),
+            'second': (0, IOError('connection refused')),
+        })
+        self.assertRaises(IOError, nodes.call_hedged, operation,
+                          ['first', 'second'])
+        operation = self.operation({'first': (0, ValueError('bug'))})
+        self.assertRaises(ValueError, nodes.call_hedged, operation,
+                          ['first'])
+
+    def test_late_response_is_closed(self):
+        operation = self.operation({
+            'slow': (None, 200),
+            'fast': (0, 200),
+        })
+        late_results = []
+        original = operation
+
+        def operation(url_base, **kwargs):
+            result = original(url_base, **kwargs)
+            late_results.append(result)
+            return result
+
+        self.assertEqual(nodes.call_hedged(operation, ['slow', 'fast'])[0],
+                         'fast')
+        self.release.set()
+        for _ in range(200):
+            if len(late_results) == 2 and late_results[1].close.called:
+                break
+            time.sleep(0.01)
+        late_results[1].close.assert_called_once_with()
+        self.assertEqual(late_results[1].url_base, 'slow')
+        self.assertFalse(late_results[0].close.called)
+
+    def test_abandoned_call_is_cancelled(self):
+        events = {}
+
+        def operation(url_base, cancel):
+            events[url_base] = cancel
+            if url_base == 'slow':
+                self.release.wait(5)
+            return url_base
+
+        self.assertEqual(nodes.call_hedged(operation, ['slow', 'fast'],
+                                           cancellable=True),
+                         ('fast', 'fast'))
+        self.assertIs(events['slow'], events['fast'])
+        self.assertTrue(events['slow'].is_set())
+
+    def test_conflict_waits_for_other_node(self):
+        """
+        Test that the call failed not because of the node, i.e. the file
+        being downloaded by the other call, doesn't hedge the next node.
+        """
+        conflict = IOError('already being downloaded')
+        conflict.node_failure = False
+        operation = self.operation({
+            'first': (0.5, 200),
+            'second': (0, conflict),
+            'third': (0, 200),
+        })
+        url_base, result = nodes.call_hedged(
+            operation, ['first', 'second', 'third'], delay=0.3)
+        self.assertEqual(url_base, 'first')
+        self.assertNotIn('third', self.started)
+
+    def test_no_nodes(self):
+        self.assertEqual(nodes.call_hedged(Mock(), []),
+                         (None, nodes.NO_NODES_MESSAGE))
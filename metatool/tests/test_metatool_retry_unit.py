@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import unittest
+
+import requests
+from btctxstore import BtcTxStore
+
+from metatool import core
+from metatool.retry import RetryPolicy
+
+if sys.version_info.major == 3:
+    from unittest.mock import patch, Mock
+else:
+    from mock import patch, Mock
+
+# make the parent tests package importable for the direct running
+parent_dir = os.path.dirname(os.path.dirname(__file__))
+if not parent_dir in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from tests.testing_server import RecordingHTTPServer, use_temp_state_dir
+
+
+def setUpModule():
+    # keep the state of the tested clients out of the user's home
+    global restore_state_dir
+    restore_state_dir = use_temp_state_dir()
+
+
+def tearDownModule():
+    restore_state_dir()
+
+
+class DroppedConnection(Exception):
+    """
+    Raised by the responder to close the connection without the answer.
+    """
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """
+    Test case of the ``metatool.retry.RetryPolicy`` class.
+    """
+
+    def test_is_retryable(self):
+        policy = RetryPolicy()
+        connect_timeout = requests.exceptions.ConnectTimeout()
+        read_timeout = requests.exceptions.ReadTimeout()
+        for status, idempotent, expected in ((503, False, True),
+                                             (502, False, False),
+                                             (502, True, True),
+                                             (500, True, False),
+                                             (200, True, False)):
+            self.assertEqual(
+                policy.is_retryable(idempotent, Mock(status_code=status)),
+                expected)
+        self.assertTrue(policy.is_retryable(False, error=connect_timeout))
+        self.assertFalse(policy.is_retryable(False, error=read_timeout))
+        self.assertTrue(policy.is_retryable(True, error=read_timeout))
+        self.assertFalse(policy.is_retryable(True, error=ValueError()))
+        self.assertRaises(ValueError, RetryPolicy, 0)
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+        self.assertEqual([policy.delay(retry) for retry in range(1, 6)],
+                         [1, 2, 4, 5, 5])
+        response = Mock(headers={'Retry-After': '3'})
+        self.assertEqual(policy.delay(1, response), 3)
+        response.headers['Retry-After'] = '100'
+        self.assertEqual(policy.delay(1, response), 5)
+        response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        self.assertEqual(policy.delay(2, response), 2)
+
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        delays = [policy.delay(3) for _ in range(100)]
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    @patch('metatool.retry.time.sleep')
+    def test_call(self, mock_sleep):
+        policy = RetryPolicy(max_attempts=3, jitter=False)
+        unavailable = Mock(status_code=503, headers={})
+        send = Mock(side_effect=[unavailable, unavailable, 'RESPONSE'])
+        self.assertEqual(policy.call(send), 'RESPONSE')
+        self.assertEqual([args[0][0] for args in mock_sleep.call_args_list],
+                         [0.2, 0.4])
+        self.assertEqual(unavailable.close.call_count, 2)
+
+        # the last error is raised, when attempts are over
+        error = requests.exceptions.ConnectionError('refused')
+        send = Mock(side_effect=error)
+        self.assertRaises(requests.exceptions.ConnectionError,
+                          policy.call, send)
+        self.assertEqual(send.call_count, 3)
+
+        # no retry, when the pause doesn't fit into the time budget
+        send = Mock(return_value=unavailable)
+        self.assertIs(policy.call(send, timeout=0.1), unavailable)
+        self.assertEqual(send.call_count, 1)
+        self.assertTrue(0 < send.call_args[0][0] <= 0.1)
+
+
+class TestClientRetry(unittest.TestCase):
+    """
+    Test of the retries of the ``metatool.core.MetaToolClient`` requests
+    against the node, which injects faults.
+    """
+
+    def setUp(self):
+        # the statuses of the next answers, ``None`` drops the connection
+        self.faults = []
+        self.server = RecordingHTTPServer(self.responder).start()
+        self.server.handle_error = lambda request, client_address: None
+        self.addCleanup(self.server.stop)
+        self.client = core.MetaToolClient(
+            files_cache=False, retry=RetryPolicy(backoff=0.01))
+        self.addCleanup(self.client.close)
+        self.btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        self.sender_key = self.btctx_api.create_key()
+
+    def responder(self, handler):
+        if self.faults:
+            status = self.faults.pop(0)
+            if status is None:
+                raise DroppedConnection()
+            return status, {'Connection': 'close'}, b'{}'
+        if handler.command == 'POST':
+            return 201, {'Content-Type': 'application/json'}, b'{}'
+        return 200, {'Content-Type': 'application/json'}, b'[]'
+
+    def upload(self):
+        with open(__file__, 'rb') as file_:
+            return self.client.upload(self.server.url, self.sender_key,
+                                      self.btctx_api, file_, '001')
+
+    def test_transient_errors_are_retried(self):
+        self.faults = [503, None]
+        self.assertEqual(self.client.files(self.server.url).status_code, 200)
+        self.assertEqual(len(self.server.received), 3)
+
+    def test_attempts_are_limited(self):
+        self.faults = [502] * 5
+        self.assertEqual(self.client.info(self.server.url).status_code, 502)
+        self.assertEqual(len(self.server.received), 3)
+        self.faults = [None] * 5
+        self.assertRaises(requests.exceptions.ConnectionError,
+                          self.client.info, self.server.url)
+
+    def test_upload_is_retried_safely(self):
+        """
+        Test that the upload is sent again with the whole body, when the
+        node hasn't processed it, and isn't repeated otherwise.
+        """
+        self.faults = [503, 503]
+        self.assertEqual(self.upload().status_code, 201)
+        bodies = [request['body'] for request in self.server.received]
+        self.assertEqual(len(bodies), 3)
+        self.assertEqual(len(set(bodies)), 1)
+        with open(__file__, 'rb') as file_:
+            self.assertIn(file_.read(), bodies[0])
+
+        del self.server.received[:]
+        self.faults = [502]
+        self.assertEqual(self.upload().status_code, 502)
+        self.faults = [None]
+        self.assertRaises(requests.exceptions.ConnectionError, self.upload)
+        self.assertEqual(len(self.server.received), 2)
+
+    def test_retries_fit_into_timeout(self):
+        self.client.retry = RetryPolicy(backoff=1, jitter=False)
+        self.faults = [503, 503]
+        start = time.time()
+        self.assertEqual(
+            self.client.info(self.server.url, timeout=0.5).status_code, 503)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(len(self.server.received), 1)
+
+    def test_no_retry(self):
+        self.client.retry = None
+        self.faults = [503]
+        self.assertEqual(self.client.info(self.server.url).status_code, 503)
+        self.assertEqual(len(self.server.received), 1)
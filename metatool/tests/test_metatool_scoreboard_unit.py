@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+from metatool.scoreboard import Scoreboard, report
+
+if sys.version_info.major == 3:
+    from unittest.mock import Mock
+else:
+    from mock import Mock
+
+
+class TestScoreboard(unittest.TestCase):
+    """
+    Test case of the ``metatool.scoreboard.Scoreboard`` class.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.path = os.path.join(self.temp_dir, 'nodes.json')
+
+    def test_moving_averages(self):
+        scoreboard = Scoreboard(False)
+        scoreboard.record('node', 1.0, True)
+        scoreboard.record('node', 2.0, True)
+        scoreboard.record('node', 5.0, False)
+        stats = scoreboard.stats['node']
+        self.assertEqual(stats['latency'], 1.3)
+        self.assertEqual(stats['error_rate'], 0.3)
+        self.assertEqual((stats['calls'], stats['errors']), (3, 1))
+
+    def test_rank(self):
+        scoreboard = Scoreboard(False)
+        scoreboard.record('slow', 2.0, True)
+        scoreboard.record('fast', 0.5, True)
+        for _ in range(3):
+            scoreboard.record('failing', 0.1, True)
+            scoreboard.record('failing', 0.1, False)
+        scoreboard.record('dead', 0.1, False)
+        self.assertEqual(
+            scoreboard.rank(['dead', 'new', 'failing', 'slow', 'fast',
+                             'other']),
+            ('fast', 'slow', 'new', 'other', 'failing', 'dead')
+        )
+        self.assertEqual(
+            [item['node'] for item in scoreboard.rankings(['new'])],
+            ['fast', 'slow', 'new', 'failing', 'dead']
+        )
+
+    def test_saved_between_runs(self):
+        scoreboard = Scoreboard(self.path)
+        scoreboard.record('node', 0.25, True)
+        scoreboard.save()
+        self.assertEqual(Scoreboard(self.path).stats, scoreboard.stats)
+        self.assertEqual(os.listdir(self.temp_dir), ['nodes.json'])
+        with open(self.path, 'w') as fp:
+            fp.write('broken')
+        self.assertEqual(Scoreboard(self.path).stats, {})
+
+    def test_timed_operation(self):
+        scoreboard = Scoreboard(False)
+        good = scoreboard.timed(Mock(return_value='RESULT'))
+        bad = scoreboard.timed(Mock(return_value=Mock(status_code=500)))
+        failed = scoreboard.timed(Mock(side_effect=IOError('failed')))
+        self.assertEqual(good(url_base='good', arg=1), 'RESULT')
+        bad(url_base='bad')
+        self.assertRaises(IOError, failed, url_base='failed')
+        self.assertEqual(scoreboard.stats['good']['errors'], 0)
+        self.assertEqual(scoreboard.stats['bad']['errors'], 1)
+        self.assertEqual(scoreboard.stats['failed']['errors'], 1)
+
+    def test_timed_operation_without_node_failure(self):
+        scoreboard = Scoreboard(False)
+        link = scoreboard.timed(Mock(return_value='http://node/api/files/'))
+        not_found = scoreboard.timed(Mock(return_value=Mock(status_code=404)))
+        self.assertEqual(link(url_base='node', link=True),
+                         'http://node/api/files/')
+        self.assertNotIn('node', scoreboard.stats)
+        not_found(url_base='node', link=False)
+        self.assertEqual(scoreboard.stats['node']['calls'], 1)
+        self.assertEqual(scoreboard.stats['node']['errors'], 0)
+
+    def test_report(self):
+        scoreboard = Scoreboard(False)
+        scoreboard.record('node', 0.25, True)
+        self.assertEqual(
+            json.loads(report(scoreboard, ['new'])),
+            [dict(node='node', latency=0.25, error_rate=0.0, calls=1,
+                  errors=0, healthy=True),
+             dict(node='new', latency=None, error_rate=None, calls=0,
+                  errors=0, healthy=True)]
+        )
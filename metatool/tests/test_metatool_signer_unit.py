@@ -0,0 +1,104 @@
+import gc
+import sys
+import unittest
+
+from btctxstore import BtcTxStore
+
+from metatool import core
+from metatool.signer import CachingSigner, SignerRegistry
+
+if sys.version_info.major == 3:
+    from unittest.mock import patch, Mock
+else:
+    from mock import patch, Mock
+
+
+class TestCachingSigner(unittest.TestCase):
+    """
+    Test case of the ``metatool.signer.CachingSigner`` class.
+    """
+
+    def setUp(self):
+        self.btctx_api = Mock()
+        self.btctx_api.get_address.side_effect = lambda key: 'ADDR_' + key
+        self.btctx_api.sign_unicode.side_effect = \
+            lambda key, message: 'SIG_{}_{}'.format(key, message)
+
+    def test_cached_results(self):
+        signer = CachingSigner(self.btctx_api)
+        for _ in range(3):
+            self.assertEqual(signer.get_address('KEY'), 'ADDR_KEY')
+            self.assertEqual(signer.sign_unicode('KEY', 'hash'),
+                             'SIG_KEY_hash')
+        self.assertEqual(signer.sign_unicode('KEY', 'other'),
+                         'SIG_KEY_other')
+        self.assertEqual(self.btctx_api.get_address.call_count, 1)
+        self.assertEqual(self.btctx_api.sign_unicode.call_count, 2)
+        self.assertEqual(signer.stats(),
+                         dict(hits=4, misses=3, hit_rate=0.5714, cached=3))
+
+    def test_least_recently_used_are_dropped(self):
+        signer = CachingSigner(self.btctx_api, maxsize=2)
+        signer.sign_unicode('KEY', 'a')
+        signer.sign_unicode('KEY', 'b')
+        signer.sign_unicode('KEY', 'a')
+        signer.sign_unicode('KEY', 'c')
+        self.assertEqual(signer.stats()['cached'], 2)
+        signer.sign_unicode('KEY', 'a')
+        self.assertEqual(self.btctx_api.sign_unicode.call_count, 3)
+        signer.sign_unicode('KEY', 'b')
+        self.assertEqual(self.btctx_api.sign_unicode.call_count, 4)
+        self.assertRaises(ValueError, CachingSigner, self.btctx_api, 0)
+
+    def test_same_signatures_as_the_api(self):
+        btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        key = btctx_api.create_key()
+        signer = CachingSigner(btctx_api)
+        for _ in range(2):
+            self.assertEqual(signer.get_address(key),
+                             btctx_api.get_address(key))
+            self.assertEqual(signer.sign_unicode(key, 'hash'),
+                             btctx_api.sign_unicode(key, 'hash'))
+        # other attributes are taken from the API
+        self.assertTrue(signer.create_key())
+        self.assertEqual(signer.stats()['hit_rate'], 0.5)
+
+
+class TestSignerRegistry(unittest.TestCase):
+    """
+    Test case of the ``metatool.signer.SignerRegistry`` class.
+    """
+
+    def test_one_signer_per_api(self):
+        registry = SignerRegistry(maxsize=10)
+        btctx_api = Mock()
+        signer = registry.get(btctx_api)
+        self.assertIs(registry.get(btctx_api), signer)
+        self.assertIsNot(registry.get(Mock()), signer)
+        self.assertEqual(signer.maxsize, 10)
+        own_signer = CachingSigner(btctx_api)
+        self.assertIs(registry.get(own_signer), own_signer)
+
+    def test_signer_is_dropped_with_the_api(self):
+        registry = SignerRegistry()
+        registry.get(Mock())
+        gc.collect()
+        self.assertEqual(len(registry._signers), 0)
+
+    def test_client_reuses_signatures(self):
+        """
+        Test that the repeated requests about the same file sign it once.
+        """
+        btctx_api = Mock()
+        btctx_api.get_address.return_value = 'ADDRESS'
+        btctx_api.sign_unicode.return_value = 'SIGNATURE'
+        with patch('requests.Session.post') as mock_post, \
+                core.MetaToolClient() as client:
+            for seed in ('seed1', 'seed2', 'seed3'):
+                client.audit('http://node/', 'KEY', btctx_api, 'HASH', seed)
+        self.assertEqual(btctx_api.get_address.call_count, 1)
+        self.assertEqual(btctx_api.sign_unicode.call_count, 1)
+        self.assertEqual(mock_post.call_args[1]['headers'],
+                         {'sender-address': 'ADDRESS',
+                          'signature': 'SIGNATURE'})
+        self.assertEqual(client.signers.get(btctx_api).stats()['hits'], 4)
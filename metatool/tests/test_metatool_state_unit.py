@@ -0,0 +1,36 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from metatool import state
+
+if sys.version_info.major == 3:
+    from unittest.mock import patch
+else:
+    from mock import patch
+
+
+class TestStateDir(unittest.TestCase):
+    """
+    Test case of the ``metatool.state`` module functions.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def test_state_dir_from_environment(self):
+        state_dir = os.path.join(self.temp_dir, 'a', 'b')
+        with patch.dict(os.environ, {state.STATE_DIR_ENV: state_dir}):
+            self.assertEqual(state.get_state_dir(), state_dir)
+            self.assertTrue(os.path.isdir(state_dir))
+            self.assertEqual(state.state_path('spam.db'),
+                             os.path.join(state_dir, 'spam.db'))
+
+    def test_default_state_dir(self):
+        with patch.dict(os.environ, {'HOME': self.temp_dir}):
+            os.environ.pop(state.STATE_DIR_ENV, None)
+            self.assertEqual(state.get_state_dir(),
+                             os.path.join(self.temp_dir, '.metatool'))
@@ -0,0 +1,183 @@
+import os
+import io
+import sys
+import shutil
+import tempfile
+import unittest
+from hashlib import sha256
+
+from btctxstore import BtcTxStore
+
+from metatool import core
+from metatool import encryption
+from metatool import upload_index
+from metatool.upload_index import UploadIndex, file_identity
+
+if sys.version_info.major == 3:
+    from unittest.mock import patch
+else:
+    from mock import patch
+
+# make the parent tests package importable for the direct running
+parent_dir = os.path.dirname(os.path.dirname(__file__))
+if not parent_dir in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from tests.testing_server import RecordingHTTPServer, use_temp_state_dir
+
+
+def setUpModule():
+    # keep the state of the tested clients out of the user's home
+    global restore_state_dir
+    restore_state_dir = use_temp_state_dir()
+
+
+def tearDownModule():
+    restore_state_dir()
+
+
+class TestUploadIndex(unittest.TestCase):
+    """
+    Test case of the ``metatool.upload_index.UploadIndex`` class.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.index_path = os.path.join(self.temp_dir, 'index.sqlite')
+        self.file_name = os.path.join(self.temp_dir, 'file.txt')
+        with open(self.file_name, 'wb') as file_:
+            file_.write(b'some file content')
+
+    def identity(self):
+        with open(self.file_name, 'rb') as file_:
+            return file_identity(file_)
+
+    def test_persistent_entries(self):
+        identity = self.identity()
+        with UploadIndex(self.index_path) as index:
+            self.assertIsNone(index.lookup(identity, False))
+            index.add(identity, False, 'PLAIN_HASH', '001', 'http://node/')
+            index.add(identity, True, 'ENCRYPTED_HASH', '101',
+                      'http://node/', b'\x01\x02')
+        with UploadIndex(self.index_path) as index:
+            self.assertEqual(
+                index.lookup(identity, False),
+                dict(data_hash='PLAIN_HASH', file_role='001',
+                     node='http://node/', decryption_key=None)
+            )
+            self.assertEqual(
+                index.lookup(identity, True),
+                dict(data_hash='ENCRYPTED_HASH', file_role='101',
+                     node='http://node/', decryption_key='0102')
+            )
+
+    def test_find_by_data_hash(self):
+        identity = self.identity()
+        with UploadIndex(self.index_path) as index:
+            self.assertIsNone(index.find('ENCRYPTED_HASH'))
+            index.add(identity, False, 'PLAIN_HASH')
+            index.add(identity, True, 'ENCRYPTED_HASH', '101',
+                      'http://node/', b'\x01\x02')
+            self.assertEqual(index.find('PLAIN_HASH'),
+                             dict(identity=identity, decryption_key=None))
+            self.assertEqual(index.find('ENCRYPTED_HASH'),
+                             dict(identity=identity, decryption_key='0102'))
+
+    def test_changed_file_is_not_found(self):
+        identity = self.identity()
+        with UploadIndex(self.index_path) as index:
+            index.add(identity, False, 'PLAIN_HASH')
+            with open(self.file_name, 'ab') as file_:
+                file_.write(b'!')
+            self.assertIsNone(index.lookup(self.identity(), False))
+            # the same size, but the other modification time
+            with open(self.file_name, 'wb') as file_:
+                file_.write(b'some file content')
+            stat = os.stat(self.file_name)
+            os.utime(self.file_name, (stat.st_atime, stat.st_mtime + 10))
+            self.assertIsNone(index.lookup(self.identity(), False))
+
+    def test_not_file_objects(self):
+        self.assertIsNone(file_identity(io.BytesIO(b'data')))
+        with UploadIndex(self.index_path) as index:
+            index.add(None, False, 'HASH')
+            self.assertIsNone(index.lookup(None, False))
+
+    def test_open_index(self):
+        self.assertIsNone(upload_index.open_index(None))
+        self.assertIsNone(upload_index.open_index(False))
+        with UploadIndex(self.index_path) as index:
+            self.assertIs(upload_index.open_index(index), index)
+        index = upload_index.open_index(self.index_path)
+        self.addCleanup(index.close)
+        self.assertEqual(index.path, self.index_path)
+        with patch.dict(os.environ, {'METATOOL_HOME': self.temp_dir}):
+            index = upload_index.open_index(True)
+            self.addCleanup(index.close)
+        self.assertEqual(index.path,
+                         os.path.join(self.temp_dir, 'uploads.sqlite'))
+
+
+class TestCoreUploadWithIndex(unittest.TestCase):
+    """
+    Test that the ``metatool.core.upload()`` skips the hashing of the
+    unchanged files, when the index is used.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.file_name = os.path.join(self.temp_dir, 'file.txt')
+        with open(self.file_name, 'wb') as file_:
+            file_.write(os.urandom(10000))
+        self.index = UploadIndex(os.path.join(self.temp_dir, 'index.sqlite'))
+        self.addCleanup(self.index.close)
+        self.server = RecordingHTTPServer(
+            lambda handler: (201, {'Content-Type': 'application/json'},
+                             b'{}')).start()
+        self.addCleanup(self.server.stop)
+        btctx_api = BtcTxStore(testnet=True, dryrun=True)
+        self.upload_param = dict(url_base=self.server.url,
+                                 btctx_api=btctx_api,
+                                 sender_key=btctx_api.create_key(),
+                                 file_role='001', index=self.index)
+
+    def upload(self, encrypt):
+        with patch('metatool.core.sha256_file',
+                   side_effect=core.sha256_file) as mock_sha256_file:
+            with patch('metatool.encryption.convergent_key',
+                       side_effect=encryption.convergent_key) as mock_key:
+                response = core.upload(file_=open(self.file_name, 'rb'),
+                                       encrypt=encrypt, **self.upload_param)
+        self.assertEqual(response.status_code, 201)
+        body = self.server.received[-1]['body']
+        sent_hash = body.split(b'name="data_hash"\r\n\r\n')[1][:64]
+        return (response, sent_hash,
+                mock_sha256_file.call_count + mock_key.call_count)
+
+    def test_skip_hashing_of_unchanged_file(self):
+        for encrypt in (False, True):
+            first_response, first_hash, hash_passes = self.upload(encrypt)
+            self.assertEqual(hash_passes, 2 if encrypt else 1)
+            second_response, second_hash, hash_passes = self.upload(encrypt)
+            self.assertEqual(hash_passes, 0)
+            self.assertEqual(second_hash, first_hash,
+                             'The same "data_hash" should be sent')
+            self.assertEqual(first_response.json(), second_response.json())
+
+    def test_rehash_changed_file(self):
+        self.upload(False)
+        with open(self.file_name, 'ab') as file_:
+            file_.write(b'new data')
+        response, sent_hash, hash_passes = self.upload(False)
+        self.assertEqual(hash_passes, 1)
+        with open(self.file_name, 'rb') as file_:
+            data_hash = sha256(file_.read()).hexdigest()
+        self.assertEqual(sent_hash, data_hash.encode())
+
+    def test_failed_upload_is_not_indexed(self):
+        self.server.responder = lambda handler: (503, {}, b'')
+        with open(self.file_name, 'rb') as file_:
+            core.upload(file_=file_, **self.upload_param)
+            self.assertIsNone(self.index.lookup(file_identity(file_), False))
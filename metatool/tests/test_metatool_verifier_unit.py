@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+from hashlib import sha256
+
+from file_encryptor import convergence
+
+from metatool import verifier
+from metatool.upload_index import UploadIndex, file_identity
+from metatool.verifier import LocalCopies, LocalCopyError
+
+
+class TestLocalCopies(unittest.TestCase):
+    """
+    Test case of the ``metatool.verifier.LocalCopies`` class.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='metatool_test_')
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.content = os.urandom(30000)
+        self.data_hash = sha256(self.content).hexdigest()
+        with open(os.path.join(self.temp_dir, self.data_hash), 'wb') as fp:
+            fp.write(self.content)
+        self.index = UploadIndex(os.path.join(self.temp_dir, 'index.sqlite'))
+        self.addCleanup(self.index.close)
+
+    def response(self, data, seed):
+        return sha256(data + seed.encode()).hexdigest()
+
+    def test_directory_copy(self):
+        copies = LocalCopies(self.temp_dir, block_size=4096)
+        for seed in ('seed', '19b25856e1c150ca834cffc8b59b23ad'):
+            self.assertEqual(copies.expected_response(self.data_hash, seed),
+                             self.response(self.content, seed))
+        self.assertRaises(LocalCopyError, copies.expected_response,
+                          'MISSING_HASH', 'seed')
+
+    def test_encrypted_original_from_index(self):
+        """
+        Test that the original file uploaded encrypted is encrypted back
+        to get the expected response, and the changed one isn't used.
+        """
+        plain_name = os.path.join(self.temp_dir, 'plain.txt')
+        encrypted_name = os.path.join(self.temp_dir, 'encrypted.txt')
+        for name in (plain_name, encrypted_name):
+            with open(name, 'wb') as fp:
+                fp.write(self.content)
+        key = convergence.encrypt_file_inline(encrypted_name, None)
+        with open(encrypted_name, 'rb') as fp:
+            encrypted = fp.read()
+        encrypted_hash = sha256(encrypted).hexdigest()
+        with open(plain_name, 'rb') as fp:
+            self.index.add(file_identity(fp), True, encrypted_hash,
+                           decryption_key=key)
+
+        copies = LocalCopies(index=self.index)
+        self.assertEqual(copies.expected_response(encrypted_hash, 'seed'),
+                         self.response(encrypted, 'seed'))
+        self.assertRaises(LocalCopyError, copies.expected_response,
+                          self.data_hash, 'seed')
+
+        with open(plain_name, 'ab') as fp:
+            fp.write(b'!')
+        with self.assertRaises(LocalCopyError) as context:
+            copies.expected_response(encrypted_hash, 'seed')
+        self.assertIn('has changed', str(context.exception))
+
+    def test_verify(self):
+        copies = LocalCopies(self.temp_dir)
+        good = dict(file_hash=self.data_hash, seed='seed',
+                    challenge_response=self.response(self.content, 'seed'))
+        self.assertEqual(copies.verify(dict(good)),
+                         dict(good, verified=True))
+
+        bad = dict(good, challenge_response='0' * 64)
+        self.assertEqual(copies.verify(dict(bad)), dict(
+            bad, verified=False, error='challenge response mismatch',
+            expected_response=good['challenge_response']))
+
+        missing = dict(good, file_hash='MISSING_HASH')
+        self.assertEqual(copies.verify(dict(missing)), dict(
+            missing, verified=False, error='no local copy of MISSING_HASH'))
+
+    def test_open_copies(self):
+        self.assertIsNone(verifier.open_copies(None))
+        copies = LocalCopies(self.temp_dir)
+        self.assertIs(verifier.open_copies(copies), copies)
+        self.assertEqual(verifier.open_copies(self.temp_dir).directory,
+                         self.temp_dir)
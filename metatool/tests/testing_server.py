@@ -1,18 +1,46 @@
+import os
 import json
 import sys
+import shutil
+import tempfile
+import threading
 from hashlib import sha256
 # 2.x/3.x compliance logic
 if sys.version_info.major == 3:
     import socketserver
+    from http.server import HTTPServer, BaseHTTPRequestHandler
     from urllib.parse import parse_qs
 else:
     import SocketServer as socketserver
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
     from urlparse import parse_qs
 
 
 API_FILES_RESPONSE_STATUS = [0]
 
 
+def use_temp_state_dir():
+    """
+    Point the ``METATOOL_HOME`` to the new temporary directory, so the
+    tested clients keep the nodes' lists of files and the other state out
+    of the user's home directory.
+
+    :returns: function, which restores the environment and removes the
+        directory
+    """
+    state_dir = tempfile.mkdtemp(prefix='metatool_test_')
+    old_value = os.environ.get('METATOOL_HOME')
+    os.environ['METATOOL_HOME'] = state_dir
+
+    def restore():
+        if old_value is None:
+            os.environ.pop('METATOOL_HOME', None)
+        else:
+            os.environ['METATOOL_HOME'] = old_value
+        shutil.rmtree(state_dir, ignore_errors=True)
+    return restore
+
+
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     pass
 
@@ -34,12 +62,37 @@ class MyRequestHandler(socketserver.BaseRequestHandler):
         Method to handle requests
         :return: None
         """
-        self.data = self.request.recv(1024).strip()
+        self.data = self._receive_request().strip()
         self.parse_request(self.data.decode("utf-8"))
         url = self.path.replace('/', '_')
         message = getattr(self, 'response_{}'.format(url))()
         self.request.sendall(message)
 
+    def _receive_request(self):
+        """
+        Receive the whole request - the headers and as much of the body
+        as declared by the "Content-Length" header.
+        :return: bytes, raw request data
+        """
+        data = b''
+        while b'\r\n\r\n' not in data:
+            chunk = self.request.recv(1024)
+            if not chunk:
+                return data
+            data += chunk
+        head, _, body = data.partition(b'\r\n\r\n')
+        content_length = 0
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                content_length = int(value.strip())
+        while len(body) < content_length:
+            chunk = self.request.recv(content_length - len(body))
+            if not chunk:
+                break
+            body += chunk
+        return head + b'\r\n\r\n' + body
+
     def parse_request(self, req):
         """
         Method to parse request and set to class request attributes
@@ -199,3 +252,70 @@ class MyRequestHandler(socketserver.BaseRequestHandler):
             return self._set_body(bin_data, is_json=False,
                                   file_name=self.query_data['file_alias'][0])
         return self._set_body(bin_data, is_json=False)
+
+
+class RecordingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in HTTP server, which records all received requests
+    in the ``received`` list and answers them with the ``responder``.
+
+    The ``responder`` is a callable, which takes the handler instance and
+    returns the ``(status_code, headers_dict, body_bytes)`` tuple.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, responder, host='localhost', port=0):
+        HTTPServer.__init__(self, (host, port), RecordingRequestHandler)
+        self.responder = responder
+        self.received = []
+
+    @property
+    def url(self):
+        return 'http://{}:{}/'.format(*self.server_address[:2])
+
+    def start(self):
+        """
+        Run the server in the daemon thread.
+        :return: the server itself
+        """
+        server_thread = threading.Thread(target=self.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class RecordingRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the ``RecordingHTTPServer``.
+    It saves the method, path, headers and raw body of every request.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def handle_any(self):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(content_length)
+        self.server.received.append(dict(
+            client_address=self.client_address,
+            method=self.command,
+            path=self.path,
+            headers=dict(self.headers.items()),
+            body=self.body,
+        ))
+        status_code, headers, body = self.server.responder(self)
+        self.send_response(status_code)
+        headers = dict(headers)
+        headers.setdefault('Content-Length', str(len(body)))
+        for name, value in sorted(headers.items()):
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = handle_any
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,30 @@
+"""
+This module contains the transport adapter of the ``MetaToolClient``
+session, which applies the default timeouts to every request. It imports
+the ``requests`` package, so it's imported by the first created client
+only.
+"""
+from requests.adapters import HTTPAdapter
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter, which sends the requests with the default timeout, when
+    the request doesn't define it's own.
+
+    :param timeout: the ``(connect, read)`` timeouts in seconds, or
+        ``None`` for no timeouts
+    :type timeout: tuple or number
+
+    :param kwargs: other arguments of the ``requests.adapters.HTTPAdapter``
+    """
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super(TimeoutHTTPAdapter, self).__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        return super(TimeoutHTTPAdapter, self).send(
+            request, timeout=timeout, **kwargs)
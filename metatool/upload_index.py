@@ -0,0 +1,205 @@
+"""
+This module contains the persistent local index of the uploaded files. For
+every uploaded file it keeps the ``data_hash`` and the ``decryption_key``
+together with the file's identity - the path, size, modification time and
+inode. While the file stays unchanged, the next upload of it takes them from
+the index and doesn't hash (and encrypt for the key) the whole file again.
+
+The index is a SQLite database, by default the ``uploads.sqlite`` file in
+the state directory (look at the ``metatool.state`` module).
+"""
+import binascii
+import os
+import os.path
+import sqlite3
+import threading
+import time
+
+from metatool.state import state_path
+
+#: Name of the default index file in the state directory.
+DEFAULT_INDEX_NAME = 'uploads.sqlite'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS uploads (
+    path TEXT NOT NULL,
+    encrypted INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    data_hash TEXT NOT NULL,
+    file_role TEXT,
+    node TEXT,
+    decryption_key TEXT,
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (path, encrypted)
+)
+'''
+
+
+def file_identity(file_):
+    """
+    Get the identity of the opened file - it's absolute path, size,
+    modification time (in nanoseconds) and inode. When any of them changes,
+    the file is treated as changed.
+
+    :param ``file_``: file object opened from the file system
+    :type ``file_``: file object
+
+    :returns: identity tuple or ``None`` for the file objects without the
+        name or the file descriptor
+    :rtype: tuple
+    """
+    name = getattr(file_, 'name', None)
+    if not name or not hasattr(file_, 'fileno'):
+        return None
+    try:
+        stat = os.fstat(file_.fileno())
+    except (EnvironmentError, ValueError):
+        return None
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 10 ** 9)
+    return os.path.abspath(name), stat.st_size, mtime_ns, stat.st_ino
+
+
+class UploadIndex(object):
+    """
+    Thread-safe index of the uploaded files.
+
+    :param path: path to the index database file
+
+        (optional, default: the ``DEFAULT_INDEX_NAME`` file in the state
+        directory)
+    :type path: string
+    """
+
+    def __init__(self, path=None):
+        self.path = path or state_path(DEFAULT_INDEX_NAME)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the index database.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def lookup(self, identity, encrypted):
+        """
+        Find the entry of the unchanged file.
+
+        :param identity: identity of the file, returned by the
+            ``file_identity()``
+        :type identity: tuple
+
+        :param encrypted: whether the file was uploaded encrypted
+        :type encrypted: boolean
+
+        :returns: dictionary with the ``data_hash``, ``file_role``,
+            ``node`` and the hexadecimal ``decryption_key`` of the file,
+            or ``None`` when the file isn't indexed or was changed
+        :rtype: dictionary
+        """
+        if identity is None:
+            return None
+        path, size, mtime_ns, inode = identity
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT data_hash, file_role, node, decryption_key '
+                'FROM uploads WHERE path = ? AND encrypted = ? AND size = ? '
+                'AND mtime_ns = ? AND inode = ?',
+                (path, int(bool(encrypted)), size, mtime_ns, inode)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('data_hash', 'file_role', 'node',
+                         'decryption_key'), row))
+
+    def find(self, data_hash):
+        """
+        Find the latest uploaded file with the given hash of the data.
+
+        :param data_hash: hash of the uploaded data
+        :type data_hash: string
+
+        :returns: dictionary with the ``identity`` of the file when it was
+            uploaded (look at the ``file_identity()``) and the hexadecimal
+            ``decryption_key`` of the encrypted file, or ``None`` when no
+            such file is indexed
+        :rtype: dictionary
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT path, size, mtime_ns, inode, decryption_key '
+                'FROM uploads WHERE data_hash = ? '
+                'ORDER BY uploaded_at DESC LIMIT 1',
+                (data_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(identity=tuple(row[:4]), decryption_key=row[4])
+
+    def add(self, identity, encrypted, data_hash, file_role=None, node=None,
+            decryption_key=None):
+        """
+        Save the entry of the uploaded file, replacing the previous one.
+
+        :param identity: identity of the file, returned by the
+            ``file_identity()``
+        :type identity: tuple
+
+        :param encrypted: whether the file was uploaded encrypted
+        :type encrypted: boolean
+
+        :param data_hash: hash of the uploaded data
+        :type data_hash: string
+
+        :param file_role: role of the uploaded file
+        :type file_role: string
+
+        :param node: URL-string of the node the file was uploaded to
+        :type node: string
+
+        :param decryption_key: bytes key of the encrypted file
+        :type decryption_key: bytes
+        """
+        if identity is None:
+            return
+        if decryption_key is not None:
+            decryption_key = binascii.hexlify(decryption_key).decode()
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO uploads VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    identity[:1] + (int(bool(encrypted)),) + identity[1:] +
+                    (data_hash, file_role, node, decryption_key, time.time())
+                )
+
+
+def open_index(index):
+    """
+    Get the ``UploadIndex`` instance for the ``index`` argument of the API
+    functions.
+
+    :param index: the index itself, the path to the index file, or ``True``
+        for the default index file
+    :type index: UploadIndex object or string or boolean or None
+
+    :returns: the index or ``None``
+    :rtype: UploadIndex object
+    """
+    if not index or isinstance(index, UploadIndex):
+        return index or None
+    return UploadIndex(None if index is True else index)
@@ -0,0 +1,190 @@
+"""
+This module contains the local verifier of the audit results. The node
+answers the audit challenge with the SHA-256 hash of the file's data
+followed by the seed (look at the ``metatool.hashing.challenge_response()``),
+so the answer can be checked against the local copy of the file, instead of
+being trusted.
+
+The local copy is either the stored data itself, named after it's hash in
+the directory (the way the ``download-batch`` action saves the files), or
+the original file found in the local index of the uploaded files (look at
+the ``metatool.upload_index`` module). The original file, which was uploaded
+encrypted, is encrypted back on the fly while hashing it.
+"""
+import binascii
+import os.path
+
+from metatool.encryption import EncryptingReader
+from metatool.hashing import challenge_response
+from metatool.upload_index import UploadIndex, file_identity, open_index
+
+#: Size (in bytes) of the blocks read from the local copies. The copies are
+#: memory-mapped, so the large blocks just make the fewer hash updates.
+VERIFY_BLOCK_SIZE = 1024 * 1024
+
+
+class LocalCopyError(IOError):
+    """
+    There is no unchanged local copy of the audited file.
+    """
+
+
+def check_response(record, expected):
+    """
+    Check the ``challenge_response`` of the audit result record against
+    the expected one. The record gets the ``verified`` item, and the
+    mismatched one gets the ``expected_response`` and the ``error`` items.
+
+    :param record: audit result record
+    :type record: dictionary
+
+    :param expected: expected ``challenge_response``
+    :type expected: string
+
+    :returns: the same record
+    :rtype: dictionary
+    """
+    response = record.get('challenge_response')
+    record['verified'] = expected == str(response).lower()
+    if not record['verified']:
+        record.update(expected_response=expected,
+                      error='challenge response mismatch')
+    return record
+
+
+class LocalCopies(object):
+    """
+    Thread-safe source of the local copies of the audited files, which
+    calculates the expected responses to the audit challenges.
+
+    :param directory: path to the directory with the copies of the stored
+        data, named after their hashes
+
+        (optional, default: None - the directory isn't used)
+    :type directory: string
+
+    :param index: local index of the uploaded files, look at the
+        ``metatool.upload_index.open_index()``
+
+        (optional, default: None - the index isn't used)
+    :type index: metatool.upload_index.UploadIndex object or string
+        or boolean
+
+    :param block_size: size of the blocks read from the copies in bytes
+
+        (optional, default: ``VERIFY_BLOCK_SIZE``)
+    :type block_size: integer
+    """
+
+    def __init__(self, directory=None, index=None,
+                 block_size=VERIFY_BLOCK_SIZE):
+        self.directory = directory
+        self._own_index = bool(index) and not isinstance(index,
+                                                         UploadIndex)
+        self.index = open_index(index)
+        self.block_size = block_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the index, when it was opened by this instance.
+        """
+        if self._own_index:
+            self.index.close()
+
+    def _open(self, file_hash):
+        """
+        Open the local copy of the stored data.
+
+        :returns: file object, which reads the stored data, and whether it
+            can be memory-mapped
+        :rtype: tuple
+        :raises LocalCopyError: if there is no unchanged copy of the data
+        """
+        if self.directory:
+            path = os.path.join(self.directory, file_hash)
+            if os.path.isfile(path):
+                return open(path, 'rb'), True
+        entry = self.index.find(file_hash) if self.index else None
+        if entry is None:
+            raise LocalCopyError('no local copy of {}'.format(file_hash))
+        try:
+            file_ = open(entry['identity'][0], 'rb')
+        except EnvironmentError as exc:
+            raise LocalCopyError('local copy of {} is unavailable: {}'.format(
+                file_hash, exc))
+        if file_identity(file_) != entry['identity']:
+            file_.close()
+            raise LocalCopyError(
+                'local copy of {} has changed since the upload'.format(
+                    file_hash))
+        if entry['decryption_key']:
+            key = binascii.unhexlify(entry['decryption_key'])
+            return EncryptingReader(file_, key), False
+        return file_, True
+
+    def expected_response(self, file_hash, seed):
+        """
+        Calculate the response to the audit challenge from the local copy.
+
+        :param file_hash: hash of the audited data
+        :type file_hash: string
+
+        :param seed: seed of the challenge
+        :type seed: string
+
+        :returns: expected ``challenge_response``
+        :rtype: string
+        :raises LocalCopyError: if there is no unchanged copy of the data
+        """
+        file_, use_mmap = self._open(file_hash)
+        try:
+            return challenge_response(file_, seed, self.block_size,
+                                      use_mmap)
+        finally:
+            file_.close()
+
+    def verify(self, record):
+        """
+        Check the ``challenge_response`` of the audit result record, with
+        the ``file_hash`` and the ``seed`` items, against the local copy,
+        look at the ``check_response()``.
+
+        :param record: audit result record
+        :type record: dictionary
+
+        :returns: the same record
+        :rtype: dictionary
+        """
+        try:
+            expected = self.expected_response(record['file_hash'],
+                                              record['seed'])
+        except EnvironmentError as exc:
+            record.update(verified=False, error=str(exc))
+            return record
+        return check_response(record, expected)
+
+
+def open_copies(verify):
+    """
+    Get the ``LocalCopies`` instance for the ``verify`` argument of the API
+    functions.
+
+    :param verify: the local copies themselves, the path to the directory
+        with the copies, or ``True`` for the default index of the uploaded
+        files
+    :type verify: LocalCopies object or string or boolean or None
+
+    :returns: the local copies or ``None``
+    :rtype: LocalCopies object
+    """
+    if not verify or isinstance(verify, LocalCopies):
+        return verify or None
+    if verify is True:
+        return LocalCopies(index=True)
+    return LocalCopies(directory=verify)
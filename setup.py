@@ -4,13 +4,16 @@ from setuptools import setup
 
 required_packages = ['requests', 'btctxstore', 'file_encryptor']
 if sys.version_info.major == 2:
-    required_packages.insert(0, 'mock')
+    required_packages[:0] = ['mock', 'futures']
 
 setup(
     name='metatool',
     version='1.0',
     packages=['metatool'],
     install_requires=required_packages,
+    extras_require={
+        'aio': ['aiohttp'],
+    },
     test_suite='metatool.tests',
     entry_points={
         'console_scripts':